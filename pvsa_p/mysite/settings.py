@@ -78,6 +78,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # BEGIN IMMEDIATE: cada transacción toma el lock de escritura al empezar
+        # y espera su turno (timeout). Con el BEGIN diferido, una transacción que
+        # lee antes de escribir (save() con señales) falla al instante con
+        # "database is locked" si otro escribe en ese momento (carga masiva).
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
     }
 }
 
@@ -122,4 +127,46 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 LOGIN_URL = "signin"
 LOGIN_REDIRECT_URL = "home"
-LOGOUT_REDIRECT_URL = "signin"
\ No newline at end of file
+LOGOUT_REDIRECT_URL = "signin"
+
+# Carga masiva: importaciones en segundo plano (hilos del mismo proceso).
+# Con SQLite conviene 1 (un solo escritor a la vez).
+CARGA_MASIVA_WORKERS = 1
+# Filas por tramo (commit + checkpoint) y pausa en segundos entre tramos
+# para que otros escritores tomen el lock de SQLite.
+CARGA_MASIVA_CHUNK = 10000
+CARGA_MASIVA_PAUSA = 0.05
+# Cada proceso marca cada CARGA_MASIVA_LATIDO segundos los trabajos que tiene en
+# su cola; uno pendiente / en curso sin marca hace más de CARGA_MASIVA_HUERFANO
+# segundos quedó huérfano (el proceso se reinició o murió): se da por fallido y
+# al volver a confirmar se reanuda desde su checkpoint.
+CARGA_MASIVA_LATIDO = 15
+CARGA_MASIVA_HUERFANO = 120
+# Filas repetidas en el archivo (mismo lugar + tipo de objeto): "ultima" = gana
+# la última, "sumar" = se suman las cantidades. Se consolidan antes de escribir.
+CARGA_MASIVA_CONSOLIDAR = "ultima"
+# Procesos para parsear en paralelo las hojas / workbooks de un .zip (1 = secuencial)
+CARGA_MASIVA_PARSE_WORKERS = 4
+# Tamaño mínimo (bytes) para que valga la pena levantar el pool de procesos
+CARGA_MASIVA_PARSE_PARALELO_DESDE = 2 * 1024 * 1024
+# Cache en disco de archivos ya parseados (por SHA-256, LRU). 0 = deshabilitado.
+# CARGA_MASIVA_CACHE_DIR = BASE_DIR / "cache_cargas"  (por defecto, en el tmp del sistema)
+CARGA_MASIVA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Cache en disco de las hojas del Excel de sectores (una por ubicación, por
+# versión de sus datos; ver cache_exportes.py). 0 = deshabilitado.
+# EXPORTE_CACHE_DIR = BASE_DIR / "cache_exportes"  (por defecto, en el tmp del sistema)
+EXPORTE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# Exportación masiva (.zip con un Excel por ubicación / sector): procesos en paralelo
+EXPORTE_ZIP_WORKERS = 4
+
+# Cache de Django (en memoria del proceso; no necesita servicio externo).
+# Hoy guarda el JSON de las stats del mapa por versión del inventario.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "pvsa",
+    }
+}
+# Segundos que vive cada versión de las stats del mapa (las viejas no se vuelven a pedir)
+MAPA_STATS_CACHE_TIMEOUT = 60 * 60
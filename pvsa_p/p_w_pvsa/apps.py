@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PWPvsaConfig(AppConfig):
     name = 'p_w_pvsa'
+
+    def ready(self):
+        # versiones de datos por ubicación (cache de exportación)
+        from . import signals  # noqa: F401
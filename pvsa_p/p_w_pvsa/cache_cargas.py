@@ -0,0 +1,138 @@
+"""
+Cache en disco de archivos de carga masiva ya parseados.
+
+La clave es el SHA-256 del archivo (+ extensión y versión del parser): subir
+el mismo archivo otra vez (previsualizar, reintentar tras un timeout, etc.)
+devuelve las filas guardadas sin volver a leer el Excel.
+Cada entrada es un .jsonl.gz (primera línea = formato, luego una fila por
+línea). El total se limita a CARGA_MASIVA_CACHE_MAX_BYTES desalojando las
+entradas menos usadas (LRU por mtime, que se actualiza en cada acierto).
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+logger = logging.getLogger(__name__)
+
+# subir si cambia lo que devuelven los parsers (invalida todo lo cacheado)
+VERSION_PARSER = 1
+
+
+def _directorio():
+    return Path(
+        getattr(settings, "CARGA_MASIVA_CACHE_DIR", None)
+        or Path(tempfile.gettempdir()) / "pvsa_cache_cargas"
+    )
+
+
+def _max_bytes():
+    return getattr(settings, "CARGA_MASIVA_CACHE_MAX_BYTES", 0) or 0
+
+
+def habilitado():
+    return _max_bytes() > 0
+
+
+def clave(file_obj):
+    """SHA-256 del archivo (leído por bloques) + extensión + versión del parser."""
+    h = hashlib.sha256()
+    file_obj.seek(0)
+    for bloque in iter(lambda: file_obj.read(1024 * 1024), b""):
+        h.update(bloque)
+    file_obj.seek(0)
+
+    ext = os.path.splitext(getattr(file_obj, "name", "") or "")[1].lower().lstrip(".") or "bin"
+    return f"{h.hexdigest()}-{ext}-v{VERSION_PARSER}"
+
+
+def _ruta(k):
+    return _directorio() / f"{k}.jsonl.gz"
+
+
+def leer(k):
+    """(formato, generador_de_filas) si está en cache; None si no."""
+    ruta = _ruta(k)
+    try:
+        fh = gzip.open(ruta, "rt", encoding="utf-8")
+        formato = json.loads(fh.readline())["formato"]
+        os.utime(ruta)  # LRU: marcar como usada
+    except (OSError, ValueError, KeyError):
+        return None
+
+    def _filas():
+        with fh:
+            for linea in fh:
+                yield _restaurar(json.loads(linea))
+
+    return formato, _filas()
+
+
+def _restaurar(r):
+    """La fecha vuelve a ser date/datetime (en JSON quedó como texto ISO)."""
+    v = r.get("fecha")
+    if isinstance(v, str):
+        try:
+            r["fecha"] = (parse_datetime(v) if "T" in v else parse_date(v)) or v
+        except ValueError:
+            pass  # texto que solo parecía fecha: queda tal cual
+    return r
+
+
+def escribir(k, formato, filas):
+    """
+    Envuelve el generador de filas: las va guardando mientras pasan y, si se
+    consumió completo, deja la entrada en cache. Si se corta a la mitad o
+    falla, no queda nada.
+    """
+    directorio = _directorio()
+    directorio.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directorio, suffix=".tmp")
+    os.close(fd)
+    completo = False
+    try:
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=1) as out:
+            out.write(json.dumps({"formato": formato}) + "\n")
+            for r in filas:
+                out.write(json.dumps(r, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n")
+                yield r
+        completo = True
+    finally:
+        if completo:
+            os.replace(tmp, _ruta(k))
+            _desalojar()
+        else:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def _desalojar():
+    """Borra las entradas menos usadas hasta quedar bajo CARGA_MASIVA_CACHE_MAX_BYTES."""
+    entradas = []
+    for ruta in _directorio().glob("*.jsonl.gz"):
+        try:
+            st = ruta.stat()
+        except OSError:
+            continue
+        entradas.append((st.st_mtime, st.st_size, ruta))
+
+    total = sum(size for _, size, _ in entradas)
+    limite = _max_bytes()
+    for _, size, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        try:
+            ruta.unlink()
+            total -= size
+        except OSError:
+            logger.warning("No se pudo desalojar %s del cache de cargas", ruta)
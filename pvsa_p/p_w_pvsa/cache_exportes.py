@@ -0,0 +1,175 @@
+"""
+Cache en disco de las hojas del Excel de sectores, una por Ubicacion.
+
+Cada hoja se guarda ya convertida a XML (la parte xl/worksheets/sheetN.xml
+del .xlsx) con la clave (ubicación, versión de sus datos, VERSION_EXPORTE).
+La versión está en VersionUbicacion y sube con cualquier cambio en sus
+pisos, lugares u objetos (signals.py y import_from_rows llaman a
+tocar_ubicaciones), así que una entrada nunca queda desactualizada: con otra
+versión simplemente no se encuentra. El Excel del puerto entero se arma
+generando solo las hojas que faltan y copiando el resto (ver excel_utils).
+version_inventario() resume todas las versiones en una sola firma (la usa
+el cache de las stats del mapa).
+
+El total se limita a EXPORTE_CACHE_MAX_BYTES desalojando las entradas menos
+usadas (LRU por mtime, igual que cache_cargas).
+"""
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from .models import VersionUbicacion
+
+
+logger = logging.getLogger(__name__)
+
+# subir si cambia el contenido / formato de las hojas (invalida todo lo cacheado)
+VERSION_EXPORTE = 1
+
+
+# ---------- versión de los datos de cada ubicación ----------
+
+def tocar_ubicaciones(ids):
+    """Sube la versión de las ubicaciones `ids` (sus hojas cacheadas dejan de valer)."""
+    ids = {i for i in ids if i}
+    if not ids:
+        return
+    ahora = timezone.now()
+    existentes = set(
+        VersionUbicacion.objects.filter(ubicacion_id__in=ids).values_list("ubicacion_id", flat=True)
+    )
+    VersionUbicacion.objects.filter(ubicacion_id__in=existentes).update(
+        version=F("version") + 1, modificado=ahora
+    )
+    if len(existentes) < len(ids):
+        VersionUbicacion.objects.bulk_create(
+            [VersionUbicacion(ubicacion_id=i, version=1, modificado=ahora) for i in ids - existentes],
+            ignore_conflicts=True,
+        )
+
+
+def versiones(ids):
+    """{ubicacion_id: (version, modificado)}; las que nunca cambiaron quedan en (0, None)."""
+    out = {i: (0, None) for i in ids}
+    for v in VersionUbicacion.objects.filter(ubicacion_id__in=ids):
+        out[v.ubicacion_id] = (v.version, v.modificado)
+    return out
+
+
+def version_inventario():
+    """
+    (firma, modificado) de los datos de todo el inventario, en una consulta
+    agregada sobre VersionUbicacion. Cambia con cualquier tocar_ubicaciones
+    (cada cambio sube una versión y su fecha) y al borrarse una ubicación
+    (baja la cuenta). La firma sirve como clave de cache y como ETag.
+    """
+    r = VersionUbicacion.objects.aggregate(n=Count("pk"), suma=Sum("version"), modificado=Max("modificado"))
+    firma = f"{r['n']}|{r['suma'] or 0}|{r['modificado'].isoformat() if r['modificado'] else ''}"
+    return hashlib.sha256(firma.encode()).hexdigest()[:32], r["modificado"]
+
+
+def etag(vers, extra=""):
+    """ETag del Excel: versiones de todas las hojas candidatas + filtros (`extra`)."""
+    h = hashlib.sha256(f"v{VERSION_EXPORTE}|{extra}".encode())
+    for pk in sorted(vers):
+        h.update(f"|{pk}:{vers[pk][0]}".encode())
+    return h.hexdigest()[:32]
+
+
+def ultima_modificacion(vers):
+    fechas = [m for _, m in vers.values() if m]
+    return max(fechas) if fechas else None
+
+
+# ---------- hojas en disco ----------
+
+def _directorio():
+    return Path(
+        getattr(settings, "EXPORTE_CACHE_DIR", None)
+        or Path(tempfile.gettempdir()) / "pvsa_cache_exportes"
+    )
+
+
+def _max_bytes():
+    return getattr(settings, "EXPORTE_CACHE_MAX_BYTES", 0) or 0
+
+
+def habilitado():
+    return _max_bytes() > 0
+
+
+def _ruta(ubicacion_id, version):
+    return _directorio() / f"ubicacion-{ubicacion_id}-d{version}-v{VERSION_EXPORTE}.xml.gz"
+
+
+def abrir(ubicacion_id, version):
+    """
+    La hoja cacheada abierta (XML descomprimido al leer) o None.
+    Se devuelve abierta para que un desalojo en paralelo no la borre entre
+    que se revisa y se copia.
+    """
+    ruta = _ruta(ubicacion_id, version)
+    try:
+        fh = gzip.open(ruta, "rb")
+        os.utime(ruta)  # LRU: marcar como usada
+    except OSError:
+        return None
+    return fh
+
+
+def guardar(ubicacion_id, version, origen):
+    """Guarda el XML de la hoja (ruta de archivo) y borra versiones anteriores de la misma ubicación."""
+    directorio = _directorio()
+    directorio.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directorio, suffix=".tmp")
+    os.close(fd)
+    try:
+        with open(origen, "rb") as src, gzip.open(tmp, "wb", compresslevel=1) as out:
+            shutil.copyfileobj(src, out, 1024 * 1024)
+        os.replace(tmp, _ruta(ubicacion_id, version))
+    except OSError:
+        logger.warning("No se pudo guardar la hoja de la ubicación %s en el cache de exportación", ubicacion_id)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+
+    actual = _ruta(ubicacion_id, version)
+    for ruta in directorio.glob(f"ubicacion-{ubicacion_id}-d*.xml.gz"):
+        if ruta != actual:
+            try:
+                ruta.unlink()
+            except OSError:
+                pass
+    _desalojar()
+
+
+def _desalojar():
+    """Borra las entradas menos usadas hasta quedar bajo EXPORTE_CACHE_MAX_BYTES."""
+    entradas = []
+    for ruta in _directorio().glob("*.xml.gz"):
+        try:
+            st = ruta.stat()
+        except OSError:
+            continue
+        entradas.append((st.st_mtime, st.st_size, ruta))
+
+    total = sum(size for _, size, _ in entradas)
+    limite = _max_bytes()
+    for _, size, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        try:
+            ruta.unlink()
+            total -= size
+        except OSError:
+            logger.warning("No se pudo desalojar %s del cache de exportación", ruta)
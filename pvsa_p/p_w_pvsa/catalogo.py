@@ -0,0 +1,264 @@
+"""
+Copia en memoria del catálogo con que se arman los combos de filtros
+(resumen_general, listas de lugares, objetos del lugar, históricos y tipos
+de objeto, editores del mapa).
+
+Hay una por proceso, en tuplas chicas que se comparten entre filas (cada
+piso apunta a la misma tupla de su ubicación, cada ubicación a la de su
+sector). Tienen los mismos nombres de atributos y el mismo __str__ que los
+modelos, así que los templates las recorren igual que a los querysets.
+
+La clave es VersionCatalogo.version: actual() la lee (una consulta) y, si
+cambió, rehace la copia entera. signals.py la sube con cualquier alta,
+cambio o baja de estos modelos e import_from_rows cuando crea catálogo con
+bulk_create (que no dispara señales).
+"""
+import threading
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import (
+    CategoriaObjeto,
+    Lugar,
+    Objeto,
+    Piso,
+    Sector,
+    TipoLugar,
+    TipoObjeto,
+    Ubicacion,
+    VersionCatalogo,
+)
+
+
+# modelos cuyo cambio invalida la copia (ver signals.py)
+MODELOS_CATALOGO = (Sector, Ubicacion, Piso, TipoLugar, Lugar, CategoriaObjeto, Objeto, TipoObjeto)
+
+
+class FilaSector(NamedTuple):
+    id: int
+    sector: str
+
+    def __str__(self):
+        return self.sector
+
+
+class FilaUbicacion(NamedTuple):
+    id: int
+    ubicacion: str
+    sector: FilaSector
+
+    @property
+    def sector_id(self):
+        return self.sector.id
+
+    def __str__(self):
+        return f"{self.ubicacion} | Sector: {self.sector.sector}"
+
+
+class FilaPiso(NamedTuple):
+    id: int
+    piso: int
+    ubicacion: FilaUbicacion
+
+    @property
+    def ubicacion_id(self):
+        return self.ubicacion.id
+
+    def __str__(self):
+        return f"Piso {self.piso} | {self.ubicacion.ubicacion}"
+
+
+class FilaTipoLugar(NamedTuple):
+    id: int
+    tipo_de_lugar: str
+
+    def __str__(self):
+        return self.tipo_de_lugar
+
+
+class FilaLugar(NamedTuple):
+    id: int
+    nombre_del_lugar: str
+    piso: FilaPiso
+
+    @property
+    def piso_id(self):
+        return self.piso.id
+
+    def __str__(self):
+        return f"{self.nombre_del_lugar} | Piso {self.piso.piso} | {self.piso.ubicacion.ubicacion}"
+
+
+class FilaCategoria(NamedTuple):
+    id: int
+    nombre_de_categoria: str
+
+    def __str__(self):
+        return self.nombre_de_categoria
+
+
+class FilaObjeto(NamedTuple):
+    id: int
+    nombre_del_objeto: str
+    objeto_categoria: FilaCategoria
+
+    @property
+    def objeto_categoria_id(self):
+        return self.objeto_categoria.id
+
+    def __str__(self):
+        return f"{self.nombre_del_objeto} ({self.objeto_categoria.nombre_de_categoria})"
+
+
+class FilaTipoObjeto(NamedTuple):
+    id: int
+    marca: str
+    material: str
+    objeto: FilaObjeto
+
+    @property
+    def objeto_id(self):
+        return self.objeto.id
+
+    def __str__(self):
+        return f"{self.objeto.nombre_del_objeto} - {(self.marca or '').strip()} {(self.material or '').strip()}".strip()
+
+
+class Catalogo(NamedTuple):
+    version: int
+    sectores: tuple               # por nombre
+    ubicaciones: tuple            # por sector y nombre
+    ubicaciones_por_nombre: tuple
+    pisos: tuple                  # por ubicación y número
+    tipos_lugar: tuple
+    lugares: tuple                # por ubicación, piso y nombre
+    lugares_movil: tuple          # piso 0 de las ubicaciones "MODULOS", por sector y nombre
+    categorias: tuple
+    objetos: tuple                # por categoría y nombre
+    objetos_por_nombre: tuple
+    tipos_objeto: tuple           # por objeto, marca y material
+    marcas: tuple                 # distintas, como el combo de resumen_general
+    materiales: tuple
+
+
+_copia = None
+_lock = threading.Lock()
+
+
+# ---------- versión ----------
+
+def _subir_version():
+    ahora = timezone.now()
+    if not VersionCatalogo.objects.filter(pk=1).update(version=F("version") + 1, modificado=ahora):
+        VersionCatalogo.objects.get_or_create(pk=1, defaults={"version": 1, "modificado": ahora})
+
+
+def tocar():
+    """
+    Sube la versión del catálogo. Al confirmar la transacción en curso: si se
+    revierte, la versión no se mueve y nadie arma una copia con datos que no
+    llegaron a quedar.
+    """
+    transaction.on_commit(_subir_version)
+
+
+def version():
+    return VersionCatalogo.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+
+# ---------- copia en memoria ----------
+
+def _ordenados(por_id, qs):
+    """Las tuplas de `por_id` en el orden de `qs` (el ORDER BY lo hace la BD, con su collation)."""
+    return tuple(por_id[pk] for pk in qs.values_list("pk", flat=True) if pk in por_id)
+
+
+def _construir(v):
+    # una fila cuyo padre no está (se creó / borró entre dos consultas) se
+    # salta: ese cambio ya subió la versión y la próxima copia la trae
+    sectores = {
+        pk: FilaSector(pk, nombre)
+        for pk, nombre in Sector.objects.order_by("sector").values_list("pk", "sector")
+    }
+    ubicaciones = {
+        pk: FilaUbicacion(pk, nombre, sectores[sector_id])
+        for pk, nombre, sector_id in Ubicacion.objects.order_by("sector__sector", "ubicacion")
+        .values_list("pk", "ubicacion", "sector_id")
+        if sector_id in sectores
+    }
+    pisos = {
+        pk: FilaPiso(pk, numero, ubicaciones[ubicacion_id])
+        for pk, numero, ubicacion_id in Piso.objects.order_by("ubicacion__ubicacion", "piso")
+        .values_list("pk", "piso", "ubicacion_id")
+        if ubicacion_id in ubicaciones
+    }
+    lugares = {
+        pk: FilaLugar(pk, nombre, pisos[piso_id])
+        for pk, nombre, piso_id in Lugar.objects.order_by("piso__ubicacion__ubicacion", "piso__piso", "nombre_del_lugar")
+        .values_list("pk", "nombre_del_lugar", "piso_id")
+        if piso_id in pisos
+    }
+    categorias = {
+        pk: FilaCategoria(pk, nombre)
+        for pk, nombre in CategoriaObjeto.objects.order_by("nombre_de_categoria").values_list("pk", "nombre_de_categoria")
+    }
+    objetos = {
+        pk: FilaObjeto(pk, nombre, categorias[categoria_id])
+        for pk, nombre, categoria_id in Objeto.objects.order_by("objeto_categoria__nombre_de_categoria", "nombre_del_objeto")
+        .values_list("pk", "nombre_del_objeto", "objeto_categoria_id")
+        if categoria_id in categorias
+    }
+    tipos_objeto = tuple(
+        FilaTipoObjeto(pk, marca, material, objetos[objeto_id])
+        for pk, marca, material, objeto_id in TipoObjeto.objects.order_by("objeto__nombre_del_objeto", "marca", "material")
+        .values_list("pk", "marca", "material", "objeto_id")
+        if objeto_id in objetos
+    )
+
+    return Catalogo(
+        version=v,
+        sectores=tuple(sectores.values()),
+        ubicaciones=tuple(ubicaciones.values()),
+        ubicaciones_por_nombre=_ordenados(ubicaciones, Ubicacion.objects.order_by("ubicacion")),
+        pisos=tuple(pisos.values()),
+        tipos_lugar=tuple(
+            FilaTipoLugar(pk, nombre)
+            for pk, nombre in TipoLugar.objects.order_by("tipo_de_lugar").values_list("pk", "tipo_de_lugar")
+        ),
+        lugares=tuple(lugares.values()),
+        lugares_movil=_ordenados(
+            lugares,
+            Lugar.objects.filter(piso__piso=0, piso__ubicacion__ubicacion__icontains="MODULOS")
+            .order_by("piso__ubicacion__sector__sector", "nombre_del_lugar"),
+        ),
+        categorias=tuple(categorias.values()),
+        objetos=tuple(objetos.values()),
+        objetos_por_nombre=_ordenados(objetos, Objeto.objects.order_by("nombre_del_objeto")),
+        tipos_objeto=tipos_objeto,
+        marcas=tuple(
+            TipoObjeto.objects.exclude(Q(marca__isnull=True) | Q(material__exact=""))
+            .values_list("marca", flat=True).distinct().order_by("marca")
+        ),
+        materiales=tuple(
+            TipoObjeto.objects.exclude(Q(material__isnull=True) | Q(material__exact=""))
+            .values_list("material", flat=True).distinct().order_by("material")
+        ),
+    )
+
+
+def actual():
+    """La copia del catálogo de la versión vigente (la rehace si cambió)."""
+    global _copia
+    # la versión se lee antes que los datos: si algo cambia en medio, la copia
+    # queda con datos más nuevos que su versión y la próxima request la rehace
+    v = version()
+    copia = _copia
+    if copia is None or copia.version != v:
+        with _lock:
+            copia = _copia
+            if copia is None or copia.version != v:
+                copia = _copia = _construir(v)
+    return copia
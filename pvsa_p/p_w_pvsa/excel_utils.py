@@ -1,14 +1,38 @@
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from io import BytesIO
-from copy import copy
+from itertools import groupby
+from operator import attrgetter
 
+import django
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl.worksheet.cell_range import CellRange
 from openpyxl.workbook.workbook import Workbook as WorkbookType
 from openpyxl.worksheet.datavalidation import DataValidation
 
-from .models import ObjetoLugar
+from . import cache_exportes
+from .filtros import FILTROS_UBICACION, filtrar_objetos_lugar, hay_filtros
+from .models import Lugar, ObjetoLugar, Piso, Ubicacion
 
 
+logger = logging.getLogger(__name__)
+
 THIN = Side(style="thin", color="000000")
 BORDER = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
 
@@ -19,6 +43,9 @@ FONT_TITLE = Font(bold=True, size=14)
 FONT_PISO = Font(bold=True, size=12)
 FONT_HDR = Font(bold=True, size=10)
 FONT_CELL = Font(size=10)
+FONT_TIPO_LUGAR = Font(bold=True, size=11)
+FONT_LUGAR = Font(bold=True, size=12)
+FONT_SIN_OBJETOS = Font(italic=True, size=10)
 
 CENTER = Alignment(horizontal="center", vertical="center", wrap_text=True)
 LEFT = Alignment(horizontal="left", vertical="top", wrap_text=True)
@@ -42,6 +69,12 @@ VISIBLE = {
 }
 MAX_COL = 13 # hasta M
 
+# Excel editable (ida y vuelta): id de ObjetoLugar y su huella en separadores ocultos
+OCULTA = {
+    "ID": 2, # B
+    "CTRL": 4, # D
+}
+
 
 def _safe_sheet_name(name: str) -> str:
     bad = [":", "\\", "/", "?", "*", "[", "]"]
@@ -81,16 +114,38 @@ def _set_col_widths(ws):
         ws.column_dimensions[col].hidden = True
 
 
-def _style_row(ws, row, c1, c2, fill=None, font=None, align=None):
-    for c in range(c1, c2 + 1):
-        cell = ws.cell(row=row, column=c)
-        cell.border = BORDER
-        if fill:
-            cell.fill = copy(fill)
+def _celda(ws, estilos, valor=None, font=None, fill=None, align=None, number_format=None):
+    """
+    Celda write-only con borde + estilo. Cada combinación de estilo se registra
+    una sola vez en el workbook (cache `estilos`) y las celdas comparten ese
+    StyleArray: nada de copy() de Font/Fill/Alignment por celda.
+    """
+    key = (id(font), id(fill), id(align), number_format)
+    estilo = estilos.get(key)
+    if estilo is None:
+        proto = WriteOnlyCell(ws)
+        proto.border = BORDER
         if font:
-            cell.font = copy(font)
+            proto.font = font
+        if fill:
+            proto.fill = fill
         if align:
-            cell.alignment = copy(align)
+            proto.alignment = align
+        if number_format:
+            proto.number_format = number_format
+        estilo = estilos[key] = proto._style
+
+    cell = WriteOnlyCell(ws, valor)
+    cell._style = estilo
+    return cell
+
+
+def _franja(ws, estilos, row, texto, font=None, fill=None, align=None):
+    """Fila combinada A..M (título, piso, lugar...): el texto va en A, el resto solo estilo."""
+    ws.merged_cells.add(CellRange(min_col=1, min_row=row, max_col=MAX_COL, max_row=row))
+    return [_celda(ws, estilos, texto, font, fill, align)] + [
+        _celda(ws, estilos, None, font, fill, align) for _ in range(MAX_COL - 1)
+    ]
 
 
 def _setup_outlines(ws):
@@ -131,192 +186,498 @@ def _tipo_lugar_lugar_txt(lugar) -> str:
         return "Sin especificar"
 
 
-def _set_row_level(ws, row, level: int):
-    rd = ws.row_dimensions[row]
-    # no bajar niveles si ya tiene (para anidación)
-    rd.outline_level = max(int(rd.outline_level or 0), int(level))
-    rd.hidden = False
+def _fila(ws, row, celdas=(), level=None):
+    """
+    Escribe la fila `row` (la siguiente del stream) con su nivel de outline.
+    En write-only el nivel va en row_dimensions ANTES de escribir la fila;
+    después se descarta para no acumular una dimensión por fila.
+    """
+    if level is not None:
+        rd = ws.row_dimensions[row]
+        rd.outline_level = level
+        rd.hidden = False
+    ws.append(list(celdas))
+    if level is not None:
+        del ws.row_dimensions[row]
+    return row + 1
 
 
-def _write_lugar_block(ws, start_row, lugar, objetos_qs):
-    # =========================
-    # NUEVO: fila "Tipo de lugar: X" (antes del lugar)
-    # =========================
-    tipo_row = start_row
-    tipo_txt = _tipo_lugar_lugar_txt(lugar)
-
-    ws.merge_cells(start_row=tipo_row, start_column=1, end_row=tipo_row, end_column=MAX_COL)
-    t0 = ws.cell(tipo_row, 1, f"Tipo de lugar: {tipo_txt}")
-    t0.font = Font(bold=True, size=11)
-    t0.alignment = LEFT
-    _style_row(ws, tipo_row, 1, MAX_COL, fill=FILL_TITLE, font=Font(bold=True, size=11), align=LEFT)
+def huella_objeto_lugar(cantidad, estado, detalle) -> str:
+    """
+    Huella de lo editable de un ObjetoLugar (cantidad, estado, detalle). Va en
+    el Excel editable y al reimportar se compara con la de la BD: si no
+    calza, alguien cambió la fila después de exportar (conflicto).
+    """
+    texto = f"{cantidad}|{estado}|{detalle or ''}"
+    return f"{zlib.crc32(texto.encode()):08x}"
 
-    # esta fila queda dentro del bloque del piso (nivel 1)
-    _set_row_level(ws, tipo_row, 1)
 
+def _write_lugar_block(ws, estilos, start_row, lugar, objetos, editable=False):
     # =========================
-    # LUGAR (fila resumen, colapsa lo de abajo)
+    # fila "Tipo de lugar: X" (antes del lugar), dentro del bloque del piso (nivel 1)
     # =========================
-    lugar_row = start_row + 1
+    row = _fila(
+        ws, start_row,
+        _franja(ws, estilos, start_row, f"Tipo de lugar: {_tipo_lugar_lugar_txt(lugar)}",
+                FONT_TIPO_LUGAR, FILL_TITLE, LEFT),
+        level=1,
+    )
 
-    ws.merge_cells(start_row=lugar_row, start_column=1, end_row=lugar_row, end_column=MAX_COL)
-    t = ws.cell(lugar_row, 1, lugar.nombre_del_lugar)
-    t.font = Font(bold=True, size=12)
-    t.alignment = CENTER
-    _style_row(ws, lugar_row, 1, MAX_COL, fill=FILL_TITLE, font=Font(bold=True, size=12), align=CENTER)
+    # =========================
+    # LUGAR (fila resumen nivel 1, colapsa lo de abajo)
+    # =========================
+    row = _fila(
+        ws, row,
+        _franja(ws, estilos, row, lugar.nombre_del_lugar, FONT_LUGAR, FILL_TITLE, CENTER),
+        level=1,
+    )
 
-    # nivel 1 para el título de LUGAR (resumen de su grupo)
-    _set_row_level(ws, lugar_row, 1)
+    # headers (detalle del lugar) -> nivel 2; estilo en toda la franja (incluye separadores ocultos)
+    headers = {
+        VISIBLE["CAT"]: "Categoría",
+        VISIBLE["OBJ"]: "Objeto",
+        VISIBLE["TIP"]: "Tipo",
+        VISIBLE["CAN"]: "Cantidad",
+        VISIBLE["EST"]: "Estado",
+        VISIBLE["DET"]: "Detalle",
+        VISIBLE["FEC"]: "Fecha",
+    }
+    if editable:
+        headers[OCULTA["ID"]] = "ID"
+        headers[OCULTA["CTRL"]] = "Control"
+    row = _fila(
+        ws, row,
+        [_celda(ws, estilos, headers.get(c), FONT_HDR, FILL_TITLE, CENTER) for c in range(1, MAX_COL + 1)],
+        level=2,
+    )
 
-    # headers (detalle del lugar) -> nivel 2
-    hr = lugar_row + 1
-    headers = [
-        ("Categoría", VISIBLE["CAT"]),
-        ("Objeto", VISIBLE["OBJ"]),
-        ("Tipo", VISIBLE["TIP"]),
-        ("Cantidad", VISIBLE["CAN"]),
-        ("Estado", VISIBLE["EST"]),
-        ("Detalle", VISIBLE["DET"]),
-        ("Fecha", VISIBLE["FEC"]),
-    ]
-    for label, col in headers:
-        cell = ws.cell(hr, col, label)
-        cell.font = FONT_HDR
-        cell.alignment = CENTER
-        cell.fill = FILL_TITLE
-        cell.border = BORDER
-
-    # bordes/estilo en toda la franja (incluye separadores ocultos)
-    _style_row(ws, hr, 1, MAX_COL, fill=FILL_TITLE, font=FONT_HDR, align=CENTER)
-    _set_row_level(ws, hr, 2)
-
-    r = hr + 1
+    # separadores ocultos: solo borde
+    vacia = _celda(ws, estilos)
     count = 0
 
-    for ol in objetos_qs:
+    for ol in objetos:
         count += 1
 
-        categoria = _cat_txt(ol)
-        objeto_nombre = ol.tipo_de_objeto.objeto.nombre_del_objeto
-        tipo_txt2 = _tipo_txt(ol)
-
-        ws.cell(r, VISIBLE["CAT"], categoria).font = FONT_CELL
-        ws.cell(r, VISIBLE["OBJ"], objeto_nombre).font = FONT_CELL
-        ws.cell(r, VISIBLE["TIP"], tipo_txt2).font = FONT_CELL
-        ws.cell(r, VISIBLE["CAN"], ol.cantidad).font = FONT_CELL
-
         estado = ol.get_estado_display()
-        estado_cell = ws.cell(r, VISIBLE["EST"], estado)
-        estado_cell.font = FONT_CELL
-
-        if estado == "Bueno":
-            estado_cell.fill = FILL_ESTADO_BUENO
-        elif estado == "Pendiente":
-            estado_cell.fill = FILL_ESTADO_PENDIENTE
-        elif estado == "Malo":
-            estado_cell.fill = FILL_ESTADO_MALO
-
-        ws.cell(r, VISIBLE["DET"], ol.detalle or "-").font = FONT_CELL
-
-        cfecha = ws.cell(r, VISIBLE["FEC"], ol.fecha)
-        cfecha.number_format = "dd/mm/yyyy"
-        cfecha.font = FONT_CELL
-
-        # bordes en toda la franja (incluye separadores ocultos)
-        for c in range(1, MAX_COL + 1):
-            ws.cell(r, c).border = BORDER
-
-        # alineación (solo visibles)
-        ws.cell(r, VISIBLE["CAT"]).alignment = LEFT
-        ws.cell(r, VISIBLE["OBJ"]).alignment = LEFT
-        ws.cell(r, VISIBLE["TIP"]).alignment = LEFT
-        ws.cell(r, VISIBLE["CAN"]).alignment = CENTER
-        ws.cell(r, VISIBLE["EST"]).alignment = CENTER
-        ws.cell(r, VISIBLE["DET"]).alignment = LEFT
-        ws.cell(r, VISIBLE["FEC"]).alignment = CENTER
-
-        _set_row_level(ws, r, 2)
-        r += 1
+        fill_estado = {
+            "Bueno": FILL_ESTADO_BUENO,
+            "Pendiente": FILL_ESTADO_PENDIENTE,
+            "Malo": FILL_ESTADO_MALO,
+        }.get(estado)
+
+        celdas = [vacia] * MAX_COL
+        celdas[VISIBLE["CAT"] - 1] = _celda(ws, estilos, _cat_txt(ol), FONT_CELL, align=LEFT)
+        celdas[VISIBLE["OBJ"] - 1] = _celda(ws, estilos, ol.tipo_de_objeto.objeto.nombre_del_objeto, FONT_CELL, align=LEFT)
+        celdas[VISIBLE["TIP"] - 1] = _celda(ws, estilos, _tipo_txt(ol), FONT_CELL, align=LEFT)
+        celdas[VISIBLE["CAN"] - 1] = _celda(ws, estilos, ol.cantidad, FONT_CELL, align=CENTER)
+        celdas[VISIBLE["EST"] - 1] = _celda(ws, estilos, estado, FONT_CELL, fill_estado, CENTER)
+        celdas[VISIBLE["DET"] - 1] = _celda(ws, estilos, ol.detalle or "-", FONT_CELL, align=LEFT)
+        celdas[VISIBLE["FEC"] - 1] = _celda(ws, estilos, ol.fecha, FONT_CELL, align=CENTER, number_format="dd/mm/yyyy")
+        if editable:
+            celdas[OCULTA["ID"] - 1] = _celda(ws, estilos, ol.pk, FONT_CELL, align=CENTER)
+            celdas[OCULTA["CTRL"] - 1] = _celda(
+                ws, estilos, huella_objeto_lugar(ol.cantidad, ol.estado, ol.detalle), FONT_CELL, align=CENTER
+            )
+
+        row = _fila(ws, row, celdas, level=2)
 
     if count == 0:
-        ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=MAX_COL)
-        cell = ws.cell(r, 1, "Sin objetos registrados")
-        cell.font = Font(italic=True, size=10)
-        cell.alignment = CENTER
-        _style_row(ws, r, 1, MAX_COL, align=CENTER)
-        _set_row_level(ws, r, 2)
-        r += 1
+        franja = _franja(ws, estilos, row, "Sin objetos registrados", align=CENTER)
+        franja[0] = _celda(ws, estilos, "Sin objetos registrados", FONT_SIN_OBJETOS, align=CENTER)
+        row = _fila(ws, row, franja, level=2)
 
     # fila separadora (parte del piso, no del lugar) -> nivel 1
-    _set_row_level(ws, r, 1)
-    return r + 1
+    return _fila(ws, row, level=1)
 
-def build_excel_sectores(ubicaciones_qs):
-    wb = Workbook()
-    wb.remove(wb.active)
 
-    for ub in ubicaciones_qs:
+def _jerarquia(ubicaciones, objetos_qs, podar=False):
+    """
+    Pisos, lugares y objetos de las ubicaciones a exportar en 3 consultas, sin
+    importar cuántos lugares haya (objetos_qs = ObjetoLugar ya filtrado;
+    con podar=True solo quedan los pisos/lugares que tienen alguno):
+    - pisos_por_ubicacion {ubicacion_id: [Piso]} (por número de piso)
+    - lugares_por_piso {piso_id: [Lugar]} (por id)
+    - objetos: un solo stream de ObjetoLugar en el MISMO orden en que se
+      recorren las hojas (ubicación -> piso -> lugar -> id), para ir
+      consumiéndolo lugar por lugar sin tenerlo entero en memoria.
+    """
+    ids = [ub.pk for ub in ubicaciones]
+
+    pisos = Piso.objects.filter(ubicacion_id__in=ids)
+    lugares = Lugar.objects.filter(piso__ubicacion_id__in=ids)
+    if podar:
+        pisos = pisos.filter(pk__in=objetos_qs.values("lugar__piso_id"))
+        lugares = lugares.filter(pk__in=objetos_qs.values("lugar_id"))
+
+    pisos_por_ubicacion = defaultdict(list)
+    for p in pisos.order_by("piso", "id"):
+        pisos_por_ubicacion[p.ubicacion_id].append(p)
+
+    lugares_por_piso = defaultdict(list)
+    for lugar in lugares.select_related("lugar_tipo_lugar").order_by("id"):
+        lugares_por_piso[lugar.piso_id].append(lugar)
+
+    # posición de cada ubicación en el orden de las hojas (el que trae el queryset)
+    orden_hoja = Case(
+        *[When(lugar__piso__ubicacion_id=pk, then=Value(i)) for i, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    objetos = (
+        objetos_qs
+        .filter(lugar__piso__ubicacion_id__in=ids)
+        .select_related("tipo_de_objeto__objeto__objeto_categoria")
+        .order_by(orden_hoja, "lugar__piso__piso", "lugar__piso_id", "lugar_id", "id")
+        .iterator(chunk_size=2000)
+    )
+    return pisos_por_ubicacion, lugares_por_piso, objetos
+
+
+# Todas las combinaciones de estilo de las hojas del puerto, en orden fijo.
+# Se registran al abrir cada libro, así el índice de cada estilo es el mismo
+# en cualquier libro y el XML de una hoja sirve tal cual en otro (cache de
+# hojas, ver _build_con_cache). Si se agrega una combinación, va aquí.
+ESTILOS_HOJA = (
+    (FONT_TITLE, FILL_TITLE, CENTER, None),
+    (FONT_PISO, FILL_PISO, LEFT, None),
+    (FONT_TIPO_LUGAR, FILL_TITLE, LEFT, None),
+    (FONT_LUGAR, FILL_TITLE, CENTER, None),
+    (FONT_HDR, FILL_TITLE, CENTER, None),
+    (None, None, None, None),
+    (FONT_CELL, None, LEFT, None),
+    (FONT_CELL, None, CENTER, None),
+    (FONT_CELL, FILL_ESTADO_BUENO, CENTER, None),
+    (FONT_CELL, FILL_ESTADO_PENDIENTE, CENTER, None),
+    (FONT_CELL, FILL_ESTADO_MALO, CENTER, None),
+    (FONT_CELL, None, CENTER, "dd/mm/yyyy"),
+    (None, None, CENTER, None),
+    (FONT_SIN_OBJETOS, None, CENTER, None),
+)
+
+
+class _SinCache(Exception):
+    """openpyxl no se comportó como espera el cache de hojas (internos cambiados)."""
+
+
+def _nueva_hoja(wb, estilos, titulo, para_cache=False):
+    """
+    La primera hoja del libro registra ESTILOS_HOJA en orden (internos de
+    openpyxl). Si eso falla, sin cache no importa (los índices quedan en el
+    orden de los datos); para el cache (para_cache=True) levanta _SinCache.
+    """
+    ws = wb.create_sheet(title=titulo)
+    if not estilos:
+        try:
+            for font, fill, align, number_format in ESTILOS_HOJA:
+                # el índice (cellXfs) se asigna al escribir la primera celda con ese
+                # estilo; se fija aquí para que no dependa de los datos
+                wb._cell_styles.add(_celda(ws, estilos, None, font, fill, align, number_format)._style)
+        except Exception as e:
+            if para_cache:
+                raise _SinCache(e) from e
+    return ws
+
+
+def _escribir_hojas(wb, estilos, ubicaciones, objetos_qs, podar=False, al_cerrar=None, editable=False):
+    """
+    Una hoja por ubicación, en orden. al_cerrar(ubicacion, ws): cuando la hoja
+    ya está completa (el cache la guarda ahí).
+    """
+    pisos_por_ubicacion, lugares_por_piso, objetos = _jerarquia(ubicaciones, objetos_qs, podar)
+    # (lugar_id, objetos de ese lugar) en orden; se avanza a medida que se escriben los lugares
+    grupos = groupby(objetos, key=attrgetter("lugar_id"))
+    grupo = next(grupos, None)
+
+    for ub in ubicaciones:
         sheet_name = _unique_sheet_name(wb, f"{ub.sector.sector} - {ub.ubicacion}")
-        ws = wb.create_sheet(title=sheet_name)
-        
+        ws = _nueva_hoja(wb, estilos, sheet_name, para_cache=al_cerrar is not None)
 
+        # anchos / grupos de columnas: en write-only van antes de la primera fila
         _set_col_widths(ws)
         _setup_outlines(ws)
 
         # Título general
-        ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=MAX_COL)
-        ws["A1"] = f"Sector: {ub.sector.sector} | Ubicación: {ub.ubicacion}"
-        ws["A1"].font = FONT_TITLE
-        ws["A1"].alignment = CENTER
-        _style_row(ws, 1, 1, MAX_COL, fill=FILL_TITLE, font=FONT_TITLE, align=CENTER)
+        row = _fila(ws, 1, _franja(
+            ws, estilos, 1, f"Sector: {ub.sector.sector} | Ubicación: {ub.ubicacion}",
+            FONT_TITLE, FILL_TITLE, CENTER,
+        ))
+        row = _fila(ws, row)
 
-        row = 3
+        for p in pisos_por_ubicacion[ub.pk]:
+            # PISO (fila resumen, nivel 0); sus detalles son nivel 1/2
+            row = _fila(ws, row, _franja(ws, estilos, row, f"PISO {p.piso}", FONT_PISO, FILL_PISO, LEFT), level=0)
 
-        pisos = ub.piso_set.all().order_by("piso")
-        for p in pisos:
-            piso_row = row
+            # fila en blanco dentro del piso (detalle nivel 1)
+            row = _fila(ws, row, level=1)
 
-            # PISO (fila resumen)
-            ws.merge_cells(start_row=piso_row, start_column=1, end_row=piso_row, end_column=MAX_COL)
-            cell = ws.cell(piso_row, 1, f"PISO {p.piso}")
-            cell.font = FONT_PISO
-            cell.alignment = LEFT
-            _style_row(ws, piso_row, 1, MAX_COL, fill=FILL_PISO, font=FONT_PISO, align=LEFT)
+            for lugar in lugares_por_piso[p.pk]:
+                if grupo is not None and grupo[0] == lugar.pk:
+                    row = _write_lugar_block(ws, estilos, row, lugar, grupo[1], editable)
+                    grupo = next(grupos, None)
+                else:
+                    row = _write_lugar_block(ws, estilos, row, lugar, (), editable)
 
-            # piso es resumen (nivel 0), sus detalles serán nivel 1/2
-            ws.row_dimensions[piso_row].outline_level = 0
-            ws.row_dimensions[piso_row].hidden = False
+            # fila en blanco entre pisos (fuera de los grupos)
+            row = _fila(ws, row)
 
-            # fila en blanco dentro del piso (detalle nivel 1)
-            row = piso_row + 1
-            _set_row_level(ws, row, 1)
+        if al_cerrar:
+            al_cerrar(ub, ws)
+
+
+def _build_con_cache(ubicaciones, objetos_qs, destino):
+    """
+    El mismo libro que build_excel_sectores (sin poda), pero cada hoja sale
+    del cache de exportación si su ubicación no cambió desde que se generó;
+    solo las que faltan se vuelven a escribir (en un libro aparte, de una
+    pasada) y se guardan. Después se arma el .xlsx: un libro vacío con las
+    mismas hojas y estilos, reemplazando el XML de cada hoja por el cacheado.
+    Devuelve False si alguna hoja no se pudo cachear o si los internos de
+    openpyxl que usa no están como se espera (el caller genera el libro normal).
+    """
+    vers = cache_exportes.versiones([ub.pk for ub in ubicaciones])
+    hojas = {ub.pk: cache_exportes.abrir(ub.pk, vers[ub.pk][0]) for ub in ubicaciones}
+    try:
+        faltan = [ub for ub in ubicaciones if hojas[ub.pk] is None]
+        if faltan:
+            wb = Workbook(write_only=True)
+            estilos = {}
+
+            def _guardar(ub, ws):
+                # en write-only la hoja ya quedó escrita en un temporal: se copia al cache
+                try:
+                    ws.close()
+                    temporal = ws._writer.out
+                except Exception as e:
+                    raise _SinCache(e) from e
+                if len(estilos) == len(ESTILOS_HOJA):
+                    cache_exportes.guardar(ub.pk, vers[ub.pk][0], temporal)
+                    hojas[ub.pk] = cache_exportes.abrir(ub.pk, vers[ub.pk][0])
+                try:
+                    ws._writer.cleanup()
+                except Exception as e:
+                    raise _SinCache(e) from e
+
+            _escribir_hojas(wb, estilos, faltan, objetos_qs, al_cerrar=_guardar)
+            if len(estilos) != len(ESTILOS_HOJA):
+                logger.warning("Estilo fuera de ESTILOS_HOJA: el Excel de sectores se genera sin cache")
+            if any(fh is None for fh in hojas.values()):
+                return False
+
+        # esqueleto: mismas hojas (mismos nombres y orden) y los mismos estilos
+        wb = Workbook(write_only=True)
+        estilos = {}
+        for ub in ubicaciones:
+            _nueva_hoja(wb, estilos, _unique_sheet_name(wb, f"{ub.sector.sector} - {ub.ubicacion}"), para_cache=True)
+        esqueleto = BytesIO()
+        wb.save(esqueleto)
+
+        with zipfile.ZipFile(esqueleto) as src, zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                m = re.fullmatch(r"xl/worksheets/sheet(\d+)\.xml", info.filename)
+                if m is None:
+                    dst.writestr(info, src.read(info))
+                    continue
+                with dst.open(info.filename, "w", force_zip64=True) as out:
+                    shutil.copyfileobj(hojas[ubicaciones[int(m.group(1)) - 1].pk], out, 1024 * 1024)
+        return True
+    except _SinCache:
+        logger.warning("openpyxl no calza con el cache de hojas: el Excel de sectores se genera sin cache", exc_info=True)
+        return False
+    finally:
+        for fh in hojas.values():
+            if fh is not None:
+                fh.close()
+
+
+def _a_exportar(ubicaciones_qs, filtros):
+    """(ubicaciones, objetos, podar) que salen en el Excel con estos filtros."""
+    filtros = filtros or {}
+    objetos_qs = filtrar_objetos_lugar(ObjetoLugar.objects.all(), filtros)
+    podar = hay_filtros(filtros, excepto=FILTROS_UBICACION)
+
+    if filtros.get("sector"):
+        ubicaciones_qs = ubicaciones_qs.filter(sector_id=filtros["sector"])
+    if filtros.get("ubicacion"):
+        ubicaciones_qs = ubicaciones_qs.filter(pk=filtros["ubicacion"])
+    if podar:
+        ubicaciones_qs = ubicaciones_qs.filter(pk__in=objetos_qs.values("lugar__piso__ubicacion_id"))
+    return ubicaciones_qs, objetos_qs, podar
+
+
+def build_excel_sectores(ubicaciones_qs, destino=None, filtros=None, editable=False):
+    """
+    Excel del puerto: una hoja por Ubicacion (PISO -> Tipo de lugar / LUGAR -> objetos),
+    con filas y columnas agrupadas para colapsar.
+
+    filtros: los de resumen_general (ver filtros.py), aplicados en las
+    consultas. Sector/ubicación solo eligen hojas (salen completas, con pisos
+    y lugares vacíos); cualquier otro deja únicamente las hojas, pisos,
+    lugares y objetos que calzan.
+
+    Se genera en modo write-only: las filas se escriben en orden a medida que
+    salen de la BD (no queda el libro entero en memoria) y los estilos se
+    comparten entre celdas. Sin filtros que poden, las hojas salen del cache
+    de exportación (cache_exportes.py) y solo se generan las de ubicaciones
+    que cambiaron.
+    editable=True: cada objeto lleva en columnas ocultas (B, D) el id de su
+    ObjetoLugar y la huella de cantidad/estado/detalle, para que la carga
+    masiva lo reimporte por id (ver _claves_por_id en views). No usa el cache.
+    destino: ruta o archivo abierto donde guardar el .xlsx; sin destino
+    devuelve los bytes.
+    """
+    ubicaciones_qs, objetos_qs, podar = _a_exportar(ubicaciones_qs, filtros)
+    ubicaciones = list(ubicaciones_qs)
+    salida = BytesIO() if destino is None else destino
+
+    if ubicaciones and not podar and not editable and cache_exportes.habilitado():
+        if _build_con_cache(ubicaciones, objetos_qs, salida):
+            return salida.getvalue() if destino is None else destino
+        if hasattr(salida, "seek"):
+            salida.seek(0)
+            salida.truncate()
+
+    wb = Workbook(write_only=True)
+    estilos = {}
+    _escribir_hojas(wb, estilos, ubicaciones, objetos_qs, podar, editable=editable)
+
+    if not ubicaciones:
+        # filtros sin resultados: un libro sin hojas no abre en Excel
+        ws = _nueva_hoja(wb, estilos, "Sin resultados")
+        _set_col_widths(ws)
+        _fila(ws, 1, _franja(ws, estilos, 1, "Sin resultados para los filtros elegidos", FONT_TITLE, FILL_TITLE, CENTER))
 
-            row = piso_row + 2
+    wb.save(salida)
+    return salida.getvalue() if destino is None else destino
 
-            lugares = p.lugar_set.all().order_by("id")
-            piso_detail_start = piso_row + 1 # todo lo de abajo del piso
 
-            for lugar in lugares:
-                objetos = (
-                    ObjetoLugar.objects
-                    .filter(lugar=lugar)
-                    .select_related("tipo_de_objeto__objeto__objeto_categoria")
-                    .order_by("id")
-                )
-                row = _write_lugar_block(ws, row, lugar, objetos)
+# ====== exportación masiva: un .xlsx por ubicación (o sector) en un .zip ======
+POR_ZIP = ("ubicacion", "sector")
 
-            piso_detail_end = row - 1
-            if piso_detail_end >= piso_detail_start:
-                # asegurar nivel 1 mínimo para TODO el bloque del piso
-                for rr in range(piso_detail_start, piso_detail_end + 1):
-                    _set_row_level(ws, rr, 1)
 
-            row += 1
+def _exportar_unidad(ids, ruta, filtros):
+    """Worker del pool: el .xlsx de las ubicaciones `ids` en `ruta`; devuelve los segundos que tardó."""
+    t = time.perf_counter()
+    ubicaciones = (
+        Ubicacion.objects.select_related("sector")
+        .filter(pk__in=ids)
+        .order_by("sector__sector", "ubicacion")
+    )
+    build_excel_sectores(ubicaciones, ruta, filtros)
+    return time.perf_counter() - t
+
+
+def _nombre_archivo(base, usados):
+    nombre = " ".join(re.sub(r'[\\/:*?"<>|]', " ", base).split())[:120] or "sin nombre"
+    candidato, i = nombre, 2
+    while candidato.lower() in usados:
+        candidato = f"{nombre} ({i})"
+        i += 1
+    usados.add(candidato.lower())
+    return f"{candidato}.xlsx"
+
+
+class _SalidaZip:
+    """Destino no-seekable para zipfile: junta lo escrito hasta que el stream lo pide."""
+
+    def __init__(self):
+        self.partes = []
+        self.pos = 0
+
+    def write(self, b):
+        self.partes.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        out = b"".join(self.partes)
+        self.partes.clear()
+        return out
+
+
+def iter_zip_sectores(ubicaciones_qs, por="ubicacion", filtros=None, workers=None, informe=None):
+    """
+    Exportación masiva (auditorías): un .xlsx por Ubicacion (por="sector":
+    uno por Sector, con todas sus ubicaciones) dentro de un .zip.
+
+    Cada libro es un build_excel_sectores independiente (mismos filtros; usa
+    el cache de hojas), así que con workers > 1 (default EXPORTE_ZIP_WORKERS)
+    se generan en un pool de procesos, uno por núcleo. Es un generador de los
+    bytes del .zip: cada libro se agrega (y se manda) apenas está listo y
+    sale de disco, en el orden de ubicaciones_qs.
+    El tiempo de cada archivo va en tiempos.csv dentro del zip y, si se pasa,
+    a informe(nombre, segundos, bytes).
+    """
+    if por not in POR_ZIP:
+        raise ValueError(f"Agrupación desconocida: {por!r} (usa {' / '.join(POR_ZIP)}).")
+    if workers is None:
+        workers = getattr(settings, "EXPORTE_ZIP_WORKERS", 1)
+
+    ubicaciones_qs, _, _ = _a_exportar(ubicaciones_qs.select_related("sector"), filtros)
+    unidades = {}  # clave -> (nombre base, [ubicacion_id])
+    for ub in ubicaciones_qs:
+        if por == "sector":
+            clave, base = ub.sector_id, ub.sector.sector
+        else:
+            clave, base = ub.pk, f"{ub.sector.sector} - {ub.ubicacion}"
+        unidades.setdefault(clave, (base, []))[1].append(ub.pk)
+
+    usados = set()
+    unidades = [(_nombre_archivo(base, usados), ids) for base, ids in unidades.values()]
+
+    tmpdir = tempfile.TemporaryDirectory(prefix="exporte-zip-")
+    salida = _SalidaZip()
+    tiempos = [("archivo", "ubicaciones", "segundos", "bytes")]
+    pool = None
+    try:
+        rutas = [os.path.join(tmpdir.name, f"{i:05d}.xlsx") for i in range(len(unidades))]
+        if workers > 1 and len(unidades) > 1:
+            # spawn + django.setup: los workers no heredan hilos ni conexiones del servidor
+            pool = ProcessPoolExecutor(
+                max_workers=min(workers, len(unidades)),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+            resultados = [
+                pool.submit(_exportar_unidad, ids, ruta, filtros).result
+                for (_, ids), ruta in zip(unidades, rutas)
+            ]
+        else:
+            resultados = [
+                partial(_exportar_unidad, ids, ruta, filtros)
+                for (_, ids), ruta in zip(unidades, rutas)
+            ]
+
+        with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            for (nombre, ids), ruta, resultado in zip(unidades, rutas, resultados):
+                segundos = resultado()
+                tamano = os.path.getsize(ruta)
+                tiempos.append((nombre, len(ids), f"{segundos:.2f}", tamano))
+                logger.info("Exportado %s (%d ubicaciones) en %.2f s, %d bytes", nombre, len(ids), segundos, tamano)
+                if informe:
+                    informe(nombre, segundos, tamano)
+
+                # el .xlsx ya viene comprimido: pasa casi tal cual, por bloques
+                with open(ruta, "rb") as src, zf.open(nombre, "w", force_zip64=tamano > 1 << 30) as dst:
+                    for bloque in iter(lambda: src.read(1024 * 1024), b""):
+                        dst.write(bloque)
+                        if salida.partes:
+                            yield salida.vaciar()
+                os.remove(ruta)
+
+            texto = io.StringIO()
+            csv.writer(texto, delimiter=";").writerows(tiempos)
+            zf.writestr("tiempos.csv", texto.getvalue())
+        yield salida.vaciar()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        tmpdir.cleanup()
 
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-    return bio.getvalue()
 
 def build_excel_plantilla_carga_masiva():
     """
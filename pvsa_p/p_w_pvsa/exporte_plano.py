@@ -0,0 +1,94 @@
+"""
+Export plano del inventario: una fila por ObjetoLugar con toda su jerarquía
+(sector ... lugar, categoría, objeto, marca, material) para BI.
+
+Se genera en streaming con memoria constante: values_list + iterator (cursor
+del lado del servidor en PostgreSQL, de a CHUNK filas) y la salida se
+entrega en bloques de ~BLOQUE_BYTES. Ordenado por id, así la consulta no
+necesita ordenar nada antes de empezar a devolver filas.
+"""
+import csv
+import io
+import json
+
+from .models import ObjetoLugar
+
+
+FORMATOS_PLANO = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+# encabezados del CSV / llaves de cada línea JSON
+COLUMNAS_PLANO = (
+    "sector", "ubicacion", "piso", "tipo_de_lugar", "lugar", "categoria",
+    "objeto", "marca", "material", "cantidad", "estado", "detalle", "fecha",
+)
+
+_CAMPOS = (
+    "lugar__piso__ubicacion__sector__sector",
+    "lugar__piso__ubicacion__ubicacion",
+    "lugar__piso__piso",
+    "lugar__lugar_tipo_lugar__tipo_de_lugar",
+    "lugar__nombre_del_lugar",
+    "tipo_de_objeto__objeto__objeto_categoria__nombre_de_categoria",
+    "tipo_de_objeto__objeto__nombre_del_objeto",
+    "tipo_de_objeto__marca",
+    "tipo_de_objeto__material",
+    "cantidad",
+    "estado",
+    "detalle",
+    "fecha",
+)
+
+CHUNK = 2000
+BLOQUE_BYTES = 64 * 1024
+
+# uno solo: json.dumps con argumentos arma un encoder nuevo en cada llamada
+_json = json.JSONEncoder(ensure_ascii=False)
+
+
+def _filas(objetos_qs):
+    """Tuplas en el orden de COLUMNAS_PLANO (estado con su nombre, fecha ISO)."""
+    estados = dict(ObjetoLugar.ESTADO)
+    qs = objetos_qs.order_by("id").values_list(*_CAMPOS)
+    for r in qs.iterator(chunk_size=CHUNK):
+        yield r[:10] + (
+            estados.get(r[10], r[10]),
+            r[11] or "",
+            r[12].isoformat() if r[12] else "",
+        )
+
+
+def _iter_csv(filas):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNAS_PLANO)
+    for fila in filas:
+        writer.writerow(fila)
+        if buf.tell() >= BLOQUE_BYTES:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def _iter_jsonl(filas):
+    partes, tamano = [], 0
+    for fila in filas:
+        linea = _json.encode(dict(zip(COLUMNAS_PLANO, fila)))
+        partes.append(linea)
+        tamano += len(linea)
+        if tamano >= BLOQUE_BYTES:
+            yield ("\n".join(partes) + "\n").encode("utf-8")
+            partes, tamano = [], 0
+    if partes:
+        yield ("\n".join(partes) + "\n").encode("utf-8")
+
+
+def iter_plano(objetos_qs, formato="csv"):
+    """Bytes del export (`formato`: "csv" o "jsonl") para un StreamingHttpResponse."""
+    if formato not in FORMATOS_PLANO:
+        raise ValueError(f"Formato no soportado: {formato}")
+    filas = _filas(objetos_qs)
+    return _iter_csv(filas) if formato == "csv" else _iter_jsonl(filas)
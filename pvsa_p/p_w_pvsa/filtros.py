@@ -0,0 +1,81 @@
+"""
+Filtros del resumen general (sector, ubicación, piso, tipo de lugar, categoría,
+objeto, tipo de objeto, estado, marca, material).
+Los usan resumen_general y la exportación a Excel, para que un mismo
+?query string dé el mismo recorte en pantalla y en el archivo.
+Igual con los de lista_objetos_lugar (lugar, objeto, tipo, estado) y el
+export plano CSV / JSON Lines.
+"""
+
+# filtro (parámetro GET) -> lookup desde ObjetoLugar
+LOOKUPS_OBJETO_LUGAR = {
+    "sector": "lugar__piso__ubicacion__sector_id",
+    "ubicacion": "lugar__piso__ubicacion_id",
+    "piso": "lugar__piso_id",
+    "tipo_lugar": "lugar__lugar_tipo_lugar_id",
+    "categoria": "tipo_de_objeto__objeto__objeto_categoria_id",
+    "objeto": "tipo_de_objeto__objeto_id",
+    "tipo_objeto": "tipo_de_objeto_id",
+    "estado": "estado",
+    "marca": "tipo_de_objeto__marca",
+    "material": "tipo_de_objeto__material",
+}
+
+# los que solo eligen hojas (en el Excel no dejan fuera pisos ni lugares vacíos)
+FILTROS_UBICACION = ("sector", "ubicacion")
+
+
+# los que filtran por id
+FILTROS_ID = ("sector", "ubicacion", "piso", "tipo_lugar", "categoria", "objeto", "tipo_objeto")
+
+
+def leer_filtros(params):
+    """
+    {filtro: valor o None} desde request.GET (o cualquier dict). Los ids que
+    no son número se descartan (quedan en None, como si no vinieran).
+    """
+    filtros = {k: params.get(k) or None for k in LOOKUPS_OBJETO_LUGAR}
+    for k in FILTROS_ID:
+        valor = (filtros[k] or "").strip()
+        filtros[k] = valor if valor.isdecimal() else None
+    return filtros
+
+
+def filtrar_objetos_lugar(qs, filtros):
+    """Aplica al queryset de ObjetoLugar los filtros que vienen con valor."""
+    for k, lookup in LOOKUPS_OBJETO_LUGAR.items():
+        if filtros.get(k):
+            qs = qs.filter(**{lookup: filtros[k]})
+    return qs
+
+
+def hay_filtros(filtros, excepto=()):
+    return any(v for k, v in filtros.items() if k not in excepto)
+
+
+# filtros de lista_objetos_lugar -> lookup desde ObjetoLugar
+LOOKUPS_LISTA_OBJETOS = {
+    "lugar": "lugar_id",
+    "objeto": "tipo_de_objeto__objeto_id",
+    "tipo": "tipo_de_objeto_id",
+    "estado": "estado",
+}
+
+
+def leer_filtros_lista(params):
+    """
+    {filtro: valor o ""} de lista_objetos_lugar. Los ids que no son número se
+    descartan (quedan en "", como si no vinieran).
+    """
+    filtros = {k: (params.get(k) or "").strip() for k in LOOKUPS_LISTA_OBJETOS}
+    for k in ("lugar", "objeto", "tipo"):
+        if filtros[k] and not filtros[k].isdecimal():
+            filtros[k] = ""
+    return filtros
+
+
+def filtrar_lista_objetos(qs, filtros):
+    for k, lookup in LOOKUPS_LISTA_OBJETOS.items():
+        if filtros.get(k):
+            qs = qs.filter(**{lookup: filtros[k]})
+    return qs
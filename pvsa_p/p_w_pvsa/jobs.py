@@ -0,0 +1,271 @@
+"""
+Importaciones de carga masiva en segundo plano.
+
+Sin broker externo: un ThreadPoolExecutor dentro del mismo proceso ejecuta los
+TrabajoImportacion. La importación confirma por tramos (CARGA_MASIVA_CHUNK
+filas); tras cada tramo se guarda el checkpoint en el trabajo, de modo que uno
+fallido puede reanudarse desde la última fila confirmada. El avance dentro del
+tramo en curso (aún sin commit) se lleva en memoria.
+
+Si el proceso se reinicia o muere, sus trabajos quedarían "Pendiente" / "En
+curso" para siempre: cada proceso marca con un latido los que tiene en su
+cola y recuperar_huerfanos() da por fallidos los que llevan mucho sin él,
+que así se reanudan desde el checkpoint como cualquier otro fallo.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import TrabajoImportacion
+
+
+logger = logging.getLogger(__name__)
+
+# SQLite admite un solo escritor: por defecto, 1 importación a la vez
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "CARGA_MASIVA_WORKERS", 1),
+    thread_name_prefix="carga-masiva",
+)
+
+# avance de los trabajos en curso en ESTE proceso: {job_id: {campo: valor}}
+_progreso = {}
+_lock = threading.Lock()
+
+# este proceso en TrabajoImportacion.ejecutor
+_PROCESO = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+# trabajos encolados o corriendo en ESTE proceso (los que mantiene vivos el latido)
+_propios = set()
+_hilo_latido = None
+
+ERROR_HUERFANO = "La importación se interrumpió (se reinició el servidor). Vuelve a confirmar para reanudarla."
+
+
+def encolar_importacion(carga, user=None, primera_editada=None):
+    """
+    Deja en la cola la importación de una CargaMasiva.
+    Si la carga tiene un trabajo fallido con checkpoint se reanuda ese mismo,
+    salvo que se haya editado una fila ya confirmada (`primera_editada`):
+    en ese caso se empieza un trabajo nuevo desde la primera fila.
+    Si ya tiene uno pendiente / en curso (vivo) devuelve ese.
+    """
+    recuperar_huerfanos(carga.trabajos.all())
+    vivo = carga.trabajos.filter(estado__in=("P", "C")).order_by("-id").first()
+    if vivo is not None:
+        return vivo
+
+    job = (
+        carga.trabajos.filter(estado="F", ultima_fila__gt=0)
+        .order_by("-id")
+        .first()
+    )
+    saltar = _cambios_saltados()
+    pendientes = carga.filas.exclude(cambio__in=saltar)
+    if job is not None and (primera_editada is None or primera_editada > job.ultima_fila):
+        job.estado = "P"
+        job.error = ""
+        job.fila_error = None
+        job.terminado = None
+        job.total_filas = job.filas_procesadas + pendientes.filter(numero__gt=job.ultima_fila).count()
+        job.ejecutor = _PROCESO
+        job.latido = timezone.now()
+        job.save(update_fields=["estado", "error", "fila_error", "terminado", "total_filas", "ejecutor", "latido"])
+    else:
+        job = TrabajoImportacion.objects.create(
+            carga=carga,
+            ejecutor=_PROCESO,
+            latido=timezone.now(),
+            total_filas=pendientes.count(),
+            sin_cambios=carga.filas.filter(cambio="I").count() if "I" in saltar else 0,
+            conflictos=carga.filas.filter(cambio="X").count(),
+            creado_por=user if user is not None and user.is_authenticated else None,
+        )
+    transaction.on_commit(lambda: _enviar(job.pk))
+    return job
+
+
+def _enviar(job_id):
+    global _hilo_latido
+    with _lock:
+        _propios.add(job_id)
+        if _hilo_latido is None:
+            _hilo_latido = threading.Thread(target=_latir, name="carga-masiva-latido", daemon=True)
+            _hilo_latido.start()
+    _executor.submit(_ejecutar, job_id)
+
+
+def _latir():
+    """Hilo del proceso: renueva el latido de los trabajos de _propios."""
+    while True:
+        time.sleep(getattr(settings, "CARGA_MASIVA_LATIDO", 15))
+        with _lock:
+            ids = list(_propios)
+        if not ids:
+            continue
+        try:
+            TrabajoImportacion.objects.filter(pk__in=ids, ejecutor=_PROCESO).update(latido=timezone.now())
+        except Exception:
+            # BD ocupada: se reintenta en el próximo latido (el margen es CARGA_MASIVA_HUERFANO)
+            logger.warning("No se pudo renovar el latido de %s", ids, exc_info=True)
+        finally:
+            connection.close()
+
+
+def _limite_huerfano():
+    return timezone.now() - timedelta(seconds=getattr(settings, "CARGA_MASIVA_HUERFANO", 120))
+
+
+def recuperar_huerfanos(qs=None):
+    """
+    Da por fallidos los trabajos pendientes / en curso cuyo proceso ya no da
+    señales (latido más viejo que CARGA_MASIVA_HUERFANO). Conservan ultima_fila
+    y checkpoint, así que encolar_importacion los reanuda desde ahí.
+    Devuelve cuántos marcó.
+    """
+    limite = _limite_huerfano()
+    with _lock:
+        propios = list(_propios)
+    qs = TrabajoImportacion.objects.all() if qs is None else qs
+    return (
+        qs.filter(estado__in=("P", "C"))
+        .filter(Q(latido__lt=limite) | Q(latido__isnull=True, creado__lt=limite))
+        .exclude(pk__in=propios, ejecutor=_PROCESO)
+        .update(estado="F", error=ERROR_HUERFANO, fila_error=None, terminado=timezone.now())
+    )
+
+
+def _cambios_saltados():
+    """
+    Clases del diff que no se importan: iguales, omitidas y en conflicto.
+    Sumando repetidas (CARGA_MASIVA_CONSOLIDAR = "sumar") una fila "igual"
+    puede ser parte de la suma de una clave que se repite más adelante, así
+    que ahí no se saltan las iguales.
+    """
+    if getattr(settings, "CARGA_MASIVA_CONSOLIDAR", "ultima") == "sumar":
+        return ("O", "X")
+    return ("I", "O", "X")
+
+
+def progreso(job):
+    """Estado del trabajo para el polling (BD + avance en memoria si está corriendo aquí)."""
+    if job.estado in ("P", "C") and (job.latido or job.creado) < _limite_huerfano():
+        if recuperar_huerfanos(TrabajoImportacion.objects.filter(pk=job.pk)):
+            job.refresh_from_db()
+
+    data = {
+        "id": job.pk,
+        "estado": job.estado,
+        "estado_display": job.get_estado_display(),
+        "total": job.total_filas,
+        "procesadas": job.filas_procesadas,
+        "creados": job.creados,
+        "actualizados": job.actualizados,
+        "sin_cambios": job.sin_cambios,
+        "consolidadas": job.consolidadas,
+        "conflictos": job.conflictos,
+        "error": job.error,
+        "fila_error": job.fila_error,
+        "ultima_fila": job.ultima_fila,
+    }
+    with _lock:
+        data.update(_progreso.get(job.pk, {}))
+
+    data["terminado"] = data["estado"] in ("T", "F")
+    data["porcentaje"] = round(data["procesadas"] * 100 / data["total"], 1) if data["total"] else 0
+    return data
+
+
+def _ejecutar(job_id):
+    # import local: views importa este módulo
+    from .views import ImportacionError, _filas_staging, import_from_rows
+
+    close_old_connections()
+    try:
+        # se toma solo si sigue pendiente y en esta cola: si mientras esperaba
+        # se dio por huérfano (y quizá se reanudó en otro lado), no se corre
+        if not TrabajoImportacion.objects.filter(pk=job_id, estado="P", ejecutor=_PROCESO).update(
+            estado="C", iniciado=timezone.now(), latido=timezone.now()
+        ):
+            return
+        job = TrabajoImportacion.objects.select_related("carga").get(pk=job_id)
+        carga = job.carga
+
+        with _lock:
+            _progreso[job_id] = {"estado": "C", "estado_display": "En curso"}
+
+        def _avance(procesadas, creados, actualizados, sin_cambios):
+            with _lock:
+                _progreso[job_id].update(
+                    procesadas=procesadas,
+                    creados=creados,
+                    actualizados=actualizados,
+                    sin_cambios=sin_cambios,
+                )
+
+        def _checkpoint(estado):
+            TrabajoImportacion.objects.filter(pk=job_id).update(
+                ultima_fila=estado["fila"],
+                filas_procesadas=estado["procesadas"],
+                creados=estado["created"],
+                actualizados=estado["updated"],
+                sin_cambios=estado["unchanged"],
+                consolidadas=estado["consolidated"],
+                conflictos=estado["conflicts"],
+                checkpoint=estado,
+                latido=timezone.now(),
+            )
+            # entre tramos, que otros escritores tomen el lock de SQLite
+            time.sleep(getattr(settings, "CARGA_MASIVA_PAUSA", 0))
+
+        try:
+            if carga is None:
+                raise ImportacionError("La carga ya no existe (¿expiró?). Vuelve a subir el archivo.")
+            result = import_from_rows(
+                _filas_staging(carga, desde=job.ultima_fila, saltar=_cambios_saltados()),
+                progress=_avance,
+                chunk_size=getattr(settings, "CARGA_MASIVA_CHUNK", None),
+                checkpoint=_checkpoint,
+                # las filas saltadas por el diff ya cuentan como sin cambios / conflicto
+                estado=(
+                    job.checkpoint if job.ultima_fila
+                    else {"unchanged": job.sin_cambios, "conflicts": job.conflictos}
+                ),
+                numeradas=True,
+            )
+        except Exception as e:
+            logger.exception("Falló la importación #%s", job_id)
+            # el avance confirmado ya quedó guardado por _checkpoint
+            TrabajoImportacion.objects.filter(pk=job_id).update(
+                estado="F",
+                error=str(e),
+                fila_error=getattr(e, "fila", None),
+                terminado=timezone.now(),
+            )
+            return
+
+        TrabajoImportacion.objects.filter(pk=job_id).update(
+            estado="T",
+            filas_procesadas=job.total_filas,
+            creados=result["created"],
+            actualizados=result["updated"],
+            sin_cambios=result["unchanged"],
+            consolidadas=result["consolidated"],
+            conflictos=result["conflicts"],
+            checkpoint={},
+            terminado=timezone.now(),
+        )
+        carga.delete()
+    finally:
+        with _lock:
+            _progreso.pop(job_id, None)
+            _propios.discard(job_id)
+        connection.close()
@@ -0,0 +1,67 @@
+"""
+Exportación masiva desde la línea de comandos (auditorías mensuales).
+
+    python manage.py exportar_excel puerto.zip
+    python manage.py exportar_excel puerto.zip --por sector --workers 8
+    python manage.py exportar_excel malos.zip --filtro estado=M
+
+Usa el mismo camino que la descarga .zip de la web (iter_zip_sectores): un
+.xlsx por ubicación (o por sector) generado en un pool de procesos.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from p_w_pvsa.excel_utils import POR_ZIP, iter_zip_sectores
+from p_w_pvsa.filtros import LOOKUPS_OBJETO_LUGAR, leer_filtros
+from p_w_pvsa.models import Ubicacion
+
+
+class Command(BaseCommand):
+    help = "Exporta un .zip con un Excel por ubicación (o por sector), generados en paralelo."
+
+    def add_arguments(self, parser):
+        parser.add_argument("destino", help="Ruta del .zip a generar")
+        parser.add_argument(
+            "--por", choices=POR_ZIP, default="ubicacion",
+            help="Un archivo por ubicación (default) o por sector.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Procesos en paralelo (default: EXPORTE_ZIP_WORKERS).",
+        )
+        parser.add_argument(
+            "--filtro", action="append", default=[], metavar="NOMBRE=VALOR",
+            help=f"Filtro de resumen_general, repetible ({', '.join(LOOKUPS_OBJETO_LUGAR)}).",
+        )
+
+    def handle(self, *args, **opts):
+        params = {}
+        for f in opts["filtro"]:
+            nombre, _, valor = f.partition("=")
+            if nombre not in LOOKUPS_OBJETO_LUGAR or not valor:
+                raise CommandError(f"Filtro inválido: {f!r}")
+            params[nombre] = valor
+
+        t0 = time.perf_counter()
+        archivos = 0
+
+        def _informe(nombre, segundos, tamano):
+            nonlocal archivos
+            archivos += 1
+            self.stdout.write(f"  {nombre}: {segundos:.2f} s, {tamano / (1024 * 1024):.1f} MB")
+
+        ubicaciones = Ubicacion.objects.select_related("sector").order_by("sector__sector", "ubicacion")
+        try:
+            out = open(opts["destino"], "wb")
+        except OSError as e:
+            raise CommandError(f"No pude crear {opts['destino']}: {e}")
+        with out:
+            for bloque in iter_zip_sectores(
+                ubicaciones, opts["por"], leer_filtros(params), opts["workers"], informe=_informe
+            ):
+                out.write(bloque)
+
+        t_total = time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(f"Exportación terminada: {archivos} archivos en {opts['destino']}"))
+        self.stdout.write(f"  Tiempo total: {t_total:.2f} s")
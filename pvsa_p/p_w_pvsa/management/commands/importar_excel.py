@@ -0,0 +1,148 @@
+"""
+Importación masiva desde la línea de comandos (sin pasar por la web).
+
+    python manage.py importar_excel inventario.xlsx
+    python manage.py importar_excel puerto.zip --workers 4 --chunk-size 20000
+    python manage.py importar_excel datos.csv --dry-run
+
+Usa el mismo camino que la carga masiva: iter_carga_masiva -> _fila_preview ->
+import_from_rows, así que el resultado es idéntico al de la UI.
+"""
+import resource
+import sys
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from p_w_pvsa.views import (
+    CONSOLIDAR_POLITICAS,
+    ERROR_FORMATO_EXCEL,
+    IMPORT_BATCH_SIZE,
+    ImportacionError,
+    _fila_preview,
+    import_from_rows,
+    iter_carga_masiva,
+)
+
+
+def _pico_memoria_mb(quien=resource.RUSAGE_SELF):
+    # ru_maxrss: KB en Linux, bytes en macOS
+    pico = resource.getrusage(quien).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+class Command(BaseCommand):
+    help = "Importa un Excel (.xlsx), un .zip de Excels o un CSV/TSV directo a la BD, en streaming."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta al .xlsx / .zip / .csv / .tsv")
+        parser.add_argument(
+            "--batch-size", type=int, default=IMPORT_BATCH_SIZE,
+            help=f"Filas por lote de escritura (default {IMPORT_BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Procesos para parsear hojas / workbooks en paralelo (default: CARGA_MASIVA_PARSE_WORKERS).",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=None,
+            help="Confirmar cada N filas en su propia transacción (default: todo en una).",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="No escribe nada: solo cuenta nuevas / con cambios / sin cambios / omitidas.",
+        )
+        parser.add_argument(
+            "--consolidar", choices=CONSOLIDAR_POLITICAS, default=None,
+            help="Filas repetidas (lugar + tipo de objeto): gana la última o se suman "
+                 "(default: CARGA_MASIVA_CONSOLIDAR).",
+        )
+        parser.add_argument(
+            "--sin-cache", action="store_true",
+            help="No usar ni llenar el cache de archivos parseados.",
+        )
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        t_parseo = 0.0
+        ultimo_aviso = t0
+        clases = Counter()
+
+        try:
+            fh = open(opts["archivo"], "rb")
+        except OSError as e:
+            raise CommandError(f"No pude abrir {opts['archivo']}: {e}")
+
+        def _filas(gen):
+            # mide el tiempo que se pasa dentro del parser (el resto es BD)
+            nonlocal t_parseo
+            while True:
+                t = time.perf_counter()
+                try:
+                    r = next(gen)
+                except StopIteration:
+                    t_parseo += time.perf_counter() - t
+                    return
+                t_parseo += time.perf_counter() - t
+                yield _fila_preview(r)
+
+        def _clasificar(numero, cambio):
+            clases[cambio] += 1
+
+        def _progreso(procesadas, creados, actualizados, sin_cambios):
+            nonlocal ultimo_aviso
+            ahora = time.perf_counter()
+            if ahora - ultimo_aviso >= 5:
+                ultimo_aviso = ahora
+                self.stderr.write(f"  ... {procesadas} filas ({procesadas / (ahora - t0):,.0f} filas/s)")
+
+        with fh:
+            t = time.perf_counter()
+            formato, gen = iter_carga_masiva(fh, workers=opts["workers"], usar_cache=not opts["sin_cache"])
+            t_parseo += time.perf_counter() - t
+            self.stdout.write(f"Formato detectado: {formato}")
+
+            try:
+                result = import_from_rows(
+                    _filas(gen),
+                    batch_size=opts["batch_size"],
+                    progress=_progreso,
+                    chunk_size=opts["chunk_size"],
+                    dry_run=opts["dry_run"],
+                    clasificar=_clasificar,
+                    consolidar=opts["consolidar"],
+                )
+            except ImportacionError as e:
+                raise CommandError(f"Fila {e.fila}: {e}")
+
+        total = sum(clases.values())
+        if not total:
+            raise CommandError(ERROR_FORMATO_EXCEL)
+
+        t_total = time.perf_counter() - t0
+        t_bd = t_total - t_parseo
+
+        titulo = "Simulación (dry-run), no se escribió nada" if opts["dry_run"] else "Importación terminada"
+        self.stdout.write(self.style.SUCCESS(titulo))
+        self.stdout.write(
+            f"  Filas: {total} | Nuevas: {clases['N']} | Con cambios: {clases['C']} | "
+            f"Sin cambios: {clases['I']} | Omitidas: {clases['O']}"
+        )
+        if clases["X"]:
+            self.stdout.write(
+                f"  Conflictos (Excel editable, cambiaron en la BD después de exportar; no se aplicaron): {clases['X']}"
+            )
+        self.stdout.write(
+            f"  ObjetoLugar creados: {result['created']} | actualizados: {result['updated']} | "
+            f"sin cambios: {result['unchanged']}"
+        )
+        if result["consolidated"]:
+            self.stdout.write(f"  Filas repetidas consolidadas: {result['consolidated']}")
+        self.stdout.write(f"  Tiempo total: {t_total:.2f} s ({total / t_total:,.0f} filas/s)")
+        self.stdout.write(f"    parseo:  {t_parseo:.2f} s")
+        self.stdout.write(f"    BD:      {t_bd:.2f} s")
+        self.stdout.write(f"  Memoria pico: {_pico_memoria_mb():.1f} MB")
+        hijos = _pico_memoria_mb(resource.RUSAGE_CHILDREN)
+        if hijos:
+            self.stdout.write(f"  Memoria pico procesos hijos (workers): {hijos:.1f} MB")
@@ -0,0 +1,30 @@
+"""
+Rehace ResumenEstado (cantidades por estado de cada lugar, piso, ubicación y
+sector) desde ObjetoLugar.
+
+    python manage.py reconstruir_resumen_estados
+
+Normalmente se mantiene solo (signals.py e import_from_rows); esto es para
+la primera carga después de migrar o si algo escribió ObjetoLugar sin pasar
+por ellos (SQL directo, update() masivos). Al terminar sube la versión de
+todas las ubicaciones, así las stats del mapa cacheadas no quedan con los
+números viejos.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from p_w_pvsa.cache_exportes import tocar_ubicaciones
+from p_w_pvsa.models import Ubicacion
+from p_w_pvsa.resumen_estados import reconstruir
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero el resumen de estados por lugar, piso, ubicación y sector."
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        nodos = reconstruir()
+        tocar_ubicaciones(Ubicacion.objects.values_list("pk", flat=True))
+        self.stdout.write(self.style.SUCCESS(f"Resumen reconstruido: {nodos} nodos"))
+        self.stdout.write(f"  Tiempo total: {time.perf_counter() - t0:.2f} s")
@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-18 10:12
+
+import django.core.serializers.json
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0002_lugar_geom'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaMasiva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('formato', models.CharField(max_length=20)),
+                ('nombre_archivo', models.CharField(blank=True, max_length=255)),
+                ('total_filas', models.PositiveIntegerField(default=0)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CargaMasivaFila',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField()),
+                ('datos', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('texto', models.TextField(blank=True)),
+                ('carga', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='filas', to='p_w_pvsa.cargamasiva')),
+            ],
+            options={
+                'ordering': ('numero',),
+                'unique_together': {('carga', 'numero')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0004_trabajoimportacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='checkpoint',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='ultima_fila',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0005_trabajoimportacion_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='cambios',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='nuevos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='omitidas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='sin_cambios',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cargamasivafila',
+            name='cambio',
+            field=models.CharField(blank=True, choices=[('N', 'Nuevo'), ('C', 'Cambia'), ('I', 'Sin cambios'), ('O', 'Omitida')], max_length=1),
+        ),
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='sin_cambios',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0006_carga_masiva_diff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='consolidadas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='consolidadas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
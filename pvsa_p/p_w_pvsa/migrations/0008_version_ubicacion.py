@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 14:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0007_carga_masiva_consolidadas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionUbicacion',
+            fields=[
+                ('ubicacion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='version_datos', serialize=False, to='p_w_pvsa.ubicacion')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('modificado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0008_version_ubicacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='conflictos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='conflictos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='cargamasivafila',
+            name='cambio',
+            field=models.CharField(blank=True, choices=[('N', 'Nuevo'), ('C', 'Cambia'), ('I', 'Sin cambios'), ('O', 'Omitida'), ('X', 'Conflicto')], max_length=1),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-18 14:40
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def llenar_resumen(apps, schema_editor):
+    # misma cuenta que resumen_estados.reconstruir, con los modelos históricos
+    ObjetoLugar = apps.get_model("p_w_pvsa", "ObjetoLugar")
+    Lugar = apps.get_model("p_w_pvsa", "Lugar")
+    ResumenEstado = apps.get_model("p_w_pvsa", "ResumenEstado")
+
+    campos = ("objetos", "total", "buenas", "pendientes", "malas")
+    por_lugar = {
+        r["lugar_id"]: [r[c] or 0 for c in campos]
+        for r in ObjetoLugar.objects.filter(lugar__isnull=False).values("lugar_id").annotate(
+            objetos=Count("id"),
+            total=Sum("cantidad"),
+            buenas=Sum("cantidad", filter=Q(estado="B")),
+            pendientes=Sum("cantidad", filter=Q(estado="P")),
+            malas=Sum("cantidad", filter=Q(estado="M")),
+        )
+    }
+    nodos = defaultdict(lambda: [0] * len(campos))
+    for pk, piso, ubicacion, sector in Lugar.objects.values_list(
+        "pk", "piso_id", "piso__ubicacion_id", "piso__ubicacion__sector_id"
+    ):
+        if pk not in por_lugar:
+            continue
+        for nodo in (("lugar", pk), ("piso", piso), ("ubicacion", ubicacion), ("sector", sector)):
+            acc = nodos[nodo]
+            for k, v in enumerate(por_lugar[pk]):
+                acc[k] += v
+    ResumenEstado.objects.bulk_create(
+        [ResumenEstado(nivel=n, nodo_id=pk, **dict(zip(campos, d))) for (n, pk), d in nodos.items()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0009_conflictos_carga'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenEstado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.CharField(choices=[('sector', 'Sector'), ('ubicacion', 'Ubicación'), ('piso', 'Piso'), ('lugar', 'Lugar')], max_length=10)),
+                ('nodo_id', models.PositiveIntegerField()),
+                ('objetos', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('buenas', models.IntegerField(default=0)),
+                ('pendientes', models.IntegerField(default=0)),
+                ('malas', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('nivel', 'nodo_id')},
+            },
+        ),
+        migrations.RunPython(llenar_resumen, migrations.RunPython.noop),
+    ]
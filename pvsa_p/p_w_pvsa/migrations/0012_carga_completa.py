@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+def marcar_completas(apps, schema_editor):
+    # las cargas de antes se guardaban en una sola transacción: si existen, están completas
+    CargaMasiva = apps.get_model("p_w_pvsa", "CargaMasiva")
+    CargaMasiva.objects.update(completa=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0011_version_catalogo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='completa',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(marcar_completas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p_w_pvsa', '0012_carga_completa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='ejecutor',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
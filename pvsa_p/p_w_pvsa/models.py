@@ -1,3 +1,6 @@
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
 from django.utils import timezone
 from django.conf import settings
@@ -288,4 +291,189 @@ class AreaMapa(models.Model):
     actualizado = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.get_tipo_display()}: {self.nombre}"
\ No newline at end of file
+        return f"{self.get_tipo_display()}: {self.nombre}"
+
+
+class VersionUbicacion(models.Model):
+    """
+    Versión de los datos de una Ubicacion (sus pisos, lugares y objetos, y los
+    nombres de catálogo que se ven en su hoja del Excel). Sube en 1 con cada
+    cambio (ver signals.py e import_from_rows) y la usa el cache de
+    exportación (cache_exportes.py) como clave.
+    Va aparte de Ubicacion para que guardar una Ubicacion desde un formulario
+    no pise la versión con un valor viejo; solo se escribe con update().
+    """
+    ubicacion = models.OneToOneField(
+        Ubicacion,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="version_datos",
+    )
+    version = models.PositiveIntegerField(default=0)
+    modificado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.ubicacion_id} v{self.version}"
+
+
+class VersionCatalogo(models.Model):
+    """
+    Versión del catálogo con que se arman los combos de filtros (sectores,
+    ubicaciones, pisos, lugares, tipos de lugar, categorías, objetos y tipos
+    de objeto). Una sola fila; sube en 1 con cada alta, cambio o baja de
+    esos modelos (signals.py e import_from_rows) y catalogo.py la usa para
+    saber si su copia en memoria sigue valiendo. Solo se escribe con update().
+    """
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    version = models.PositiveIntegerField(default=0)
+    modificado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"catálogo v{self.version}"
+
+
+class ResumenEstado(models.Model):
+    """
+    Cantidades por estado ya sumadas para cada nodo del árbol (lugar, piso,
+    ubicación y sector): las estadísticas del mapa las leen de aquí en vez de
+    agregar ObjetoLugar entero. Se mantiene al día de a poco
+    (resumen_estados.py, llamado desde signals.py e import_from_rows) y se
+    rehace desde cero con `manage.py reconstruir_resumen_estados`.
+    """
+    NIVEL = (
+        ("sector", "Sector"),
+        ("ubicacion", "Ubicación"),
+        ("piso", "Piso"),
+        ("lugar", "Lugar"),
+    )
+
+    nivel = models.CharField(max_length=10, choices=NIVEL)
+    nodo_id = models.PositiveIntegerField()
+    objetos = models.IntegerField(default=0)  # filas de ObjetoLugar debajo del nodo
+    total = models.IntegerField(default=0)
+    buenas = models.IntegerField(default=0)
+    pendientes = models.IntegerField(default=0)
+    malas = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("nivel", "nodo_id")
+
+    def __str__(self):
+        return f"{self.nivel} {self.nodo_id}: {self.total}"
+
+class CargaMasiva(models.Model):
+    """
+    Archivo de carga masiva ya parseado, esperando confirmación.
+    Las filas quedan en el servidor (CargaMasivaFila); el navegador solo
+    pagina la previsualización y devuelve el token + las filas editadas.
+    """
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    formato = models.CharField(max_length=20)
+    nombre_archivo = models.CharField(max_length=255, blank=True)
+    total_filas = models.PositiveIntegerField(default=0)
+
+    # diff contra ObjetoLugar al subir (ver CargaMasivaFila.cambio)
+    nuevos = models.PositiveIntegerField(default=0)
+    cambios = models.PositiveIntegerField(default=0)
+    sin_cambios = models.PositiveIntegerField(default=0)
+    omitidas = models.PositiveIntegerField(default=0)
+    consolidadas = models.PositiveIntegerField(default=0)  # repiten lugar + tipo de objeto de una fila anterior
+    conflictos = models.PositiveIntegerField(default=0)  # Excel editable: cambiaron en la BD después de exportar
+    # las filas se guardan por lotes, cada uno en su transacción: hasta que se
+    # marca completa la carga no se puede previsualizar ni confirmar
+    completa = models.BooleanField(default=False)
+
+    creado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Carga {self.token} ({self.formato}, {self.total_filas} filas)"
+
+
+class CargaMasivaFila(models.Model):
+    CAMBIO = (
+        ("N", "Nuevo"),
+        ("C", "Cambia"),
+        ("I", "Sin cambios"),
+        ("O", "Omitida"),  # le faltan ubicación/sector/lugar/objeto
+        ("X", "Conflicto"),  # Excel editable: el ObjetoLugar cambió o se borró después de exportar
+    )
+
+    carga = models.ForeignKey(
+        CargaMasiva,
+        on_delete=models.CASCADE,
+        related_name="filas",
+    )
+    numero = models.PositiveIntegerField()  # posición en el archivo (1..N)
+    datos = models.JSONField(encoder=DjangoJSONEncoder)
+    texto = models.TextField(blank=True)  # datos en minúsculas, para el filtro de la previsualización
+    cambio = models.CharField(max_length=1, choices=CAMBIO, blank=True)  # "" = editada, sin clasificar
+
+    class Meta:
+        unique_together = ("carga", "numero")
+        ordering = ("numero",)
+
+    def __str__(self):
+        return f"Fila {self.numero} de {self.carga.token}"
+
+
+class TrabajoImportacion(models.Model):
+    """
+    Importación de una CargaMasiva ejecutada en segundo plano (ver jobs.py).
+    Guarda el avance y, si falla, el error y la fila donde ocurrió.
+    La importación confirma por tramos: `ultima_fila` y `checkpoint` permiten
+    reanudarla desde el último tramo guardado.
+    """
+    ESTADO = (
+        ("P", "Pendiente"),
+        ("C", "En curso"),
+        ("T", "Terminado"),
+        ("F", "Fallido"),
+    )
+
+    carga = models.ForeignKey(
+        CargaMasiva,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="trabajos",
+    )
+    estado = models.CharField(max_length=1, choices=ESTADO, default="P")
+
+    total_filas = models.PositiveIntegerField(default=0)
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    creados = models.PositiveIntegerField(default=0)
+    actualizados = models.PositiveIntegerField(default=0)
+    sin_cambios = models.PositiveIntegerField(default=0)
+    consolidadas = models.PositiveIntegerField(default=0)
+    conflictos = models.PositiveIntegerField(default=0)
+
+    error = models.TextField(blank=True)
+    fila_error = models.PositiveIntegerField(null=True, blank=True)
+
+    # último tramo confirmado: fila + caches de dimensiones (ver import_from_rows)
+    ultima_fila = models.PositiveIntegerField(default=0)
+    checkpoint = models.JSONField(default=dict, blank=True)
+
+    creado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    # proceso que lo tiene en su cola y última señal de vida (ver jobs.py):
+    # un trabajo pendiente / en curso sin latido reciente quedó huérfano
+    ejecutor = models.CharField(max_length=64, blank=True)
+    latido = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Importación #{self.pk} ({self.get_estado_display()}, {self.filas_procesadas}/{self.total_filas})"
@@ -0,0 +1,216 @@
+"""
+Mantiene ResumenEstado: total / buenas / pendientes / malas (y cuántas filas
+de ObjetoLugar) por lugar, piso, ubicación y sector.
+
+- recalcular_lugares(ids): vuelve a sumar los ObjetoLugar de esos lugares
+  (consulta chica, por lugar_id) y lleva la diferencia contra lo guardado a su
+  piso, ubicación y sector sumando el delta en la BD. La usan las señales de ObjetoLugar
+  y, por lote, import_from_rows (bulk_create / bulk_update no las disparan).
+- mover(nivel, nodo_id, antes, despues): un lugar, piso o ubicación que cambia
+  de padre se lleva su resumen de un camino al otro.
+- reconstruir(): todo desde cero (comando reconstruir_resumen_estados).
+- sumar_por_nivel(qs): los mismos totales para cualquier queryset filtrado
+  de ObjetoLugar, con una sola consulta agrupada a nivel de lugar.
+
+Las lecturas (leer / filas / resumen) son por nodo, sin tocar ObjetoLugar;
+leer trae varios niveles en una sola consulta.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from .models import Lugar, ObjetoLugar, Piso, ResumenEstado, Ubicacion
+
+
+# de abajo hacia arriba
+NIVELES = ("lugar", "piso", "ubicacion", "sector")
+CAMPOS = ("objetos", "total", "buenas", "pendientes", "malas")
+
+# nivel -> (modelo, lookups hasta cada nivel de arriba, en el orden de NIVELES)
+CAMINOS = {
+    "lugar": (Lugar, ("piso_id", "piso__ubicacion_id", "piso__ubicacion__sector_id")),
+    "piso": (Piso, ("ubicacion_id", "ubicacion__sector_id")),
+    "ubicacion": (Ubicacion, ("sector_id",)),
+}
+
+
+# estado -> posición en CAMPOS
+_POS_ESTADO = {"B": CAMPOS.index("buenas"), "P": CAMPOS.index("pendientes"), "M": CAMPOS.index("malas")}
+
+
+def _sumas(qs):
+    return qs.annotate(
+        objetos=Count("id"),
+        total=Sum("cantidad"),
+        buenas=Sum("cantidad", filter=Q(estado="B")),
+        pendientes=Sum("cantidad", filter=Q(estado="P")),
+        malas=Sum("cantidad", filter=Q(estado="M")),
+    )
+
+
+def caminos(nivel, ids):
+    """{nodo_id: (ids de los niveles de arriba)} de los nodos que existen."""
+    modelo, lookups = CAMINOS[nivel]
+    return {r[0]: r[1:] for r in modelo.objects.filter(pk__in=ids).values_list("pk", *lookups)}
+
+
+def _sumar(deltas, nivel, nodo_id, camino, valores, signo=1):
+    """Suma `valores` (alineados con CAMPOS) al nodo y a todo su camino hacia arriba."""
+    niveles = NIVELES[NIVELES.index(nivel):]
+    for n, pk in zip(niveles, (nodo_id,) + tuple(camino)):
+        acc = deltas[(n, pk)]
+        for k, v in enumerate(valores):
+            acc[k] += signo * v
+
+
+def _crear_faltantes(claves):
+    """Crea en cero las filas (nivel, nodo_id) que todavía no existen."""
+    por_nivel = defaultdict(set)
+    for n, pk in claves:
+        por_nivel[n].add(pk)
+    nuevas = []
+    for n, ids in por_nivel.items():
+        existentes = set(
+            ResumenEstado.objects.filter(nivel=n, nodo_id__in=ids).values_list("nodo_id", flat=True)
+        )
+        nuevas += [ResumenEstado(nivel=n, nodo_id=pk) for pk in ids - existentes]
+    if nuevas:
+        ResumenEstado.objects.bulk_create(nuevas, ignore_conflicts=True, batch_size=2000)
+
+
+def _aplicar(deltas):
+    """
+    Suma los deltas {(nivel, nodo_id): [valores]} a sus filas. Un solo UPDATE
+    parametrizado con executemany: una importación toca miles de nodos por
+    lote y armar un F() + CASE por nodo con el ORM cuesta más que la consulta.
+    """
+    deltas = {k: d for k, d in deltas.items() if any(d) and k[1]}
+    if not deltas:
+        return
+    _crear_faltantes(deltas)
+    q = connection.ops.quote_name
+    sql = "UPDATE {} SET {} WHERE {} = %s AND {} = %s".format(
+        q(ResumenEstado._meta.db_table),
+        ", ".join(f"{q(c)} = {q(c)} + %s" for c in CAMPOS),
+        q("nivel"),
+        q("nodo_id"),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(*d, n, pk) for (n, pk), d in deltas.items()])
+
+
+def recalcular_lugares(ids):
+    """Pone al día el resumen de los lugares `ids` y, por diferencia, el de sus padres."""
+    ids = {i for i in ids if i}
+    if not ids:
+        return
+    with transaction.atomic():
+        _crear_faltantes(("lugar", pk) for pk in ids)
+        # bloquea las filas de estos lugares: dos recálculos a la vez no suman dos veces la misma diferencia
+        guardados = {
+            r["nodo_id"]: r
+            for r in ResumenEstado.objects.select_for_update()
+            .filter(nivel="lugar", nodo_id__in=ids)
+            .values("nodo_id", *CAMPOS)
+        }
+        actuales = {
+            r["lugar_id"]: r
+            for r in _sumas(ObjetoLugar.objects.filter(lugar_id__in=ids).values("lugar_id"))
+        }
+        deltas = defaultdict(lambda: [0] * len(CAMPOS))
+        for pk, camino in caminos("lugar", ids).items():
+            nuevo, viejo = actuales.get(pk, {}), guardados.get(pk, {})
+            diferencia = [(nuevo.get(c) or 0) - (viejo.get(c) or 0) for c in CAMPOS]
+            _sumar(deltas, "lugar", pk, camino, diferencia)
+        _aplicar(deltas)
+
+
+def mover(nivel, nodo_id, antes, despues):
+    """El nodo cambió de padre: su resumen sale del camino `antes` y entra al `despues`."""
+    if tuple(antes) == tuple(despues):
+        return
+    fila = ResumenEstado.objects.filter(nivel=nivel, nodo_id=nodo_id).values_list(*CAMPOS).first()
+    if not fila or not any(fila):
+        return
+    deltas = defaultdict(lambda: [0] * len(CAMPOS))
+    arriba = NIVELES[NIVELES.index(nivel) + 1]
+    _sumar(deltas, arriba, antes[0], antes[1:], fila, signo=-1)
+    _sumar(deltas, arriba, despues[0], despues[1:], fila)
+    _aplicar(deltas)
+
+
+def olvidar(nivel, nodo_id):
+    ResumenEstado.objects.filter(nivel=nivel, nodo_id=nodo_id).delete()
+
+
+def sumar_por_nivel(objetos_qs):
+    """
+    {nivel: {nodo_id: [valores alineados con CAMPOS]}} de los ObjetoLugar de
+    `objetos_qs`: una consulta agrupada por (lugar, piso, ubicación, sector,
+    estado) y una pasada en memoria que suma cada grupo en los cuatro niveles.
+    Los objetos sin lugar quedan bajo la clave None en todos los niveles.
+    """
+    out = {n: defaultdict(lambda: [0] * len(CAMPOS)) for n in NIVELES}
+    grupos = (
+        objetos_qs.order_by()
+        .values_list(
+            "lugar_id", "lugar__piso_id", "lugar__piso__ubicacion_id", "lugar__piso__ubicacion__sector_id", "estado",
+        )
+        .annotate(n=Count("id"), cantidad=Sum("cantidad"))
+    )
+    for *camino, estado, n, cantidad in grupos:
+        cantidad = cantidad or 0
+        pos = _POS_ESTADO.get(estado)
+        for nivel, pk in zip(NIVELES, camino):
+            acc = out[nivel][pk]
+            acc[0] += n
+            acc[1] += cantidad
+            if pos is not None:
+                acc[pos] += cantidad
+    return out
+
+
+def reconstruir():
+    """Rehace la tabla entera desde sumar_por_nivel. Devuelve cuántos nodos quedaron."""
+    nuevas = [
+        ResumenEstado(nivel=n, nodo_id=pk, **dict(zip(CAMPOS, d)))
+        for n, nodos in sumar_por_nivel(ObjetoLugar.objects.filter(lugar__isnull=False)).items()
+        for pk, d in nodos.items()
+        if pk
+    ]
+    with transaction.atomic():
+        ResumenEstado.objects.all().delete()
+        ResumenEstado.objects.bulk_create(nuevas, batch_size=2000)
+    return len(nuevas)
+
+
+# ---------- lecturas ----------
+
+def leer(**ids_por_nivel):
+    """
+    Filas {"nodo_id", "total", "buenas", "pendientes", "malas"} de varios
+    niveles en una sola consulta, para _stats_dict_from_rows(..., "nodo_id"):
+    leer(sector=None, ubicacion=[1, 2]) -> {"sector": [...], "ubicacion": [...]}
+    (None = todos los nodos del nivel; ids puede ser un queryset de pks).
+    Solo nodos con objetos, como el GROUP BY de antes.
+    """
+    q = Q()
+    for nivel, ids in ids_por_nivel.items():
+        q |= Q(nivel=nivel) if ids is None else Q(nivel=nivel, nodo_id__in=ids)
+    out = {nivel: [] for nivel in ids_por_nivel}
+    if ids_por_nivel:
+        qs = ResumenEstado.objects.filter(q, objetos__gt=0)
+        for r in qs.values("nivel", "nodo_id", "total", "buenas", "pendientes", "malas"):
+            out[r.pop("nivel")].append(r)
+    return out
+
+
+def filas(nivel, ids=None):
+    return leer(**{nivel: ids})[nivel]
+
+
+def resumen(nivel, nodo_id):
+    """{"total", "buenas", "pendientes", "malas"} de un nodo (ceros si no tiene objetos)."""
+    r = next(iter(filas(nivel, [nodo_id])), None)
+    return {c: (r or {}).get(c) or 0 for c in ("total", "buenas", "pendientes", "malas")}
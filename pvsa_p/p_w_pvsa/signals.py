@@ -0,0 +1,156 @@
+"""
+Mantiene VersionUbicacion al día: cualquier alta, cambio o baja de un Piso,
+Lugar u ObjetoLugar sube la versión de su ubicación (y de la anterior, si se
+movió de ubicación). Lo mismo con los nombres de catálogo que aparecen en
+las hojas del Excel (sector, tipo de lugar, categoría, objeto, tipo).
+
+También mantiene ResumenEstado (cantidades por estado de cada lugar, piso,
+ubicación y sector, ver resumen_estados.py) y la versión del catálogo de los
+combos de filtros (ver catalogo.py).
+
+Los bulk_create / bulk_update / update() no disparan señales: quien los use
+sobre estos modelos llama a cache_exportes.tocar_ubicaciones, a
+resumen_estados.recalcular_lugares y a catalogo.tocar (ver import_from_rows).
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import catalogo, resumen_estados
+from .cache_exportes import tocar_ubicaciones
+from .models import (
+    CategoriaObjeto,
+    Lugar,
+    Objeto,
+    ObjetoLugar,
+    Piso,
+    Sector,
+    TipoLugar,
+    TipoObjeto,
+    Ubicacion,
+)
+
+
+# modelo -> lookup hasta el id de su Ubicacion
+CAMINO_UBICACION = {
+    Piso: "ubicacion_id",
+    Lugar: "piso__ubicacion_id",
+    ObjetoLugar: "lugar__piso__ubicacion_id",
+}
+
+# catálogo -> lookup desde Ubicacion hasta él (ubicaciones cuya hoja lo muestra)
+CAMINO_CATALOGO = {
+    Sector: "sector",
+    TipoLugar: "piso__lugar__lugar_tipo_lugar",
+    CategoriaObjeto: "piso__lugar__objetos_lugar__tipo_de_objeto__objeto__objeto_categoria",
+    Objeto: "piso__lugar__objetos_lugar__tipo_de_objeto__objeto",
+    TipoObjeto: "piso__lugar__objetos_lugar__tipo_de_objeto",
+}
+
+
+def _ubicaciones_de(instance):
+    return set(
+        type(instance).objects
+        .filter(pk=instance.pk)
+        .values_list(CAMINO_UBICACION[type(instance)], flat=True)
+    )
+
+
+def _antes_de_guardar(sender, instance, **kwargs):
+    # si cambia de lugar / piso / ubicación, también cambia la hoja de la que sale
+    instance._ubicaciones_previas = _ubicaciones_de(instance) if instance.pk else set()
+
+
+def _despues_de_guardar(sender, instance, **kwargs):
+    tocar_ubicaciones(getattr(instance, "_ubicaciones_previas", set()) | _ubicaciones_de(instance))
+
+
+def _antes_de_borrar(sender, instance, **kwargs):
+    # antes: después del delete ya no se puede seguir el camino hasta la ubicación
+    tocar_ubicaciones(_ubicaciones_de(instance))
+
+
+for _modelo in CAMINO_UBICACION:
+    pre_save.connect(_antes_de_guardar, sender=_modelo, dispatch_uid=f"version_pre_save_{_modelo.__name__}")
+    post_save.connect(_despues_de_guardar, sender=_modelo, dispatch_uid=f"version_post_save_{_modelo.__name__}")
+    pre_delete.connect(_antes_de_borrar, sender=_modelo, dispatch_uid=f"version_pre_delete_{_modelo.__name__}")
+
+
+@receiver(post_save, sender=Ubicacion, dispatch_uid="version_ubicacion")
+def _ubicacion_guardada(sender, instance, **kwargs):
+    # nombre / sector de la ubicación: van en el título de su hoja
+    tocar_ubicaciones([instance.pk])
+
+
+def _catalogo_guardado(sender, instance, created, **kwargs):
+    if created:
+        return  # nuevo: todavía no aparece en ninguna hoja
+    camino = CAMINO_CATALOGO[sender]
+    tocar_ubicaciones(
+        Ubicacion.objects.filter(**{camino: instance.pk}).values_list("pk", flat=True).distinct()
+    )
+
+
+for _modelo in CAMINO_CATALOGO:
+    post_save.connect(_catalogo_guardado, sender=_modelo, dispatch_uid=f"version_catalogo_{_modelo.__name__}")
+
+
+# ---------- ResumenEstado ----------
+
+@receiver(pre_save, sender=ObjetoLugar, dispatch_uid="resumen_pre_save_objeto_lugar")
+def _objeto_antes_de_guardar(sender, instance, **kwargs):
+    instance._lugar_previo = (
+        ObjetoLugar.objects.filter(pk=instance.pk).values_list("lugar_id", flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=ObjetoLugar, dispatch_uid="resumen_post_save_objeto_lugar")
+def _objeto_guardado(sender, instance, **kwargs):
+    resumen_estados.recalcular_lugares({getattr(instance, "_lugar_previo", None), instance.lugar_id})
+
+
+@receiver(post_delete, sender=ObjetoLugar, dispatch_uid="resumen_post_delete_objeto_lugar")
+def _objeto_borrado(sender, instance, **kwargs):
+    resumen_estados.recalcular_lugares({instance.lugar_id})
+
+
+# nivel de cada modelo del árbol (Sector no tiene padre: solo se olvida al borrarlo)
+NIVEL_RESUMEN = {Lugar: "lugar", Piso: "piso", Ubicacion: "ubicacion"}
+
+
+def _nodo_antes_de_guardar(sender, instance, **kwargs):
+    if instance.pk:
+        instance._camino_previo = resumen_estados.caminos(NIVEL_RESUMEN[sender], [instance.pk]).get(instance.pk)
+
+
+def _nodo_guardado(sender, instance, created, **kwargs):
+    # cambió de padre (p. ej. un lugar movido a otro piso): su resumen se va con él
+    antes = getattr(instance, "_camino_previo", None)
+    if created or antes is None:
+        return
+    nivel = NIVEL_RESUMEN[sender]
+    despues = resumen_estados.caminos(nivel, [instance.pk]).get(instance.pk)
+    if despues is not None:
+        resumen_estados.mover(nivel, instance.pk, antes, despues)
+
+
+def _nodo_borrado(sender, instance, **kwargs):
+    resumen_estados.olvidar(NIVEL_RESUMEN.get(sender, "sector"), instance.pk)
+
+
+for _modelo in NIVEL_RESUMEN:
+    pre_save.connect(_nodo_antes_de_guardar, sender=_modelo, dispatch_uid=f"resumen_pre_save_{_modelo.__name__}")
+    post_save.connect(_nodo_guardado, sender=_modelo, dispatch_uid=f"resumen_post_save_{_modelo.__name__}")
+for _modelo in (*NIVEL_RESUMEN, Sector):
+    post_delete.connect(_nodo_borrado, sender=_modelo, dispatch_uid=f"resumen_post_delete_{_modelo.__name__}")
+
+
+# ---------- catálogo de los combos ----------
+
+def _catalogo_cambiado(sender, **kwargs):
+    catalogo.tocar()
+
+
+for _modelo in catalogo.MODELOS_CATALOGO:
+    post_save.connect(_catalogo_cambiado, sender=_modelo, dispatch_uid=f"catalogo_post_save_{_modelo.__name__}")
+    post_delete.connect(_catalogo_cambiado, sender=_modelo, dispatch_uid=f"catalogo_post_delete_{_modelo.__name__}")
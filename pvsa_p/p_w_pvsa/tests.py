@@ -1,3 +1,382 @@
-from django.test import TestCase
+import json
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .models import (
+    CategoriaObjeto,
+    HistoricoObjeto,
+    Lugar,
+    Objeto,
+    ObjetoLugar,
+    Piso,
+    Sector,
+    TipoLugar,
+    TrabajoImportacion,
+    TipoObjeto,
+    Ubicacion,
+)
+from . import jobs, resumen_estados, views
+from openpyxl import load_workbook
+
+from .excel_utils import OCULTA, VISIBLE, build_excel_sectores, huella_objeto_lugar
+from .views import ImportacionError, _aplicar_ediciones, _stage_rows, import_from_rows, iter_carga_masiva
+
+
+def fila(lugar="Sala 1", objeto="Silla", cantidad=5, estado="Bueno", **extra):
+    """Fila como la deja el parser (columnas de la plantilla de carga masiva)."""
+    return {
+        "sector": "Sector A",
+        "ubicacion": "Edificio 1",
+        "piso": "1",
+        "tipo_de_lugar": "Oficina",
+        "lugar": lugar,
+        "categoria": "Mobiliario",
+        "objeto": objeto,
+        "tipo_objeto": "Marca - Madera",
+        "cantidad": cantidad,
+        "estado": estado,
+        "detalle": "",
+        **extra,
+    }
+
+
+def objeto_lugar(lugar, objeto):
+    return ObjetoLugar.objects.get(lugar__nombre_del_lugar=lugar, tipo_de_objeto__objeto__nombre_del_objeto=objeto)
+
+
+def filas_base():
+    return [fila(lugar, objeto) for lugar in ("Sala 1", "Sala 2") for objeto in ("Silla", "Mesa")]
+
+
+class ImportacionMasivaTests(TestCase):
+    """import_from_rows: dimensiones por _resolver_dimension y ObjetoLugar por _upsert_objetos_lugar."""
+
+    def test_primera_importacion_crea_todo(self):
+        result = import_from_rows(filas_base())
+
+        self.assertEqual(result["created"], 4)
+        self.assertEqual(result["updated"], 0)
+        self.assertEqual(result["unchanged"], 0)
+        self.assertEqual(ObjetoLugar.objects.count(), 4)
+        self.assertEqual(Sector.objects.count(), 1)
+        self.assertEqual(Lugar.objects.count(), 2)
+        self.assertEqual(TipoObjeto.objects.count(), 2)
+        self.assertFalse(HistoricoObjeto.objects.exists())
+
+    def test_reimportar_lo_mismo_queda_sin_cambios(self):
+        import_from_rows(filas_base())
+
+        result = import_from_rows(filas_base())
+
+        self.assertEqual(result, {"created": 0, "updated": 0, "unchanged": 4, "consolidated": 0, "conflicts": 0})
+        self.assertEqual(ObjetoLugar.objects.count(), 4)
+        self.assertFalse(HistoricoObjeto.objects.exists())
+
+    def test_cambio_actualiza_y_deja_un_historico(self):
+        import_from_rows(filas_base())
+        filas = filas_base()
+        filas[0]["cantidad"] = 9
+        filas[3]["estado"] = "Malo"
+
+        result = import_from_rows(filas)
+
+        self.assertEqual((result["created"], result["updated"], result["unchanged"]), (0, 2, 2))
+        silla = objeto_lugar("Sala 1", "Silla")
+        mesa = objeto_lugar("Sala 2", "Mesa")
+        self.assertEqual((silla.cantidad, silla.estado), (9, "B"))
+        self.assertEqual((mesa.cantidad, mesa.estado), (5, "M"))
+
+        historicos = HistoricoObjeto.objects.order_by("objeto_del_lugar_id")
+        self.assertEqual(
+            [(h.objeto_del_lugar_id, h.cantidad_anterior, h.estado_anterior) for h in historicos],
+            sorted([(silla.pk, 5, "B"), (mesa.pk, 5, "B")]),
+        )
+
+    def test_dry_run_no_escribe_nada(self):
+        import_from_rows(filas_base())
+        modelos = (Sector, Ubicacion, Piso, TipoLugar, Lugar, CategoriaObjeto, Objeto, TipoObjeto, ObjetoLugar, HistoricoObjeto)
+        antes = {m: m.objects.count() for m in modelos}
+        filas = filas_base()
+        filas[0]["cantidad"] = 9
+        filas.append(fila(lugar="Bodega", objeto="Estante", sector="Sector B", ubicacion="Edificio 2"))
+
+        result = import_from_rows(filas, dry_run=True)
+
+        self.assertEqual((result["created"], result["updated"], result["unchanged"]), (1, 1, 3))
+        self.assertEqual({m: m.objects.count() for m in modelos}, antes)
+        self.assertEqual(objeto_lugar("Sala 1", "Silla").cantidad, 5)
+
+
+class ImportacionPorTramosTests(TestCase):
+    """chunk_size: commit + checkpoint por tramo, fila culpable y reanudación."""
+
+    MALA = 99  # cantidad que hace fallar el upsert
+
+    def filas(self, mala=True):
+        # 12 filas; la 7 trae un sector nuevo (se crea en el tramo que falla) y la 8 es la mala
+        filas = [fila(lugar=f"Sala {i}") for i in range(1, 13)]
+        filas[6] = fila(lugar="Bodega", sector="Sector B", ubicacion="Edificio 2")
+        if mala:
+            filas[7]["cantidad"] = self.MALA
+        return filas
+
+    def importar(self, filas, **kwargs):
+        return import_from_rows(filas, batch_size=2, chunk_size=4, **kwargs)
+
+    def test_fila_culpable_tramos_confirmados_y_reanudacion(self):
+        # la misma importación sin errores, de una pasada, como referencia
+        with transaction.atomic():
+            esperado = self.importar(self.filas(mala=False))
+            cantidades = sorted(ObjetoLugar.objects.values_list("lugar__nombre_del_lugar", "cantidad"))
+            transaction.set_rollback(True)
+
+        upsert = views._upsert_objetos_lugar
+        lugares_inexistentes = []
+
+        def upsert_que_falla(filas, *args, **kwargs):
+            # con las caches sin limpiar, el reintento fila a fila usaría ids revertidos
+            ids = {f[0] for f in filas}
+            if Lugar.objects.filter(pk__in=ids).count() != len(ids):
+                lugares_inexistentes.append(ids)
+            if any(f[2] == self.MALA for f in filas):
+                raise ValueError("cantidad inválida")
+            return upsert(filas, *args, **kwargs)
+
+        checkpoints = []
+        with mock.patch.object(views, "_upsert_objetos_lugar", upsert_que_falla):
+            with self.assertRaises(ImportacionError) as ctx:
+                self.importar(self.filas(), checkpoint=checkpoints.append)
+
+        self.assertEqual(ctx.exception.fila, 8)
+        self.assertEqual(lugares_inexistentes, [])
+        # el primer tramo quedó confirmado; el que falló (filas 5-8) se revirtió entero
+        self.assertEqual([c["fila"] for c in checkpoints], [4])
+        self.assertEqual(ObjetoLugar.objects.count(), 4)
+        self.assertFalse(Sector.objects.filter(sector="Sector B").exists())
+
+        # reanudar desde el checkpoint (pasado por JSON, como en TrabajoImportacion) con la fila corregida
+        estado = json.loads(json.dumps(checkpoints[-1]))
+        result = self.importar(self.filas(mala=False)[estado["fila"]:], estado=estado)
+
+        self.assertEqual(result, esperado)
+        self.assertEqual(sorted(ObjetoLugar.objects.values_list("lugar__nombre_del_lugar", "cantidad")), cantidades)
+
+
+class CargaMasivaTrabajoTests(TestCase):
+    """Polling del avance de un TrabajoImportacion."""
+
+    def setUp(self):
+        self.trabajo = TrabajoImportacion.objects.create(total_filas=10, error="detalle interno")
+        self.url = reverse("carga_masiva_trabajo", args=[self.trabajo.pk])
+
+    def test_anonimo_no_ve_el_trabajo(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(b"detalle interno", response.content)
+
+    def test_con_sesion_devuelve_el_avance(self):
+        self.client.force_login(User.objects.create_user("operador"))
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], 10)
+
+
+@override_settings(CARGA_MASIVA_PAUSA=0)
+class CargaMasivaStagingTests(TestCase):
+    """Diff de la carga (N / C / I / O / X) y qué filas importa el trabajo."""
+
+    def setUp(self):
+        import_from_rows(filas_base())
+
+    def confirmar(self, carga, primera_editada=None):
+        # el trabajo se corre aquí mismo, no en el executor del proceso
+        with self.captureOnCommitCallbacks(execute=False):
+            trabajo = jobs.encolar_importacion(carga, primera_editada=primera_editada)
+        jobs._ejecutar(trabajo.pk)
+        trabajo.refresh_from_db()
+        return trabajo
+
+    def cambios(self, carga):
+        return dict(carga.filas.values_list("numero", "cambio"))
+
+    def test_clasifica_cada_fila(self):
+        mesa = objeto_lugar("Sala 1", "Mesa")
+        filas = [
+            fila("Sala 1", "Silla"),                     # igual
+            fila("Sala 2", "Silla", cantidad=7),         # cambia
+            fila("Sala 3", "Silla"),                     # nueva
+            fila("Sala 1", objeto=""),                   # omitida (sin objeto)
+            {"id": mesa.pk, "control": huella_objeto_lugar(1, "B", ""), "cantidad": 2, "estado": "Bueno"},  # conflicto
+        ]
+
+        carga = _stage_rows(filas, "csv")
+
+        self.assertEqual(self.cambios(carga), {1: "I", 2: "C", 3: "N", 4: "O", 5: "X"})
+        self.assertEqual(
+            (carga.nuevos, carga.cambios, carga.sin_cambios, carga.omitidas, carga.conflictos),
+            (1, 1, 1, 1, 1),
+        )
+
+    @override_settings(CARGA_MASIVA_CONSOLIDAR="sumar")
+    def test_sumar_incluye_las_iguales(self):
+        # un lote por fila: la primera aparición de la clave queda igual a la BD
+        with mock.patch.object(views, "IMPORT_BATCH_SIZE", 1):
+            carga = _stage_rows([fila("Sala 1", "Silla", cantidad=5), fila("Sala 1", "Silla", cantidad=3)], "csv")
+        self.assertEqual(self.cambios(carga), {1: "I", 2: "C"})
+
+        trabajo = self.confirmar(carga)
+
+        self.assertEqual(trabajo.estado, "T")
+        self.assertEqual(objeto_lugar("Sala 1", "Silla").cantidad, 8)
+
+    def test_fila_editada_se_importa(self):
+        carga = _stage_rows(filas_base(), "csv")
+        self.assertEqual(set(self.cambios(carga).values()), {"I"})
+
+        editadas = _aplicar_ediciones(carga, {"2": {"cantidad": 11}})
+        self.assertEqual(carga.filas.get(numero=2).cambio, "")
+        trabajo = self.confirmar(carga, min(editadas))
+
+        self.assertEqual(trabajo.estado, "T")
+        self.assertEqual(objeto_lugar("Sala 1", "Mesa").cantidad, 11)
+        self.assertEqual(objeto_lugar("Sala 1", "Silla").cantidad, 5)
+
+
+class ConsolidacionTests(TestCase):
+    """Filas repetidas (mismo lugar + tipo de objeto) en lotes distintos."""
+
+    def importar(self, consolidar):
+        import_from_rows(filas_base())
+        filas = [fila("Sala 1", "Silla", cantidad=4), fila("Sala 2", "Mesa"), fila("Sala 1", "Silla", cantidad=6)]
+        return import_from_rows(filas, batch_size=1, consolidar=consolidar)
+
+    def test_ultima(self):
+        result = self.importar("ultima")
+
+        self.assertEqual(result, {"created": 0, "updated": 1, "unchanged": 1, "consolidated": 1, "conflicts": 0})
+        self.assertEqual(objeto_lugar("Sala 1", "Silla").cantidad, 6)
+
+    def test_sumar(self):
+        result = self.importar("sumar")
+
+        self.assertEqual(result, {"created": 0, "updated": 1, "unchanged": 1, "consolidated": 1, "conflicts": 0})
+        self.assertEqual(objeto_lugar("Sala 1", "Silla").cantidad, 10)
+        self.assertEqual(HistoricoObjeto.objects.count(), 1)
+
+
+class ExcelEditableTests(TestCase):
+    """Ida y vuelta del Excel editable: por id de ObjetoLugar y con huella de control."""
+
+    def setUp(self):
+        import_from_rows(filas_base())
+        self.silla = objeto_lugar("Sala 1", "Silla")
+
+    def exportar(self, cantidad=None):
+        """El Excel editable; con `cantidad`, editada en la fila de self.silla."""
+        contenido = build_excel_sectores(Ubicacion.objects.all(), editable=True)
+        if cantidad is not None:
+            wb = load_workbook(BytesIO(contenido))
+            ws = wb.worksheets[0]
+            for row in ws.iter_rows(min_row=1):
+                if row[OCULTA["ID"] - 1].value == self.silla.pk:
+                    row[VISIBLE["CAN"] - 1].value = cantidad
+            salida = BytesIO()
+            wb.save(salida)
+            contenido = salida.getvalue()
+        return SimpleUploadedFile("inventario.xlsx", contenido)
+
+    def reimportar(self, archivo):
+        _, filas = iter_carga_masiva(archivo, workers=1, usar_cache=False)
+        clases = {}
+        result = import_from_rows(filas, clasificar=lambda numero, cambio: clases.__setitem__(numero, cambio))
+        return result, sorted(clases.values())
+
+    def test_fila_cambiada_en_la_bd_queda_en_conflicto(self):
+        archivo = self.exportar(cantidad=9)
+        self.silla.cantidad = 7
+        self.silla.save()
+
+        result, clases = self.reimportar(archivo)
+
+        self.assertEqual(result["conflicts"], 1)
+        self.assertEqual(clases, ["I", "I", "I", "X"])
+        self.silla.refresh_from_db()
+        self.assertEqual(self.silla.cantidad, 7)
+
+    def test_celda_editada_actualiza_por_id(self):
+        archivo = self.exportar(cantidad=9)
+        # por nombres, el archivo ya no calzaría con este lugar (crearía otro)
+        Lugar.objects.filter(nombre_del_lugar="Sala 1").update(nombre_del_lugar="Sala Uno")
+
+        result, clases = self.reimportar(archivo)
+
+        self.assertEqual((result["updated"], result["unchanged"], result["conflicts"]), (1, 3, 0))
+        self.assertEqual(clases, ["C", "I", "I", "I"])
+        self.assertEqual(ObjetoLugar.objects.count(), 4)
+        self.silla.refresh_from_db()
+        self.assertEqual(self.silla.cantidad, 9)
+
+
+class ResumenEstadosTests(TestCase):
+    """ResumenEstado (mantenido por señales e import_from_rows) contra la suma en vivo de ObjetoLugar."""
+
+    # nivel -> lookup desde ObjetoLugar
+    LOOKUPS = {
+        "lugar": "lugar_id",
+        "piso": "lugar__piso_id",
+        "ubicacion": "lugar__piso__ubicacion_id",
+        "sector": "lugar__piso__ubicacion__sector_id",
+    }
+
+    def en_vivo(self, nivel):
+        def suma(estado=None):
+            return Coalesce(Sum("cantidad", filter=Q(estado=estado) if estado else None), 0)
+
+        lookup = self.LOOKUPS[nivel]
+        return {
+            r[lookup]: (r["total"], r["buenas"], r["pendientes"], r["malas"])
+            for r in ObjetoLugar.objects.values(lookup).annotate(
+                total=suma(), buenas=suma("B"), pendientes=suma("P"), malas=suma("M"),
+            )
+        }
+
+    def assertResumenAlDia(self):
+        for nivel in self.LOOKUPS:
+            with self.subTest(nivel=nivel):
+                guardado = {
+                    r["nodo_id"]: (r["total"], r["buenas"], r["pendientes"], r["malas"])
+                    for r in resumen_estados.filas(nivel)
+                }
+                self.assertEqual(guardado, self.en_vivo(nivel))
+
+    def test_resumen_sigue_a_cada_cambio(self):
+        filas = filas_base()
+        filas[1]["estado"] = "Malo"
+        filas.append(fila("Bodega", "Estante", cantidad=3, estado="Pendiente", sector="Sector B", ubicacion="Edificio 2"))
+        import_from_rows(filas)
+        self.assertResumenAlDia()
+
+        silla = objeto_lugar("Sala 1", "Silla")
+        silla.estado = "M"
+        silla.save()
+        self.assertResumenAlDia()
+
+        # Sala 2 pasa al piso de la Bodega (otra ubicación y otro sector)
+        sala = Lugar.objects.get(nombre_del_lugar="Sala 2")
+        sala.piso = Lugar.objects.get(nombre_del_lugar="Bodega").piso
+        sala.save()
+        self.assertResumenAlDia()
+
+        objeto_lugar("Sala 1", "Mesa").delete()
+        self.assertResumenAlDia()
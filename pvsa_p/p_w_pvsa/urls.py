@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
 
     path("excel/sectores/",views.descargar_excel_sectores, name="descargar_excel_sectores"),
+    path("excel/sectores/zip/",views.descargar_zip_sectores, name="descargar_zip_sectores"),
     # Auth
     path("", views.home, name="home"),
     path("signin/", views.signin, name="signin"),
@@ -40,6 +41,7 @@ urlpatterns = [
 
     # OBJETO DEL LUGAR
     path("objetos-lugar/", views.lista_objetos_lugar, name="lista_objetos_lugar"),
+    path("objetos-lugar/exportar/", views.descargar_objetos_lugar_plano, name="descargar_objetos_lugar_plano"),
     path("objetos-lugar/<int:objeto_lugar_id>/", views.detalle_objeto_lugar, name="detalle_objeto_lugar"),
     path("objetos-lugar/<int:objeto_lugar_id>/editar/", views.editar_objeto_lugar, name="editar_objeto_lugar"),
     path("objetos-lugar/<int:objeto_lugar_id>/borrar/", views.borrar_objeto_lugar, name="borrar_objeto_lugar"),
@@ -87,6 +89,7 @@ urlpatterns = [
 
     # RESUMEN
     path("resumen/", views.resumen_general, name="resumen_general"),
+    path("resumen/malos/<int:objeto_id>/", views.resumen_malos, name="resumen_malos"),
 
     path("ajax/ubicaciones-por-sector/",views.ajax_ubicaciones_por_sector,name="ajax_ubicaciones_por_sector",),
     path("ajax/pisos-por-ubicacion/",views.ajax_pisos_por_ubicacion,name="ajax_pisos_por_ubicacion",),
@@ -114,6 +117,9 @@ urlpatterns = [
     path("mapa/ubicacion/<int:ubicacion_id>/quitar-geom/", views.mapa_ubicacion_quitar_geom, name="mapa_ubicacion_quitar_geom"),
 
     path("carga-masiva", views.carga_masiva, name="carga_masiva"),
+    path("carga-masiva/<uuid:token>/filas/", views.carga_masiva_filas, name="carga_masiva_filas"),
+    path("carga-masiva/<uuid:token>/", views.carga_masiva_reanudar, name="carga_masiva_reanudar"),
+    path("carga-masiva/trabajo/<int:trabajo_id>/", views.carga_masiva_trabajo, name="carga_masiva_trabajo"),
     
     path("excel/plantilla-carga-masiva/", views.descargar_plantilla_carga_masiva, name="descargar_plantilla_carga_masiva"),
 
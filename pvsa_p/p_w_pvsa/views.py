@@ -1,7 +1,21 @@
+import base64
+import codecs
+import csv
+import io
 import json
+import multiprocessing
+import os
 import re
+import shutil
+import tempfile
 import unicodedata
-from datetime import date, datetime
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import chain, islice
+from urllib.parse import urlencode
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
@@ -9,12 +23,26 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
 from django.db import transaction
-from django.http import HttpResponse, JsonResponse
-from .excel_utils import build_excel_sectores,  build_excel_plantilla_carga_masiva
-from django.db.models import Sum, Q, Case, When, IntegerField, F, Value
-from django.views.decorators.http import require_GET, require_POST, require_http_methods
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from .excel_utils import (
+    POR_ZIP,
+    build_excel_plantilla_carga_masiva,
+    build_excel_sectores,
+    huella_objeto_lugar,
+    iter_zip_sectores,
+)
+from django.db.models import Count, Sum, Q, Value
+from django.db.models.functions import Coalesce
+from django.views.decorators.http import condition, require_GET, require_POST, require_http_methods
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from django.contrib import messages
 from django.apps import apps
+from django.utils import timezone
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.conf import settings
+import django
 
 
 
@@ -32,8 +60,12 @@ from .models import (
     Sector, Ubicacion, Piso, Lugar, TipoLugar,
     CategoriaObjeto, Objeto, TipoObjeto,
     ObjetoLugar, HistoricoObjeto, TipoLugarObjetoTipico,
-    AreaMapa
+    AreaMapa, CargaMasiva, CargaMasivaFila, TrabajoImportacion
 )
+from .jobs import encolar_importacion, progreso as progreso_importacion
+from . import cache_cargas, cache_exportes, catalogo, resumen_estados
+from .filtros import filtrar_lista_objetos, filtrar_objetos_lugar, leer_filtros, leer_filtros_lista
+from .exporte_plano import FORMATOS_PLANO, iter_plano
 
 import openpyxl 
 from openpyxl import load_workbook
@@ -44,15 +76,96 @@ from openpyxl import load_workbook
 # AUTH
 # -------------------   
 
+def _versiones_excel_sectores(request):
+    """
+    (filtros, {ubicacion_id: (version, modificado)}) de todas las hojas que
+    puede traer el Excel con estos filtros. Se calcula una vez por request
+    (la usan el ETag y el Last-Modified).
+    """
+    if not hasattr(request, "_versiones_excel"):
+        filtros = leer_filtros(request.GET)
+        ubicaciones = Ubicacion.objects.all()
+        if filtros["sector"]:
+            ubicaciones = ubicaciones.filter(sector_id=filtros["sector"])
+        if filtros["ubicacion"]:
+            ubicaciones = ubicaciones.filter(pk=filtros["ubicacion"])
+        ids = list(ubicaciones.values_list("pk", flat=True))
+        request._versiones_excel = (filtros, cache_exportes.versiones(ids))
+    return request._versiones_excel
+
+
+def _excel_editable(request):
+    return request.GET.get("editable") == "1"
+
+
+def _etag_excel_sectores(request):
+    filtros, vers = _versiones_excel_sectores(request)
+    extra = sorted((k, v) for k, v in filtros.items() if v)
+    if _excel_editable(request):
+        extra.append(("editable", "1"))
+    return cache_exportes.etag(vers, urlencode(extra))
+
+
+def _modificado_excel_sectores(request):
+    return cache_exportes.ultima_modificacion(_versiones_excel_sectores(request)[1])
+
+
 @login_required
+@condition(etag_func=_etag_excel_sectores, last_modified_func=_modificado_excel_sectores)
 def descargar_excel_sectores(request):
+    """
+    Excel del puerto. Acepta los mismos filtros GET que resumen_general
+    (?sector=&estado=M...): solo salen las hojas, pisos, lugares y objetos
+    que calzan (ver build_excel_sectores).
+    Lleva ETag / Last-Modified según la versión de datos de cada ubicación:
+    si nada cambió desde la última descarga, el navegador recibe un 304.
+    Con ?editable=1 cada fila de objeto lleva su id y un control en columnas
+    ocultas: al volver a subirlo por carga masiva se actualiza por id.
+    """
     ubicaciones = Ubicacion.objects.select_related("sector").order_by("sector__sector","ubicacion")
-    xlsx_bytes = build_excel_sectores(ubicaciones)
+    filtros = leer_filtros(request.GET)
+    editable = _excel_editable(request)
+
+    # el .xlsx se arma en un archivo temporal (write-only) y se sirve por partes;
+    # FileResponse lo cierra al terminar y el temporal se borra solo
+    tmp = tempfile.TemporaryFile(suffix=".xlsx")
+    try:
+        build_excel_sectores(ubicaciones, tmp, filtros, editable=editable)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
 
     hoy =date.today().strftime("%d-%m-%Y")
-    filename= f'PUERTO_{hoy}.xlsx'
-    response = HttpResponse(xlsx_bytes, content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    response["Content-Disposition"]= f'attachment; filename= "{filename}"'
+    filename= f'PUERTO_EDITABLE_{hoy}.xlsx' if editable else f'PUERTO_{hoy}.xlsx'
+    response = FileResponse(
+        tmp,
+        as_attachment=True,
+        filename=filename,
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+    # que el navegador lo guarde pero pregunte siempre (If-None-Match -> 304)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+def descargar_zip_sectores(request):
+    """
+    Exportación masiva: un .xlsx por ubicación (?por=sector: uno por sector)
+    en un .zip, generados en paralelo (EXPORTE_ZIP_WORKERS procesos) y
+    enviados a medida que quedan listos. Acepta los filtros de resumen_general.
+    """
+    por = request.GET.get("por") or "ubicacion"
+    if por not in POR_ZIP:
+        por = "ubicacion"
+    ubicaciones = Ubicacion.objects.select_related("sector").order_by("sector__sector","ubicacion")
+
+    hoy = date.today().strftime("%d-%m-%Y")
+    response = StreamingHttpResponse(
+        iter_zip_sectores(ubicaciones, por, leer_filtros(request.GET)),
+        content_type="application/zip",
+    )
+    response["Content-Disposition"] = f'attachment; filename="PUERTO_{por}_{hoy}.zip"'
     return response
 
 @login_required
@@ -645,12 +758,10 @@ def lista_lugares(request):
     )
 
     # combos
-    ubicaciones = Ubicacion.objects.select_related("sector").all().order_by("ubicacion")
+    cat = catalogo.actual()
+    ubicaciones = cat.ubicaciones_por_nombre
     # OJO: aquí mandamos **todos** los pisos; el JS se encarga de filtrarlos en el combo
-    pisos = Piso.objects.select_related("ubicacion").all().order_by(
-        "ubicacion__ubicacion",
-        "piso",
-    )
+    pisos = cat.pisos
 
     return render(
         request,
@@ -739,10 +850,7 @@ def borrar_lugar(request, lugar_id):
 
 @login_required
 def lista_objetos_lugar(request):
-    lugar_id = request.GET.get("lugar", "").strip()
-    objeto_id = request.GET.get("objeto", "").strip()
-    tipo_id = request.GET.get("tipo", "").strip()
-    estado_val = request.GET.get("estado", "").strip()
+    filtros = leer_filtros_lista(request.GET)
 
     qs = ObjetoLugar.objects.select_related(
         "lugar",
@@ -754,27 +862,8 @@ def lista_objetos_lugar(request):
         "tipo_de_objeto__objeto__objeto_categoria",
     ).all()
 
-    # Filtros
-    if lugar_id:
-        try:
-            qs = qs.filter(lugar_id=int(lugar_id))
-        except ValueError:
-            lugar_id = ""
-
-    if objeto_id:
-        try:
-            qs = qs.filter(tipo_de_objeto__objeto_id=int(objeto_id))
-        except ValueError:
-            objeto_id = ""
-
-    if tipo_id:
-        try:
-            qs = qs.filter(tipo_de_objeto_id=int(tipo_id))
-        except ValueError:
-            tipo_id = ""
-
-    if estado_val:
-        qs = qs.filter(estado=estado_val)
+    # Filtros (los mismos que el export plano, ver filtros.py)
+    qs = filtrar_lista_objetos(qs, filtros)
 
     objetos_lugar = qs.order_by(
         "lugar__piso__ubicacion__ubicacion",
@@ -783,32 +872,11 @@ def lista_objetos_lugar(request):
         "tipo_de_objeto__objeto__nombre_del_objeto",
     )
 
-    # Datos para los combos
-    lugares = (
-        Lugar.objects.select_related(
-            "piso",
-            "piso__ubicacion",
-            "piso__ubicacion__sector",
-        )
-        .all()
-        .order_by(
-            "piso__ubicacion__ubicacion",
-            "piso__piso",
-            "nombre_del_lugar",
-        )
-    )
-
-    objetos = (
-        Objeto.objects.select_related("objeto_categoria")
-        .all()
-        .order_by("objeto_categoria__nombre_de_categoria", "nombre_del_objeto")
-    )
-
-    tipos = (
-        TipoObjeto.objects.select_related("objeto", "objeto__objeto_categoria")
-        .all()
-        .order_by("objeto__nombre_del_objeto", "marca", "material")
-    )
+    # Datos para los combos (copia compartida, ver catalogo.py)
+    cat = catalogo.actual()
+    lugares = cat.lugares
+    objetos = cat.objetos
+    tipos = cat.tipos_objeto
 
     # choices del modelo (por ejemplo [("B", "Bueno"), ...])
     estados = ObjetoLugar.ESTADO
@@ -822,14 +890,34 @@ def lista_objetos_lugar(request):
             "objetos_catalogo": objetos,
             "tipos": tipos,
             "estados": estados,
-            "lugar_actual": lugar_id,
-            "objeto_actual": objeto_id,
-            "tipo_actual": tipo_id,
-            "estado_actual": estado_val,
+            "lugar_actual": filtros["lugar"],
+            "objeto_actual": filtros["objeto"],
+            "tipo_actual": filtros["tipo"],
+            "estado_actual": filtros["estado"],
+            "filtros_query": urlencode({k: v for k, v in filtros.items() if v}),
         },
     )
 
 
+@login_required
+def descargar_objetos_lugar_plano(request):
+    """
+    Inventario completo como tabla plana (una fila por objeto en un lugar)
+    para BI: ?formato=csv (default) o jsonl. Acepta los filtros de
+    lista_objetos_lugar (?lugar=&objeto=&tipo=&estado=) y se envía en
+    streaming, con memoria constante (ver exporte_plano).
+    """
+    formato = request.GET.get("formato") or "csv"
+    if formato not in FORMATOS_PLANO:
+        formato = "csv"
+    qs = filtrar_lista_objetos(ObjetoLugar.objects.all(), leer_filtros_lista(request.GET))
+
+    hoy = date.today().strftime("%d-%m-%Y")
+    response = StreamingHttpResponse(iter_plano(qs, formato), content_type=FORMATOS_PLANO[formato])
+    response["Content-Disposition"] = f'attachment; filename="INVENTARIO_{hoy}.{formato}"'
+    return response
+
+
 @login_required
 def detalle_objeto_lugar(request, objeto_lugar_id):
     obj = get_object_or_404(ObjetoLugar, pk=objeto_lugar_id)
@@ -1268,13 +1356,11 @@ def lista_tipos_objeto(request):
     )
 
     # ===== combos =====
-    categorias = CategoriaObjeto.objects.all().order_by("nombre_de_categoria")
+    cat = catalogo.actual()
+    categorias = cat.categorias
 
     # mandamos TODOS los objetos, el JS se encarga de mostrar sólo los de la categoría elegida
-    objetos = Objeto.objects.select_related("objeto_categoria").all().order_by(
-        "objeto_categoria__nombre_de_categoria",
-        "nombre_del_objeto",
-    )
+    objetos = cat.objetos
 
     return render(
         request,
@@ -1411,32 +1497,11 @@ def lista_historicos(request):
         "objeto_del_lugar__lugar__nombre_del_lugar",
     )
 
-    # ---- datos para los combos ----
-    lugares = (
-        Lugar.objects.select_related(
-            "piso",
-            "piso__ubicacion",
-            "piso__ubicacion__sector",
-        )
-        .all()
-        .order_by(
-            "piso__ubicacion__ubicacion",
-            "piso__piso",
-            "nombre_del_lugar",
-        )
-    )
-
-    objetos = (
-        Objeto.objects.select_related("objeto_categoria")
-        .all()
-        .order_by("objeto_categoria__nombre_de_categoria", "nombre_del_objeto")
-    )
-
-    tipos = (
-        TipoObjeto.objects.select_related("objeto", "objeto__objeto_categoria")
-        .all()
-        .order_by("objeto__nombre_del_objeto", "marca", "material")
-    )
+    # ---- datos para los combos (copia compartida, ver catalogo.py) ----
+    cat = catalogo.actual()
+    lugares = cat.lugares
+    objetos = cat.objetos
+    tipos = cat.tipos_objeto
 
     # choices del campo estado_anterior
     estados = HistoricoObjeto._meta.get_field("estado_anterior").choices
@@ -1562,98 +1627,77 @@ def _add_percentages(rows):
     return rows
 
 
+def _filas_resumen_general(por_sector, por_ubicacion):
+    """
+    Filas de las tablas "por sector" y "por ubicación" de resumen_general
+    (mismas llaves y orden que el values().annotate() de antes) a partir de
+    resumen_estados.sumar_por_nivel.
+    """
+    def _sumas(v):
+        return {"total": v[1], "buenas": v[2], "pendientes": v[3], "malas": v[4]}
+
+    sectores = dict(Sector.objects.filter(pk__in=[k for k in por_sector if k]).values_list("pk", "sector"))
+    ubicaciones = {
+        pk: (nombre, sector)
+        for pk, nombre, sector in Ubicacion.objects.filter(pk__in=[k for k in por_ubicacion if k])
+        .values_list("pk", "ubicacion", "sector__sector")
+    }
+    filas_sector = [
+        {
+            "lugar__piso__ubicacion__sector__id": pk,
+            "lugar__piso__ubicacion__sector__sector": sectores.get(pk),
+            **_sumas(v),
+        }
+        for pk, v in por_sector.items()
+    ]
+    filas_ubic = [
+        {
+            "lugar__piso__ubicacion__id": pk,
+            "lugar__piso__ubicacion__ubicacion": ubicaciones.get(pk, (None, None))[0],
+            "lugar__piso__ubicacion__sector__sector": ubicaciones.get(pk, (None, None))[1],
+            **_sumas(v),
+        }
+        for pk, v in por_ubicacion.items()
+    ]
+    # como el ORDER BY de SQLite: los sin lugar (None) primero
+    filas_sector.sort(key=lambda r: (r["lugar__piso__ubicacion__sector__sector"] is not None,
+                                     r["lugar__piso__ubicacion__sector__sector"] or ""))
+    filas_ubic.sort(key=lambda r: (r["lugar__piso__ubicacion__sector__sector"] is not None,
+                                   r["lugar__piso__ubicacion__sector__sector"] or "",
+                                   r["lugar__piso__ubicacion__ubicacion"] or ""))
+    return filas_sector, filas_ubic
+
+
 def resumen_general(request):
     # ----------------------
     # 1) Leer filtros del GET
     # ----------------------
-    sector_id = request.GET.get("sector") or None
-    ubicacion_id = request.GET.get("ubicacion") or None
-    piso_id = request.GET.get("piso") or None
-    tipo_lugar_id = request.GET.get("tipo_lugar") or None
-    categoria_id = request.GET.get("categoria") or None
-    objeto_id = request.GET.get("objeto") or None
-    tipo_objeto_id = request.GET.get("tipo_objeto") or None
-    estado = request.GET.get("estado") or None
-    marca = request.GET.get("marca") or None
-    material = request.GET.get("material") or None
+    filtros = leer_filtros(request.GET)
+    sector_id = filtros["sector"]
+    ubicacion_id = filtros["ubicacion"]
+    piso_id = filtros["piso"]
+    tipo_lugar_id = filtros["tipo_lugar"]
+    categoria_id = filtros["categoria"]
+    objeto_id = filtros["objeto"]
+    tipo_objeto_id = filtros["tipo_objeto"]
+    estado = filtros["estado"]
+    marca = filtros["marca"]
+    material = filtros["material"]
 
     # ----------------------
     # 2) Base de datos filtrada
     # ----------------------
-    base_qs = ObjetoLugar.objects.select_related(
-        "lugar",
-        "lugar__piso",
-        "lugar__piso__ubicacion",
-        "lugar__piso__ubicacion__sector",
-        "lugar__lugar_tipo_lugar",
-        "tipo_de_objeto",
-        "tipo_de_objeto__objeto",
-        "tipo_de_objeto__objeto__objeto_categoria",
-    )
-
-    if sector_id:
-        base_qs = base_qs.filter(lugar__piso__ubicacion__sector_id=sector_id)
-    if ubicacion_id:
-        base_qs = base_qs.filter(lugar__piso__ubicacion_id=ubicacion_id)
-    if piso_id:
-        base_qs = base_qs.filter(lugar__piso_id=piso_id)
-    if tipo_lugar_id:
-        base_qs = base_qs.filter(lugar__lugar_tipo_lugar_id=tipo_lugar_id)
-    if categoria_id:
-        base_qs = base_qs.filter(
-            tipo_de_objeto__objeto__objeto_categoria_id=categoria_id
-        )
-    if objeto_id:
-        base_qs = base_qs.filter(tipo_de_objeto__objeto_id=objeto_id)
-    if tipo_objeto_id:
-        base_qs = base_qs.filter(tipo_de_objeto_id=tipo_objeto_id)
-    if estado:
-        base_qs = base_qs.filter(estado=estado)
-    if marca:
-        base_qs = base_qs.filter(tipo_de_objeto__marca=marca)
-    if material:
-        base_qs = base_qs.filter(tipo_de_objeto__material=material)
+    # solo consultas agregadas: el detalle de los malos va aparte (resumen_malos)
+    base_qs = filtrar_objetos_lugar(ObjetoLugar.objects.all(), filtros)
 
     # ----------------------
-    # 3) Resumen por sector
+    # 3) y 4) Resumen por sector y por ubicación
     # ----------------------
-    qs_sector = (
-        base_qs.values(
-            "lugar__piso__ubicacion__sector__id",
-            "lugar__piso__ubicacion__sector__sector",
-        )
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum("cantidad", filter=Q(estado="B")),
-            pendientes=Sum("cantidad", filter=Q(estado="P")),
-            malas=Sum("cantidad", filter=Q(estado="M")),
-        )
-        .order_by("lugar__piso__ubicacion__sector__sector")
-    )
-    resumen_sector = list(qs_sector)
+    # una sola pasada sobre los objetos filtrados (agrupada por lugar y estado)
+    # y los totales de cada sector / ubicación se suman en memoria
+    por_nivel = resumen_estados.sumar_por_nivel(base_qs)
+    resumen_sector, resumen_ubic = _filas_resumen_general(por_nivel["sector"], por_nivel["ubicacion"])
     _add_percentages(resumen_sector)
-
-    # ----------------------
-    # 4) Resumen por ubicación
-    # ----------------------
-    qs_ubic = (
-        base_qs.values(
-            "lugar__piso__ubicacion__id",
-            "lugar__piso__ubicacion__ubicacion",
-            "lugar__piso__ubicacion__sector__sector",
-        )
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum("cantidad", filter=Q(estado="B")),
-            pendientes=Sum("cantidad", filter=Q(estado="P")),
-            malas=Sum("cantidad", filter=Q(estado="M")),
-        )
-        .order_by(
-            "lugar__piso__ubicacion__sector__sector",
-            "lugar__piso__ubicacion__ubicacion",
-        )
-    )
-    resumen_ubic = list(qs_ubic)
     _add_percentages(resumen_ubic)
 
     # ----------------------
@@ -1669,36 +1713,13 @@ def resumen_general(request):
             buenas=Sum("cantidad", filter=Q(estado="B")),
             pendientes=Sum("cantidad", filter=Q(estado="P")),
             malas=Sum("cantidad", filter=Q(estado="M")),
+            filas_malas=Count("id", filter=Q(estado="M")),
         )
         .order_by("tipo_de_objeto__objeto__nombre_del_objeto")
     )
     resumen_obj = list(qs_obj)
     _add_percentages(resumen_obj)
 
-    # Objetos en estado malo, para el detalle por objeto
-    malos_qs = (
-        base_qs.filter(estado="M")
-        .select_related(
-            "lugar__piso__ubicacion__sector",
-            "lugar__piso__ubicacion",
-            "lugar__piso",
-            "lugar",
-            "tipo_de_objeto__objeto",
-        )
-        .order_by(
-            "tipo_de_objeto__objeto__nombre_del_objeto",
-            "lugar__piso__ubicacion__sector__sector",
-            "lugar__piso__ubicacion__ubicacion",
-            "lugar__piso__piso",
-            "lugar__nombre_del_lugar",
-        )
-    )
-
-    malos_por_objeto = {}
-    for ol in malos_qs:
-        oid = ol.tipo_de_objeto.objeto_id
-        malos_por_objeto.setdefault(oid, []).append(ol)
-
     resumen_objetos = []
     for r in resumen_obj:
         oid = r["tipo_de_objeto__objeto__id"]
@@ -1713,54 +1734,31 @@ def resumen_general(request):
                 "pct_buenas": r["pct_buenas"],
                 "pct_pendientes": r["pct_pendientes"],
                 "pct_malas": r["pct_malas"],
-                "malos": malos_por_objeto.get(oid, []),
+                # cuántas filas en estado malo: el detalle se pide al expandir (resumen_malos)
+                "filas_malas": r["filas_malas"],
             }
         )
 
     # ----------------------
-    # 6) Datos para los combos de filtros
+    # 6) Datos para los combos de filtros (copia compartida, ver catalogo.py)
     # ----------------------
-    sectores = Sector.objects.order_by("sector")
-    ubicaciones = Ubicacion.objects.select_related("sector").order_by(
-        "sector__sector", "ubicacion"
-    )
-    pisos = Piso.objects.select_related("ubicacion").order_by(
-        "ubicacion__ubicacion", "piso"
-    )
-    tipos_lugar = TipoLugar.objects.order_by("tipo_de_lugar")
-    categorias = CategoriaObjeto.objects.order_by("nombre_de_categoria")
-    objetos_catalogo = Objeto.objects.select_related("objeto_categoria").order_by(
-        "nombre_del_objeto"
-    )
-    tipos_objeto = TipoObjeto.objects.select_related("objeto").order_by(
-        "objeto__nombre_del_objeto", "marca", "material"
-    )
-
-    # NUEVO: marcas y materiales únicos
-    marcas = (
-        TipoObjeto.objects.exclude(Q(marca__isnull=True) | Q(material__exact="")).values_list("marca", flat=True).distinct().order_by("marca")
-    )
-    materiales = (
-        TipoObjeto.objects.exclude(Q(material__isnull=True) | Q(material__exact="")).values_list("material", flat=True).distinct().order_by("material")
-    )
-
-    estados = ObjetoLugar.ESTADO
+    cat = catalogo.actual()
 
     contexto = {
         "resumen_sector": resumen_sector,
         "resumen_ubic": resumen_ubic,
         "resumen_objetos": resumen_objetos,
         # combos
-        "sectores": sectores,
-        "ubicaciones": ubicaciones,
-        "pisos": pisos,
-        "tipos_lugar": tipos_lugar,
-        "categorias": categorias,
-        "objetos_catalogo": objetos_catalogo,
-        "tipos_objeto": tipos_objeto,
-        "estados": estados,
-        "marcas": marcas,
-        "materiales": materiales,
+        "sectores": cat.sectores,
+        "ubicaciones": cat.ubicaciones,
+        "pisos": cat.pisos,
+        "tipos_lugar": cat.tipos_lugar,
+        "categorias": cat.categorias,
+        "objetos_catalogo": cat.objetos_por_nombre,
+        "tipos_objeto": cat.tipos_objeto,
+        "estados": ObjetoLugar.ESTADO,
+        "marcas": cat.marcas,
+        "materiales": cat.materiales,
         # valores seleccionados
         "sector_actual": sector_id or "",
         "ubicacion_actual": ubicacion_id or "",
@@ -1772,11 +1770,98 @@ def resumen_general(request):
         "estado_actual": estado or "",
         "marca_actual": marca or "",
         "material_actual": material or "",
+        # mismo recorte para el Excel
+        "filtros_query": urlencode({k: v for k, v in filtros.items() if v}),
     }
 
     return render(request, "resumen/resumen_general.html", contexto)
 
 
+RESUMEN_MALOS_PAGE_SIZE = 50
+
+# orden del detalle de malos (= llaves del cursor); sin lugar, los nombres
+# son NULL: se comparan como "" / piso mínimo para que el cursor funcione igual
+ORDEN_MALOS = (
+    ("k_sector", Coalesce("lugar__piso__ubicacion__sector__sector", Value(""))),
+    ("k_ubicacion", Coalesce("lugar__piso__ubicacion__ubicacion", Value(""))),
+    ("k_piso", Coalesce("lugar__piso__piso", Value(-32768))),
+    ("k_lugar", Coalesce("lugar__nombre_del_lugar", Value(""))),
+)
+
+
+def _cursor_malos(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+def _leer_cursor_malos(cursor):
+    """Llaves (ORDEN_MALOS + id) de la última fila entregada, o None si no hay / no es válido."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != len(ORDEN_MALOS) + 1:
+        return None
+    return valores
+
+
+def _despues_de(campos, valores):
+    """Q de las filas que van después de `valores` en el orden (campos...) ascendente."""
+    q = Q(**{f"{campos[-1]}__gt": valores[-1]})
+    for campo, valor in zip(reversed(campos[:-1]), reversed(valores[:-1])):
+        q = Q(**{f"{campo}__gt": valor}) | (Q(**{campo: valor}) & q)
+    return q
+
+
+@require_GET
+def resumen_malos(request, objeto_id):
+    """
+    Detalle de resumen_general: filas en estado Malo de un objeto, con los
+    mismos filtros GET. Paginado por cursor (?cursor= de la respuesta
+    anterior): cada página sigue desde la última fila por índice, sin OFFSET.
+    """
+    filtros = leer_filtros(request.GET)
+    qs = filtrar_objetos_lugar(
+        ObjetoLugar.objects.filter(estado="M", tipo_de_objeto__objeto_id=objeto_id), filtros
+    ).annotate(**dict(ORDEN_MALOS))
+    campos = [k for k, _ in ORDEN_MALOS] + ["id"]
+
+    cursor = request.GET.get("cursor") or ""
+    if cursor:
+        valores = _leer_cursor_malos(cursor)
+        if valores is None:
+            return JsonResponse({"error": "cursor inválido"}, status=400)
+        qs = qs.filter(_despues_de(campos, valores))
+
+    filas = list(
+        qs.order_by(*campos).values_list(
+            *campos,
+            "lugar__piso__ubicacion__sector__sector",
+            "lugar__piso__ubicacion__ubicacion",
+            "lugar__piso__piso",
+            "lugar__nombre_del_lugar",
+            "cantidad",
+        )[:RESUMEN_MALOS_PAGE_SIZE + 1]
+    )
+    hay_mas = len(filas) > RESUMEN_MALOS_PAGE_SIZE
+    filas = filas[:RESUMEN_MALOS_PAGE_SIZE]
+    n = len(campos)
+
+    return JsonResponse({
+        "filas": [
+            {
+                "id": f[n - 1],
+                "sector": f[n] or "",
+                "ubicacion": f[n + 1] or "",
+                "piso": "" if f[n + 2] is None else f[n + 2],
+                "lugar": f[n + 3] or "",
+                "cantidad": f[n + 4],
+            }
+            for f in filas
+        ],
+        "siguiente": _cursor_malos(list(filas[-1][:n])) if hay_mas else None,
+    })
+
+
     # -------------------------
 # AJAX: combos dependientes
 # -------------------------
@@ -2050,19 +2135,9 @@ def _color_por_pct_malas(total, pct_malas):
     return "#22c55e"      # verde
 
 
-def _resumen_sector_dict():
-    qs = (
-        ObjetoLugar.objects
-        .values("lugar__piso__ubicacion__sector_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum("cantidad", filter=Q(estado="B")),
-            pendientes=Sum("cantidad", filter=Q(estado="P")),
-            malas=Sum("cantidad", filter=Q(estado="M")),
-        )
-    )
+def _resumen_dict(nivel):
     d = {}
-    for r in qs:
+    for r in resumen_estados.filas(nivel):
         total = r["total"] or 0
         malas = r["malas"] or 0
         pendientes = r["pendientes"] or 0
@@ -2070,7 +2145,7 @@ def _resumen_sector_dict():
         pct_malas = round(malas * 100 / total, 1) if total else 0
         pct_pend = round(pendientes * 100 / total, 1) if total else 0
         pct_bue = round(buenas * 100 / total, 1) if total else 0
-        d[r["lugar__piso__ubicacion__sector_id"]] = {
+        d[r["nodo_id"]] = {
             "total": total,
             "pct_malas": pct_malas,
             "pct_pendientes": pct_pend,
@@ -2079,33 +2154,12 @@ def _resumen_sector_dict():
     return d
 
 
+def _resumen_sector_dict():
+    return _resumen_dict("sector")
+
+
 def _resumen_ubicacion_dict():
-    qs = (
-        ObjetoLugar.objects
-        .values("lugar__piso__ubicacion_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum("cantidad", filter=Q(estado="B")),
-            pendientes=Sum("cantidad", filter=Q(estado="P")),
-            malas=Sum("cantidad", filter=Q(estado="M")),
-        )
-    )
-    d = {}
-    for r in qs:
-        total = r["total"] or 0
-        malas = r["malas"] or 0
-        pendientes = r["pendientes"] or 0
-        buenas = r["buenas"] or 0
-        pct_malas = round(malas * 100 / total, 1) if total else 0
-        pct_pend = round(pendientes * 100 / total, 1) if total else 0
-        pct_bue = round(buenas * 100 / total, 1) if total else 0
-        d[r["lugar__piso__ubicacion_id"]] = {
-            "total": total,
-            "pct_malas": pct_malas,
-            "pct_pendientes": pct_pend,
-            "pct_buenas": pct_bue,
-        }
-    return d
+    return _resumen_dict("ubicacion")
 
 def _feature(kind, obj, geom, extra_props=None):
     props = {
@@ -2129,16 +2183,11 @@ def _feature(kind, obj, geom, extra_props=None):
 
 @login_required
 def mapa_editor_crear(request):
-    sectores = Sector.objects.all().order_by("sector")
-    ubicaciones = Ubicacion.objects.select_related("sector").all().order_by("sector__sector", "ubicacion")
-
-    lugares_movil = (
-        Lugar.objects.select_related("piso__ubicacion__sector", "lugar_tipo_lugar")
-        .filter(piso__piso=0, piso__ubicacion__ubicacion__icontains="MODULOS")
-
-        .order_by("piso__ubicacion__sector__sector", "nombre_del_lugar")
-    )
-    tipos_lugar = TipoLugar.objects.all().order_by("tipo_de_lugar")
+    cat = catalogo.actual()
+    sectores = cat.sectores
+    ubicaciones = cat.ubicaciones
+    lugares_movil = cat.lugares_movil
+    tipos_lugar = cat.tipos_lugar
 
     return render(
         request,
@@ -2157,16 +2206,12 @@ def mapa_editor_crear(request):
 @login_required
 def mapa_sector_editar_geom(request, sector_id):
     s = get_object_or_404(Sector, pk=sector_id)
-    sectores = Sector.objects.order_by("sector")
-    ubicaciones = Ubicacion.objects.select_related("sector").order_by("sector__sector", "ubicacion")
-
+    # los combos del editor solo se muestran en modo "crear" (ver mapa_editor_crear)
     return render(
         request,
         "mapa/mapa_editor.html",
         {
             "modo": "editar",
-            "sectores": sectores,
-            "ubicaciones": ubicaciones,
             "editar_tipo": "sector",
             "editar_id": s.id,
             "obj_label": f"Sector: {s.sector}",
@@ -2189,20 +2234,6 @@ def mapa_sector_detalle(request, sector_id):
         .order_by("ubicacion")
     )
 
-    # STATS POR UBICACION (dentro del sector)
-    ubic_rows = (
-        ObjetoLugar.objects
-        .filter(lugar__isnull=False, lugar__piso__ubicacion__sector_id=sector.id)
-        .values("lugar__piso__ubicacion_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum("cantidad", filter=Q(estado="B")),
-            pendientes=Sum("cantidad", filter=Q(estado="P")),
-            malas=Sum("cantidad", filter=Q(estado="M")),
-        )
-    )
-    stats_ubic = _stats_dict_from_rows(ubic_rows, "lugar__piso__ubicacion_id")
-
     # LUGARES MÓVILES CON POLÍGONO (en el sector)
     todos_lugares_sector = (
         Lugar.objects.select_related("piso__ubicacion__sector", "lugar_tipo_lugar")
@@ -2212,19 +2243,9 @@ def mapa_sector_detalle(request, sector_id):
     moviles = [l for l in todos_lugares_sector if _is_movil_lugar(l)]
     moviles.sort(key=lambda x: (x.nombre_del_lugar or "").lower())
 
-    # STATS POR LUGAR (para móviles)
-    lugar_rows = (
-        ObjetoLugar.objects
-        .filter(lugar__isnull=False, lugar__piso__ubicacion__sector_id=sector.id)
-        .values("lugar_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum("cantidad", filter=Q(estado="B")),
-            pendientes=Sum("cantidad", filter=Q(estado="P")),
-            malas=Sum("cantidad", filter=Q(estado="M")),
-        )
-    )
-    stats_lugar = _stats_dict_from_rows(lugar_rows, "lugar_id")
+    # STATS POR UBICACION (dentro del sector) Y POR LUGAR (móviles): una consulta a ResumenEstado
+    stats = _stats_por_nivel(ubicacion=ubic_qs.values("pk"), lugar=[l.id for l in moviles])
+    stats_ubic, stats_lugar = stats["ubicacion"], stats["lugar"]
 
     features = []
 
@@ -2296,21 +2317,6 @@ def mapa_sector_detalle(request, sector_id):
     })
 
 
-def _stats_lugar_dict():
-    rows = (
-        ObjetoLugar.objects
-        .filter(lugar__isnull=False)
-        .values("lugar_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum(Case(When(estado="B", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-            pendientes=Sum(Case(When(estado="P", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-            malas=Sum(Case(When(estado="M", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-        )
-    )
-    return _stats_dict_from_rows(rows, "lugar_id")
-
-
 def _stats_dict_from_rows(rows, key_field: str):
     out = {}
     for r in rows:
@@ -2344,16 +2350,12 @@ def _stats_dict_from_rows(rows, key_field: str):
 @login_required
 def mapa_ubicacion_editar_geom(request, ubicacion_id):
     u = get_object_or_404(Ubicacion.objects.select_related("sector"), pk=ubicacion_id)
-    sectores = Sector.objects.order_by("sector")
-    ubicaciones = Ubicacion.objects.select_related("sector").order_by("sector__sector", "ubicacion")
-
+    # los combos del editor solo se muestran en modo "crear" (ver mapa_editor_crear)
     return render(
         request,
         "mapa/mapa_editor.html",
         {
             "modo": "editar",
-            "sectores": sectores,
-            "ubicaciones": ubicaciones,
             "editar_tipo": "ubicacion",
             "editar_id": u.id,
             "obj_label": f"Ubicación: {u.ubicacion} (Sector {u.sector.sector})",
@@ -2368,17 +2370,15 @@ def mapa_ubicacion_detalle(request, ubicacion_id):
     ubicacion = get_object_or_404(Ubicacion.objects.select_related("sector"), pk=ubicacion_id)
     geom = ubicacion.geom
 
-    base = ObjetoLugar.objects.filter(
-        lugar__isnull=False,
-        lugar__piso__ubicacion_id=ubicacion.id
-    )
+    pisos = Piso.objects.filter(ubicacion_id=ubicacion.id).order_by("piso")
 
-    agg = base.aggregate(
-        total=Sum("cantidad"),
-        buenas=Sum("cantidad", filter=Q(estado="B")),
-        pendientes=Sum("cantidad", filter=Q(estado="P")),
-        malas=Sum("cantidad", filter=Q(estado="M")),
+    # totales ya sumados por nodo (ResumenEstado): la ubicación, sus pisos y sus lugares en una consulta
+    stats = _stats_por_nivel(
+        ubicacion=[ubicacion.id],
+        piso=pisos.values("pk"),
+        lugar=Lugar.objects.filter(piso__ubicacion_id=ubicacion.id).values("pk"),
     )
+    agg = stats["ubicacion"].get(str(ubicacion.id), {})
 
     total = int(agg.get("total") or 0)
     buenas = int(agg.get("buenas") or 0)
@@ -2402,29 +2402,8 @@ def mapa_ubicacion_detalle(request, ubicacion_id):
         "pct_malas": pct_m,
     }
 
-    pisos = Piso.objects.filter(ubicacion_id=ubicacion.id).order_by("piso")
-
-    piso_rows = (
-        base.values("lugar__piso_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum("cantidad", filter=Q(estado="B")),
-            pendientes=Sum("cantidad", filter=Q(estado="P")),
-            malas=Sum("cantidad", filter=Q(estado="M")),
-        )
-    )
-    piso_stats = _stats_dict_from_rows(piso_rows, "lugar__piso_id")
-
-    lugar_rows = (
-        base.values("lugar_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum("cantidad", filter=Q(estado="B")),
-            pendientes=Sum("cantidad", filter=Q(estado="P")),
-            malas=Sum("cantidad", filter=Q(estado="M")),
-        )
-    )
-    lugar_stats = _stats_dict_from_rows(lugar_rows, "lugar_id")
+    piso_stats = stats["piso"]
+    lugar_stats = stats["lugar"]
 
     pisos_info = []
     for p in pisos:
@@ -2770,34 +2749,15 @@ def _color_por_pct_buenas(pct):
 
 
 
-def _stats_sector_dict():
-    rows = (
-        ObjetoLugar.objects
-        .filter(lugar__isnull=False)
-        .values("lugar__piso__ubicacion__sector_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum(Case(When(estado="B", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-            pendientes=Sum(Case(When(estado="P", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-            malas=Sum(Case(When(estado="M", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-        )
-    )
-    return _stats_dict_from_rows(rows, "lugar__piso__ubicacion__sector_id")
-
-
-def _stats_ubicacion_dict():
-    rows = (
-        ObjetoLugar.objects
-        .filter(lugar__isnull=False)
-        .values("lugar__piso__ubicacion_id")
-        .annotate(
-            total=Sum("cantidad"),
-            buenas=Sum(Case(When(estado="B", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-            pendientes=Sum(Case(When(estado="P", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-            malas=Sum(Case(When(estado="M", then=F("cantidad")), default=Value(0), output_field=IntegerField())),
-        )
-    )
-    return _stats_dict_from_rows(rows, "lugar__piso__ubicacion_id")
+def _stats_por_nivel(**ids_por_nivel):
+    """
+    {nivel: _stats_dict_from_rows} de varios niveles con una sola consulta a
+    ResumenEstado (ver resumen_estados.leer): _stats_por_nivel(sector=None, lugar=[...]).
+    """
+    return {
+        nivel: _stats_dict_from_rows(rows, "nodo_id")
+        for nivel, rows in resumen_estados.leer(**ids_por_nivel).items()
+    }
 
 
 def construir_geojson_para_mapa():
@@ -2874,14 +2834,45 @@ def mapa_admin(request):
     }
     return render(request, "mapa/mapa_admin.html", context)
 
+# subir si cambia la forma del JSON de mapa_admin_stats (invalida cache y ETags)
+VERSION_STATS_MAPA = 1
+
+
+def _version_stats_mapa(request):
+    """(firma, modificado) del inventario, una vez por request (ETag y Last-Modified)."""
+    if not hasattr(request, "_version_stats_mapa"):
+        request._version_stats_mapa = cache_exportes.version_inventario()
+    return request._version_stats_mapa
+
+
+def _etag_stats_mapa(request):
+    return f"stats-v{VERSION_STATS_MAPA}-{_version_stats_mapa(request)[0]}"
+
+
+def _modificado_stats_mapa(request):
+    return _version_stats_mapa(request)[1]
+
+
 @require_GET
 @login_required
+@condition(etag_func=_etag_stats_mapa, last_modified_func=_modificado_stats_mapa)
 def mapa_admin_stats(request):
-    return JsonResponse({
-        "sector": _stats_sector_dict(),
-        "ubicacion": _stats_ubicacion_dict(),
-        "lugar": _stats_lugar_dict(), # ✅ CLAVE (para que BAÑO RODANTE NO SALGA “SIN DATOS”)
-    })
+    """
+    Stats del mapa por sector, ubicación y lugar. El JSON queda en el cache
+    de Django (CACHES, LocMem por defecto) con la versión del inventario en la
+    clave: cualquier cambio de objetos o lugares la sube y la entrada vieja
+    simplemente deja de usarse. Con ETag / Last-Modified el navegador
+    revalida y recibe un 304 si nada cambió.
+    """
+    clave = f"mapa_admin_stats:{_etag_stats_mapa(request)}"
+    contenido = cache.get(clave)
+    if contenido is None:
+        # lugar: ✅ CLAVE (para que BAÑO RODANTE NO SALGA “SIN DATOS”)
+        contenido = JsonResponse(_stats_por_nivel(sector=None, ubicacion=None, lugar=None)).content
+        cache.set(clave, contenido, getattr(settings, "MAPA_STATS_CACHE_TIMEOUT", 3600))
+    response = HttpResponse(contenido, content_type="application/json")
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 # =========================
 # Helpers: parsing Excel
 # =========================
@@ -2921,6 +2912,9 @@ HEADER_ALIASES = {
     "especificacion": "detalle",
     "especificación": "detalle",
     "fecha": "fecha",
+    # Excel editable (columnas ocultas, ver build_excel_sectores(editable=True))
+    "id": "id",
+    "control": "control",
 }
 
 # Para reconocer el formato normalizado (tu plantilla)
@@ -2931,65 +2925,58 @@ RE_SECTOR_UBI = re.compile(r"sector:\s*(.*?)\s*\|\s*ubicaci[oó]n:\s*(.*)", re.I
 RE_PISO = re.compile(r"^\s*piso\s*\d+", re.IGNORECASE)
 RE_TIPO_LUGAR = re.compile(r"^\s*tipo\s*de\s*lugar\s*:\s*(.*)$", re.IGNORECASE)
 
-def _row_first_text(ws, r: int) -> str:
+def _cell(values, c: int):
+    """Valor de la columna c (1-based) en una fila de iter_rows(values_only=True)."""
+    return values[c - 1] if 0 < c <= len(values) else None
+
+def _first_text(values) -> str:
     """Primer texto no vacío de una fila (sirve para celdas mergeadas)."""
-    for c in range(1, ws.max_column + 1):
-        v = ws.cell(r, c).value
+    for v in values:
         if v not in (None, ""):
             return str(v).strip()
     return ""
 
-def _find_sector_ubicacion(ws):
-    """Busca 'Sector: X | Ubicación: Y' en las primeras filas."""
-    for r in range(1, min(ws.max_row, 15) + 1):
-        # revisamos varias columnas por si no está en A (merge raro)
-        for c in range(1, min(ws.max_column, 8) + 1):
-            v = ws.cell(r, c).value
-            if not v:
-                continue
-            m = RE_SECTOR_UBI.search(str(v))
-            if m:
-                return m.group(1).strip(), m.group(2).strip()
+def _match_sector_ubicacion(values):
+    """Busca 'Sector: X | Ubicación: Y' en las primeras columnas de la fila."""
+    # revisamos varias columnas por si no está en A (merge raro)
+    for v in values[:8]:
+        if not v:
+            continue
+        m = RE_SECTOR_UBI.search(str(v))
+        if m:
+            return m.group(1).strip(), m.group(2).strip()
     return None, None
 
+@lru_cache(maxsize=1024)
+def _header_key(v: str):
+    """Clave de HEADER_ALIASES para un texto de celda (los headers se repiten en cada bloque)."""
+    return HEADER_ALIASES.get(_norm_header(v))
+
+def _map_headers(values):
+    """{columna: clave} con los encabezados reconocidos de la fila (solo celdas de texto)."""
+    mapped = {}
+    for c, v in enumerate(values, start=1):
+        if isinstance(v, str):
+            key = _header_key(v)
+            if key:
+                mapped[c] = key
+    return mapped
+
 
-def _parse_normalizado(wb):
+def _iter_normalizado(filas, header_map):
     """
     Formato normalizado:
     hoja ObjetosLugar o primera hoja con headers:
     ubicacion, sector, lugar, objeto, cantidad, estado (y opcionales)
+    `filas` son las filas que vienen DESPUÉS del header.
     """
-    ws = wb["ObjetosLugar"] if "ObjetosLugar" in wb.sheetnames else wb.worksheets[0]
-
-    header_row = None
-    header_map = {}
-
-    for r in range(1, min(ws.max_row, 40) + 1):
-        mapped = []
-        for c in range(1, ws.max_column + 1):
-            key = HEADER_ALIASES.get(_norm_header(ws.cell(r, c).value))
-            if key:
-                mapped.append((c, key))
-
-        keys = set(k for _, k in mapped)
-        if REQUIRED_HEADERS_NORMALIZADO.issubset(keys):
-            header_row = r
-            header_map = {col: key for col, key in mapped}
-            break
-
-    if not header_row:
-        return []
-
-    rows = []
-    for r in range(header_row + 1, ws.max_row + 1):
-        if not any(ws.cell(r, c).value not in (None, "") for c in range(1, ws.max_column + 1)):
+    for values in filas:
+        if not any(v not in (None, "") for v in values):
             continue
 
-        rec = {}
-        for col, key in header_map.items():
-            rec[key] = ws.cell(r, col).value
+        rec = {key: _cell(values, col) for col, key in header_map.items()}
 
-        rows.append({
+        yield {
             "ubicacion": _clean_text(rec.get("ubicacion")),
             "sector": _clean_text(rec.get("sector")),
             "piso": _clean_text(rec.get("piso")),
@@ -3004,152 +2991,493 @@ def _parse_normalizado(wb):
             "estado": _clean_text(rec.get("estado")),
             "detalle": _clean_text(rec.get("detalle")),
             "fecha": rec.get("fecha"),
-        })
+        }
 
-    return rows
+
+# tipos de fila del formato exportado
+FILA_VACIA = "vacia"
+FILA_PISO = "piso"
+FILA_TIPO_LUGAR = "tipo_lugar"
+FILA_HEADER = "header"
+FILA_TEXTO = "texto"  # título, nombre del lugar u otro texto suelto
+
+HEADERS_TABLA_EXPORTADO = {"objeto", "cantidad", "estado"}
+
+
+def _tipo_fila_exportado(values):
+    """
+    Clasifica una fila (fuera de una tabla de datos) UNA sola vez.
+    Devuelve (tipo, primer_texto, extra): extra es el tipo de lugar en
+    FILA_TIPO_LUGAR y {clave: columna} en FILA_HEADER.
+    """
+    txt = _first_text(values)
+    if not txt:
+        return FILA_VACIA, txt, None
+    if RE_PISO.match(txt):
+        return FILA_PISO, txt, None
+    mt = RE_TIPO_LUGAR.match(txt)
+    if mt:
+        return FILA_TIPO_LUGAR, txt, (mt.group(1) or "").strip() or "Sin especificar"
+
+    # fila de headers de tabla: "objeto"+"cantidad"+"estado" en cualquier columna
+    header_map = _map_headers(values)
+    if HEADERS_TABLA_EXPORTADO.issubset(header_map.values()):
+        # columnas relevantes (la primera de cada clave; si no están, quedan fuera)
+        cols = {}
+        for col, key in header_map.items():
+            cols.setdefault(key, col)
+        return FILA_HEADER, txt, cols
+    return FILA_TEXTO, txt, None
 
 
-def _parse_exportado(wb):
+def _bloques_exportado(filas):
+    """
+    Índice de bloques de una hoja del formato exportado, en UNA pasada:
+    cada fila se clasifica una vez (título, PISO, Tipo de lugar, texto/lugar,
+    header o dato) y por cada tabla se emite un bloque
+    {"sector", "ubicacion", "piso", "tipo_de_lugar", "lugar", "cols",
+     "desde", "hasta", "filas"} con las filas de datos (números de fila 1-based).
     """
-    Formato exportado por tu sistema (NUEVO):
+    # El título tiene que aparecer en las primeras 15 filas; mientras no aparece
+    # guardamos esas filas para procesarlas después (buffer acotado).
+    sector = ubicacion = None
+    previas = []
+    for values in filas:
+        previas.append(values)
+        sector, ubicacion = _match_sector_ubicacion(values)
+        if sector and ubicacion:
+            break
+        if len(previas) >= 15:
+            return
+    if not sector or not ubicacion:
+        return
+
+    piso = ""
+    tipo_de_lugar = "Sin especificar"
+    # (tipo, primer texto) de las 4 filas anteriores (para el nombre del lugar)
+    ultimos = deque(maxlen=4)
+    bloque = None  # tabla abierta
+
+    for numero, values in enumerate(chain(previas, filas), start=1):
+        if bloque is not None:
+            cols = bloque["cols"]
+            txt = _first_text(values)
+            obj_val = _cell(values, cols["objeto"])
+            # corte por nuevo bloque u objeto vacío => fin de tabla
+            fin = (
+                obj_val is None
+                or str(obj_val).strip() == ""
+                or (txt and (RE_PISO.match(txt) or RE_TIPO_LUGAR.match(txt)))
+            )
+            if not fin:
+                bloque["filas"].append(values)
+                bloque["hasta"] = numero
+                ultimos.append((FILA_TEXTO, txt))
+                continue
+
+            # la fila que cierra la tabla se clasifica como fila normal
+            if bloque["filas"]:
+                yield bloque
+            bloque = None
+
+        tipo, txt, extra = _tipo_fila_exportado(values)
+
+        if tipo == FILA_PISO:
+            piso = txt # ej "PISO 1"
+        elif tipo == FILA_TIPO_LUGAR:
+            tipo_de_lugar = extra
+        elif tipo == FILA_HEADER:
+            # nombre del lugar hacia arriba (normalmente la fila anterior)
+            lugar = next(
+                (t for k, t in reversed(ultimos) if t and k not in (FILA_PISO, FILA_TIPO_LUGAR)),
+                "",
+            )
+            bloque = {
+                "sector": sector,
+                "ubicacion": ubicacion,
+                "piso": piso,
+                "tipo_de_lugar": tipo_de_lugar,
+                "lugar": lugar or "Sin lugar",
+                "cols": extra,
+                "desde": numero + 1,
+                "hasta": numero,
+                "filas": [],
+            }
+
+        ultimos.append((tipo, txt))
+
+    if bloque is not None and bloque["filas"]:
+        yield bloque
+
+
+def _registros_bloque(bloque):
+    """Filas de un bloque del índice -> registros de importación."""
+    cols = bloque["cols"]
+    c_cat = cols.get("categoria")
+    c_obj = cols["objeto"]
+    c_tipo = cols.get("tipo_objeto")
+    c_cant = cols.get("cantidad")
+    c_est = cols.get("estado")
+    c_det = cols.get("detalle")
+    c_fec = cols.get("fecha")
+    c_id = cols.get("id")
+    c_ctrl = cols.get("control")
+
+    for values in bloque["filas"]:
+        cant_val = _cell(values, c_cant) if c_cant else 0
+        r = {
+            "ubicacion": bloque["ubicacion"],
+            "sector": bloque["sector"],
+            "piso": bloque["piso"],
+            "tipo_de_lugar": bloque["tipo_de_lugar"] or "Sin especificar",
+            "lugar": bloque["lugar"],
+            "categoria": _clean_text(_cell(values, c_cat) if c_cat else None) or "Sin categoría",
+            "objeto": _clean_text(_cell(values, c_obj)),
+            "tipo_objeto": _clean_text(_cell(values, c_tipo) if c_tipo else None),
+            "cantidad": cant_val if cant_val is not None else 0,
+            "estado": _clean_text(_cell(values, c_est) if c_est else ""),
+            "detalle": _clean_text(_cell(values, c_det) if c_det else ""),
+            "fecha": _cell(values, c_fec) if c_fec else None,
+        }
+        # Excel editable: la fila trae su ObjetoLugar (las agregadas a mano no)
+        id_val = _cell(values, c_id) if c_id else None
+        if id_val not in (None, ""):
+            r["id"] = id_val
+            r["control"] = _clean_text(_cell(values, c_ctrl) if c_ctrl else None)
+        yield r
+
+
+def _iter_exportado(filas):
+    """
+    Formato exportado por tu sistema (NUEVO), una hoja por Ubicación:
     - "Sector: X | Ubicación: Y"
     - "PISO 1"
     - "Tipo de lugar: Baño"
     - (Fila) Nombre del lugar
     - (Fila) headers en A,C,E,G,I,K,M: Categoría | Objeto | Tipo | Cantidad | Estado | Detalle | Fecha
     - datos abajo
+    Indexa la hoja en una pasada (_bloques_exportado) y saca los registros de cada bloque.
     """
-    rows = []
+    for bloque in _bloques_exportado(filas):
+        yield from _registros_bloque(bloque)
+
 
-    for ws in wb.worksheets:
-        sector, ubicacion = _find_sector_ubicacion(ws)
-        if not sector or not ubicacion:
+def _detectar_formato(wb):
+    """
+    Busca el header del formato normalizado en las primeras 40 filas de la hoja
+    ObjetosLugar (o la primera hoja), leyendo solo lo necesario.
+    Devuelve (hoja, filas_restantes, filas_leidas, header_map); header_map vacío = exportado.
+    """
+    hoja_norm = wb["ObjetosLugar"] if "ObjetosLugar" in wb.sheetnames else wb.worksheets[0]
+    filas_norm = hoja_norm.iter_rows(values_only=True)
+
+    leidas = []
+    for values in islice(filas_norm, 40):
+        leidas.append(values)
+        mapped = _map_headers(values)
+        if REQUIRED_HEADERS_NORMALIZADO.issubset(mapped.values()):
+            return hoja_norm, filas_norm, leidas, mapped
+    return hoja_norm, filas_norm, leidas, {}
+
+
+def iter_excel(file_obj):
+    """
+    Lector en streaming (read_only + iter_rows) para la carga masiva.
+    Devuelve (formato_detectado, generador_de_filas); el workbook se cierra
+    cuando el generador termina.
+    - "normalizado": headers ubicacion/sector/lugar/objeto/cantidad/estado en las
+      primeras 40 filas de la hoja ObjetosLugar (o la primera hoja).
+    - "exportado": en otro caso, todas las hojas con el formato de build_excel_sectores.
+    """
+    file_obj.seek(0)
+    wb = load_workbook(file_obj, read_only=True, data_only=True)
+    hoja_norm, filas_norm, leidas, header_map = _detectar_formato(wb)
+
+    def _normalizado():
+        try:
+            yield from _iter_normalizado(filas_norm, header_map)
+        finally:
+            wb.close()
+
+    def _exportado():
+        try:
+            for ws in wb.worksheets:
+                # la hoja candidata sigue desde donde quedó (sin releer sus primeras filas)
+                filas = chain(leidas, filas_norm) if ws is hoja_norm else ws.iter_rows(values_only=True)
+                yield from _iter_exportado(filas)
+        finally:
+            wb.close()
+
+    if header_map:
+        return "normalizado", _normalizado()
+    return "exportado", _exportado()
+
+
+# =========================
+# CSV / TSV (mismo formato normalizado, sin openpyxl)
+# =========================
+EXTENSIONES_CSV = (".csv", ".tsv", ".txt")
+CSV_DELIMITADORES = ",;\t|"
+
+
+def _detectar_encoding(muestra: bytes) -> str:
+    """BOM si lo hay; si no UTF-8 y, si no decodifica, cp1252 (CSV de Excel en Windows)."""
+    if muestra.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if muestra.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    for encoding in ("utf-8", "cp1252"):
+        try:
+            # final=False: la muestra puede cortar un carácter multibyte al final
+            codecs.getincrementaldecoder(encoding)().decode(muestra, final=False)
+            return encoding
+        except UnicodeDecodeError:
             continue
+    return "latin-1"
 
-        current_piso = ""
-        current_tipo_lugar = "Sin especificar"
 
-        r = 1
-        max_r = ws.max_row
+def _detectar_delimitador(texto: str, nombre: str = "") -> str:
+    if nombre.lower().endswith(".tsv"):
+        return "\t"
+    try:
+        return csv.Sniffer().sniff(texto, delimiters=CSV_DELIMITADORES).delimiter
+    except csv.Error:
+        # el más frecuente en la primera línea
+        primera = texto.split("\n", 1)[0]
+        return max(CSV_DELIMITADORES, key=primera.count)
+
+
+def _a_numero(v):
+    """'3' -> 3, '2,5' / '2.5' -> 2.5 (como llegaría desde el xlsx); si no, el texto tal cual."""
+    if not isinstance(v, str):
+        return v
+    t = v.strip().replace(",", ".")
+    try:
+        f = float(t)
+    except ValueError:
+        return v
+    return int(f) if f.is_integer() else f
 
-        while r <= max_r:
-            txt = _row_first_text(ws, r)
 
-            # PISO
-            if txt and RE_PISO.match(txt):
-                current_piso = txt # ej "PISO 1"
-                r += 1
-                continue
+def iter_csv(file_obj):
+    """
+    Lector en streaming (csv.reader) de un CSV/TSV con el formato normalizado.
+    Detecta encoding y delimitador con una muestra de 64 KB, busca el header en
+    las primeras 40 filas con HEADER_ALIASES y entrega las mismas filas que
+    _iter_normalizado. Devuelve ("csv", generador_de_filas).
+    """
+    file_obj.seek(0)
+    muestra = file_obj.read(64 * 1024)
+    file_obj.seek(0)
+    encoding = _detectar_encoding(muestra)
+    texto = muestra.decode(encoding, errors="ignore")
+    delimitador = _detectar_delimitador(texto, getattr(file_obj, "name", "") or "")
 
-            # Tipo de lugar
-            if txt:
-                mt = RE_TIPO_LUGAR.match(txt)
-                if mt:
-                    current_tipo_lugar = (mt.group(1) or "").strip() or "Sin especificar"
-                    r += 1
-                    continue
+    wrapper = io.TextIOWrapper(file_obj, encoding=encoding, newline="", errors="replace")
+    # celdas vacías como None, igual que openpyxl
+    filas = ([c if c != "" else None for c in row] for row in csv.reader(wrapper, delimiter=delimitador))
 
-            # Detectar fila de headers de tabla (buscamos "objeto"+"cantidad"+"estado" en cualquier columna)
-            mapped = []
-            for c in range(1, ws.max_column + 1):
-                key = HEADER_ALIASES.get(_norm_header(ws.cell(r, c).value))
-                if key:
-                    mapped.append((c, key))
-            keys = set(k for _, k in mapped)
-
-            # headers mínimos del bloque
-            if {"objeto", "cantidad", "estado"}.issubset(keys):
-                header_map = {col: key for col, key in mapped}
-
-                # buscar nombre del lugar hacia arriba (normalmente r-1)
-                lugar = ""
-                for back in (1, 2, 3, 4):
-                    if r - back < 1:
-                        break
-                    tback = _row_first_text(ws, r - back)
-                    if not tback:
-                        continue
-                    if RE_PISO.match(tback):
-                        continue
-                    if RE_TIPO_LUGAR.match(tback):
-                        continue
-                    # esta debería ser la fila mergeada del lugar
-                    lugar = tback
-                    break
-
-                if not lugar:
-                    lugar = "Sin lugar"
-
-                # columnas relevantes (si no están, quedan None)
-                col_categoria = next((c for c, k in header_map.items() if k == "categoria"), None)
-                col_objeto = next((c for c, k in header_map.items() if k == "objeto"), None)
-                col_tipo = next((c for c, k in header_map.items() if k == "tipo_objeto"), None)
-                col_cantidad = next((c for c, k in header_map.items() if k == "cantidad"), None)
-                col_estado = next((c for c, k in header_map.items() if k == "estado"), None)
-                col_detalle = next((c for c, k in header_map.items() if k == "detalle"), None)
-                col_fecha = next((c for c, k in header_map.items() if k == "fecha"), None)
-
-                rr = r + 1
-                while rr <= max_r:
-                    # corte por nuevo bloque
-                    tline = _row_first_text(ws, rr)
-                    if tline and (RE_PISO.match(tline) or RE_TIPO_LUGAR.match(tline)):
-                        break
-
-                    # objeto vacío => fin de tabla
-                    obj_val = ws.cell(rr, col_objeto).value if col_objeto else None
-                    if obj_val is None or str(obj_val).strip() == "":
-                        break
-
-                    cat_val = ws.cell(rr, col_categoria).value if col_categoria else None
-                    tipo_val = ws.cell(rr, col_tipo).value if col_tipo else None
-                    cant_val = ws.cell(rr, col_cantidad).value if col_cantidad else 0
-                    est_val = ws.cell(rr, col_estado).value if col_estado else ""
-                    det_val = ws.cell(rr, col_detalle).value if col_detalle else ""
-                    fec_val = ws.cell(rr, col_fecha).value if col_fecha else None
-
-                    rows.append({
-                        "ubicacion": ubicacion,
-                        "sector": sector,
-                        "piso": current_piso,
-                        "tipo_de_lugar": current_tipo_lugar or "Sin especificar",
-                        "lugar": lugar,
-                        "categoria": _clean_text(cat_val) or "Sin categoría",
-                        "objeto": _clean_text(obj_val),
-                        "tipo_objeto": _clean_text(tipo_val),
-                        "cantidad": cant_val if cant_val is not None else 0,
-                        "estado": _clean_text(est_val),
-                        "detalle": _clean_text(det_val),
-                        "fecha": fec_val,
-                    })
-                    rr += 1
-
-                r = rr
-                continue
+    header_map = {}
+    for values in islice(filas, 40):
+        mapped = _map_headers(values)
+        if REQUIRED_HEADERS_NORMALIZADO.issubset(mapped.values()):
+            header_map = mapped
+            break
 
-            r += 1
+    def _filas():
+        try:
+            if not header_map:
+                return
+            for r in _iter_normalizado(filas, header_map):
+                r["cantidad"] = _a_numero(r["cantidad"])
+                yield r
+        finally:
+            # que el wrapper no cierre el archivo subido
+            wrapper.detach()
 
-    return rows
+    return "csv", _filas()
+
+
+# =========================
+# Parseo en paralelo (hojas / zip de workbooks)
+# =========================
+def _parse_hoja_exportado(path, hoja):
+    """Registros de UNA hoja del formato exportado (generador)."""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from _iter_exportado(wb[hoja].iter_rows(values_only=True))
+    finally:
+        wb.close()
 
 
+def _parse_libro(path):
+    """Registros de un workbook completo, lectura secuencial (generador)."""
+    with open(path, "rb") as fh:
+        _, filas = iter_excel(fh)
+        yield from filas
 
-def parse_excel(file_obj):
+
+def _parse_unidad(fn, args):
+    """Worker del pool: corre la unidad completa (la lista es lo que vuelve al proceso padre)."""
+    return list(fn(*args))
+
+
+def _es_zip_de_libros(file_obj):
+    """True si es un .zip con workbooks adentro (un .xlsx también es zip, pero trae [Content_Types].xml)."""
     file_obj.seek(0)
-    wb = load_workbook(file_obj, data_only=True)
+    if not zipfile.is_zipfile(file_obj):
+        return False
+    file_obj.seek(0)
+    with zipfile.ZipFile(file_obj) as zf:
+        return "[Content_Types].xml" not in zf.namelist()
 
-    rows = _parse_normalizado(wb)
-    if rows:
-        return rows, "normalizado"
 
-    rows = _parse_exportado(wb)
-    if rows:
-        return rows, "exportado"
+def _unidades_libro(path):
+    """(formato, [(worker, args)]) de un workbook: una unidad por hoja si es exportado."""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        header_map = _detectar_formato(wb)[3]
+        if header_map:
+            return "normalizado", [(_parse_libro, (path,))]
+        return "exportado", [(_parse_hoja_exportado, (path, hoja)) for hoja in wb.sheetnames]
+    finally:
+        wb.close()
 
-    raise ValueError(
-        "No pude reconocer el formato del Excel. "
-        "Acepto: (1) plantilla normalizada (con columnas ubicacion/sector/lugar/objeto/cantidad/estado), "
-        "o (2) el Excel exportado por tu sistema (Sector|Ubicación, PISO, Tipo de lugar:, LUGAR, y tabla con Categoría/Objeto/Tipo/Cantidad/Estado/Detalle/Fecha)."
+
+def iter_carga_masiva(file_obj, workers=None, usar_cache=True):
+    """
+    Entrada de la carga masiva: un .xlsx, un .zip con varios .xlsx o un CSV/TSV
+    (por extensión, ver iter_csv).
+    Devuelve (formato_detectado, generador_de_filas) como iter_excel.
+
+    Con workers > 1 (CARGA_MASIVA_PARSE_WORKERS) las hojas del formato exportado
+    y los workbooks del zip se parsean en un pool de procesos; los resultados se
+    juntan en orden fijo (miembros del zip por nombre, hojas en orden del libro),
+    así que la salida es la misma que en secuencial.
+    Un .xlsx de una sola hoja, chico (CARGA_MASIVA_PARSE_PARALELO_DESDE bytes)
+    o con workers <= 1 va por iter_excel, en streaming.
+    Si el mismo archivo ya se parseó, las filas salen del cache en disco
+    (cache_cargas, por SHA-256) sin volver a leerlo.
+    """
+    if usar_cache and cache_cargas.habilitado():
+        k = cache_cargas.clave(file_obj)
+        guardado = cache_cargas.leer(k)
+        if guardado is not None:
+            return guardado
+        formato, filas = iter_carga_masiva(file_obj, workers, usar_cache=False)
+        return formato, cache_cargas.escribir(k, formato, filas)
+
+    if (getattr(file_obj, "name", "") or "").lower().endswith(EXTENSIONES_CSV):
+        return iter_csv(file_obj)
+
+    if workers is None:
+        workers = getattr(settings, "CARGA_MASIVA_PARSE_WORKERS", 1)
+
+    es_zip = _es_zip_de_libros(file_obj)
+    if not es_zip and workers <= 1:
+        return iter_excel(file_obj)
+
+    tmpdir = tempfile.TemporaryDirectory(prefix="carga-masiva-")
+    try:
+        file_obj.seek(0)
+        if es_zip:
+            with zipfile.ZipFile(file_obj) as zf:
+                nombres = sorted(
+                    n for n in zf.namelist()
+                    if n.lower().endswith(".xlsx") and not os.path.basename(n).startswith(("~$", "."))
+                )
+                paths = []
+                for i, nombre in enumerate(nombres):
+                    path = os.path.join(tmpdir.name, f"{i:05d}.xlsx")
+                    with zf.open(nombre) as src, open(path, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    paths.append(path)
+            if not paths:
+                raise ValueError("El .zip no trae archivos .xlsx.")
+        elif hasattr(file_obj, "temporary_file_path"):
+            # subida ya volcada a disco (TemporaryUploadedFile): no hace falta copiarla
+            paths = [file_obj.temporary_file_path()]
+        else:
+            path = os.path.join(tmpdir.name, "archivo.xlsx")
+            with open(path, "wb") as dst:
+                shutil.copyfileobj(file_obj, dst)
+            paths = [path]
+
+        formatos = []
+        unidades = []
+        for path in paths:
+            formato, u = _unidades_libro(path)
+            formatos.append(formato)
+            unidades.extend(u)
+    except Exception:
+        tmpdir.cleanup()
+        raise
+
+    # levantar procesos cuesta ~1 s: archivos chicos van en secuencial
+    tamano = sum(os.path.getsize(p) for p in paths)
+    paralelo = (
+        workers > 1
+        and len(unidades) > 1
+        and tamano >= getattr(settings, "CARGA_MASIVA_PARSE_PARALELO_DESDE", 0)
     )
+    if not es_zip and not paralelo:
+        tmpdir.cleanup()
+        return iter_excel(file_obj)
+
+    formato = formatos[0] if len(set(formatos)) == 1 else "mixto"
+
+    def _filas():
+        try:
+            if not paralelo:
+                for fn, args in unidades:
+                    yield from fn(*args)
+                return
+
+            # spawn + django.setup: los workers no heredan hilos ni conexiones del servidor
+            n = min(workers, len(unidades))
+            with ProcessPoolExecutor(
+                max_workers=n,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            ) as pool:
+                # ventana acotada: a lo sumo n+1 unidades parseadas esperando
+                # al consumidor, no el archivo completo en memoria
+                pendientes = iter(unidades)
+                futuros = deque(
+                    pool.submit(_parse_unidad, fn, args)
+                    for fn, args in islice(pendientes, n + 1)
+                )
+                try:
+                    while futuros:
+                        filas = futuros.popleft().result()
+                        for fn, args in islice(pendientes, 1):
+                            futuros.append(pool.submit(_parse_unidad, fn, args))
+                        yield from filas
+                        del filas
+                finally:
+                    for futuro in futuros:
+                        futuro.cancel()
+        finally:
+            tmpdir.cleanup()
+
+    return formato, _filas()
+
+
+ERROR_FORMATO_EXCEL = (
+    "No pude reconocer el formato del Excel. "
+    "Acepto: (1) plantilla normalizada (con columnas ubicacion/sector/lugar/objeto/cantidad/estado), "
+    "o (2) el Excel exportado por tu sistema (Sector|Ubicación, PISO, Tipo de lugar:, LUGAR, y tabla con Categoría/Objeto/Tipo/Cantidad/Estado/Detalle/Fecha), "
+    "o (3) un CSV/TSV con las columnas de la plantilla normalizada."
+)
+
+
+def parse_excel(file_obj):
+    detected, filas = iter_carga_masiva(file_obj)
+    rows = list(filas)
+    if rows:
+        return rows, detected
+
+    raise ValueError(ERROR_FORMATO_EXCEL)
 
 
 
@@ -3222,194 +3550,817 @@ def _pick_fk(model, related_model, candidates=None, required=True):
     raise RuntimeError(f"No encontré FK desde {model.__name__} hacia {related_model.__name__}")
 
 
-def import_from_rows(rows):
+def _piso_to_int(piso_raw: str) -> int:
+    s = (piso_raw or "").strip()
+    m = re.search(r"(\d+)", s)
+    return int(m.group(1)) if m else 0
+
+
+def _estado_to_code(estado_raw: str) -> str:
+    s = (estado_raw or "").strip().lower()
+    if s in ("b", "bueno"):
+        return "B"
+    if s in ("p", "pendiente"):
+        return "P"
+    if s in ("m", "malo"):
+        return "M"
+    # si viene vacío o raro, por defecto Bueno
+    return "B"
+
+
+def _key(x):
+    return (x or "").strip().lower()
+
+
+# filas que se resuelven/escriben juntas, y tamaño de cada IN (límite de parámetros de SQLite)
+IMPORT_BATCH_SIZE = 2000
+SQL_IN_CHUNK = 500
+CONSOLIDAR_POLITICAS = ("ultima", "sumar")  # filas repetidas: gana la última / suma cantidades
+
+
+def _chunks(values, size=SQL_IN_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _resolver_dimension(model, cache, pendientes, create_extra=None, crear=True):
+    """
+    Resuelve en bloque una dimensión del import.
+    - pendientes: {clave_cache: {campo: valor}} con el lookup EXACTO (el primer campo va al IN).
+    - create_extra: {clave_cache: {campo: valor}} solo para crear (ej: categoría del Objeto).
+    Busca las existentes con unos pocos IN, crea las que faltan con bulk_create
+    y deja cache[clave] = id.
+    - crear=False (diff): no escribe; las que faltan reciben un id negativo
+      provisorio, único en la cache, que no coincide con nada de la BD.
+    """
+    pendientes = {k: v for k, v in pendientes.items() if k not in cache}
+    if not pendientes:
+        return
+
+    campos = list(next(iter(pendientes.values())))
+    principal = campos[0]
+
+    def natural(v):
+        return tuple(v[c] for c in campos)
+
+    def existentes():
+        encontrados = {}
+        # el resto de campos también acota la consulta (si caben en un IN)
+        extra = {}
+        for c in campos[1:]:
+            valores = {v[c] for v in pendientes.values()}
+            if len(valores) <= SQL_IN_CHUNK and None not in valores:
+                extra[f"{c}__in"] = valores
+        for part in _chunks({v[principal] for v in pendientes.values()}):
+            qs = (
+                model.objects
+                .filter(**{f"{principal}__in": part}, **extra)
+                .order_by("id")
+                .values("id", *campos)
+            )
+            for r in qs:
+                encontrados.setdefault(natural(r), r["id"])
+        return encontrados
+
+    encontrados = existentes()
+
+    nuevos = {}
+    for k, v in pendientes.items():
+        nat = natural(v)
+        if nat not in encontrados and nat not in nuevos:
+            nuevos[nat] = model(**v, **((create_extra or {}).get(k) or {}))
+
+    if nuevos and not crear:
+        for n, nat in enumerate(nuevos, start=len(cache) + 1):
+            encontrados[nat] = -n
+    elif nuevos:
+        model.objects.bulk_create(nuevos.values(), batch_size=IMPORT_BATCH_SIZE)
+        catalogo.tocar()  # bulk_create no dispara señales: los combos ven lo nuevo
+        if all(obj.pk for obj in nuevos.values()):
+            encontrados.update((nat, obj.pk) for nat, obj in nuevos.items())
+        else:
+            # backends que no devuelven ids en bulk_create
+            encontrados = existentes()
+
+    for k, v in pendientes.items():
+        cache[k] = encontrados[natural(v)]
+
+
+def _upsert_objetos_lugar(filas, simulacion=None, vistas=None, sumar=False):
+    """
+    filas: [(lugar_id, tipo_id, cantidad, estado, detalle)], ya consolidadas
+    (una por clave en el lote).
+    Mismo resultado que update_or_create fila a fila (incluye el Histórico de
+    ObjetoLugar.save), pero con bulk_create / bulk_update. Solo escribe las
+    filas que cambian algo.
+    Devuelve (creados, actualizados, sin_cambios, clases) con clases[i] en
+    "N" / "C" / "I" (nuevo / cambia / igual) para filas[i].
+
+    vistas: {(lugar_id, tipo_id): escrita} de las claves ya procesadas en
+    esta importación (lotes anteriores). Si la clave se repite, con sumar=True
+    la cantidad se suma a la que ya quedó; y si ya la escribió esta misma
+    importación no se guarda otro Histórico (sería un valor intermedio).
+    Una clave repetida ya se contó en su lote: no vuelve a sumar en los
+    contadores (el caller la cuenta como consolidada), salvo que allá quedó
+    igual y aquí cambia, que pasa de sin_cambios a actualizados (lo mismo que
+    si todo fuera un solo lote). Por eso sin_cambios puede venir negativo.
+
+    simulacion: dict compartido entre lotes para el diff. No escribe nada:
+    las filas ya vistas se comparan contra el estado simulado, no contra la BD.
+    De lote a lote solo se guarda (cantidad, estado, detalle) de las claves
+    que trae el archivo, no los ObjetoLugar leídos.
+    """
+    actuales = {}
+    if simulacion is not None:
+        vistos = simulacion.setdefault("vistos", {})
+        for lugar_id, tipo_id, *_ in filas:
+            previo = vistos.get((lugar_id, tipo_id))
+            if previo is not None:
+                actuales[(lugar_id, tipo_id)] = ObjetoLugar(
+                    lugar_id=lugar_id,
+                    tipo_de_objeto_id=tipo_id,
+                    cantidad=previo[0],
+                    estado=previo[1],
+                    detalle=previo[2],
+                )
+    # ids negativos = dimensiones que aún no existen (simulación): nada que leer
+    por_leer = {f[0] for f in filas if f[0] > 0}
+
+    for part in _chunks(por_leer):
+        qs = (
+            ObjetoLugar.objects
+            .filter(lugar_id__in=part)
+            .only("id", "lugar_id", "tipo_de_objeto_id", "cantidad", "estado", "detalle", "fecha")
+            .order_by("id")
+        )
+        for ol in qs:
+            actuales.setdefault((ol.lugar_id, ol.tipo_de_objeto_id), ol)
+
+    nuevos = []
+    cambiados = {}
+    historicos = [] # (objeto_lugar, cantidad, estado, detalle) anteriores
+    clases = []
+    created = updated = unchanged = 0
+
+    if vistas is None:
+        vistas = {}
+
+    for lugar_id, tipo_id, cantidad, estado, detalle in filas:
+        clave = (lugar_id, tipo_id)
+        previa = vistas.get(clave)  # None = primera vez en esta importación
+        ol = actuales.get(clave)
+        if ol is not None and sumar and clave in vistas:
+            cantidad += ol.cantidad
+
+        if ol is None:
+            ol = ObjetoLugar(
+                lugar_id=lugar_id,
+                tipo_de_objeto_id=tipo_id,
+                cantidad=cantidad,
+                estado=estado,
+                detalle=detalle,
+            )
+            actuales[clave] = ol
+            nuevos.append(ol)
+            vistas[clave] = True
+            clases.append("N")
+            created += 1
+            continue
+
+        hubo_cambio = (
+            ol.cantidad != cantidad
+            or ol.estado != estado
+            or (ol.detalle or "") != (detalle or "")
+        )
+        if not hubo_cambio:
+            vistas.setdefault(clave, False)
+            clases.append("I")
+            if previa is None:
+                unchanged += 1
+            continue
+
+        clases.append("C")
+        if previa is None:
+            updated += 1
+        elif previa is False:
+            unchanged -= 1
+            updated += 1
+        if not vistas.get(clave):
+            historicos.append((ol, ol.cantidad, ol.estado, ol.detalle or ""))
+        vistas[clave] = True
+        ol.cantidad = cantidad
+        ol.estado = estado
+        ol.detalle = detalle
+        if ol.pk:
+            cambiados[ol.pk] = ol
+
+    if simulacion is not None:
+        for lugar_id, tipo_id, *_ in filas:
+            ol = actuales[(lugar_id, tipo_id)]
+            vistos[(lugar_id, tipo_id)] = (ol.cantidad, ol.estado, ol.detalle)
+        return created, updated, unchanged, clases
+
+    if nuevos:
+        ObjetoLugar.objects.bulk_create(nuevos, batch_size=IMPORT_BATCH_SIZE)
+        if any(ol.pk is None for ol in nuevos):
+            # backends que no devuelven ids en bulk_create
+            ids = {}
+            for part in _chunks({ol.lugar_id for ol in nuevos}):
+                for r in ObjetoLugar.objects.filter(lugar_id__in=part).order_by("id").values("id", "lugar_id", "tipo_de_objeto_id"):
+                    ids.setdefault((r["lugar_id"], r["tipo_de_objeto_id"]), r["id"])
+            for ol in nuevos:
+                ol.pk = ids[(ol.lugar_id, ol.tipo_de_objeto_id)]
+
+    if cambiados:
+        ObjetoLugar.objects.bulk_update(
+            cambiados.values(), ["cantidad", "estado", "detalle"], batch_size=IMPORT_BATCH_SIZE
+        )
+
+    if historicos:
+        HistoricoObjeto.objects.bulk_create(
+            [
+                HistoricoObjeto(
+                    objeto_del_lugar_id=ol.pk,
+                    cantidad_anterior=cantidad,
+                    estado_anterior=estado,
+                    detalle_anterior=detalle,
+                    fecha_anterior=ol.fecha,
+                )
+                for ol, cantidad, estado, detalle in historicos
+            ],
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+
+    return created, updated, unchanged, clases
+
+
+class ImportacionError(Exception):
+    """Error al importar; `fila` es la posición (1..N) de la fila que lo provocó."""
+
+    def __init__(self, mensaje, fila=None):
+        super().__init__(mensaje)
+        self.fila = fila
+
+
+def _caches_a_json(caches):
+    """{nombre: {clave: id}} -> {nombre: [[clave, id], ...]} (las claves tupla no son JSON)."""
+    return {nombre: [[list(k) if isinstance(k, tuple) else k, v] for k, v in cache.items()]
+            for nombre, cache in caches.items()}
+
+
+def _caches_desde_json(data):
+    return {nombre: {tuple(k) if isinstance(k, list) else k: v for k, v in pares}
+            for nombre, pares in (data or {}).items()}
+
+
+def _fila_limpia(r):
+    """
+    Etapa de limpieza: fila cruda (del parser o del staging) -> dict listo
+    para resolver dimensiones, o None si le faltan los mínimos
+    (ubicacion, sector, lugar, objeto).
+    Las filas del Excel editable (traen "id" de ObjetoLugar) solo necesitan
+    lo editable: no se resuelven nombres (ver _claves_por_id).
+    """
+    try:
+        id_ol = int(float(r.get("id"))) if r.get("id") not in (None, "") else None
+    except (TypeError, ValueError):
+        id_ol = None  # id ilegible: va por nombres como una fila normal
+    if id_ol:
+        detalle = _clean_text(r.get("detalle"))
+        return {
+            "id": id_ol,
+            "control": (_clean_text(r.get("control")) or "").lower(),
+            "cantidad": _a_cantidad(r.get("cantidad")),
+            "estado": _estado_to_code(r.get("estado")),
+            "detalle": "" if detalle == "-" else detalle,  # el export muestra "-" si no hay detalle
+        }
+
+    ubicacion = _clean_text(r.get("ubicacion"))
+    sector = _clean_text(r.get("sector"))
+    lugar = _clean_text(r.get("lugar"))
+    objeto = _clean_text(r.get("objeto"))
+    if not (ubicacion and sector and lugar and objeto):
+        return None
+
+    marca, material = _split_tipo(_clean_text(r.get("tipo_objeto")))
+    return {
+        "ubicacion": ubicacion,
+        "sector": sector,
+        "piso": _piso_to_int(_clean_text(r.get("piso"))),
+        "tipo_de_lugar": _clean_text(r.get("tipo_de_lugar")) or "Sin especificar",
+        "lugar": lugar,
+        "categoria": _clean_text(r.get("categoria")) or "Sin categoría",
+        "objeto": objeto,
+        "marca": marca,
+        "material": material,
+        "cantidad": _a_cantidad(r.get("cantidad")),
+        "estado": _estado_to_code(r.get("estado")),
+        "detalle": _clean_text(r.get("detalle")),
+    }
+
+
+def _a_cantidad(v):
+    try:
+        return int(float(v or 0))
+    except Exception:
+        return 0
+
+
+def _limpiar(numeradas):
+    """(numero, fila cruda) -> (numero, fila limpia o None), perezoso."""
+    for numero, r in numeradas:
+        try:
+            f = _fila_limpia(r)
+        except Exception as e:
+            raise ImportacionError(str(e), numero) from e
+        yield numero, f
+
+
+def _claves_por_id(filas, vistas):
+    """
+    Fast path del Excel editable: a cada fila (con "id" de ObjetoLugar) le
+    pone su "clave" (lugar_id, tipo_id) y "ubicacion_id" con una consulta por
+    bloque de ids, sin pasar por Sector -> ... -> TipoObjeto.
+    Devuelve las filas en conflicto (sin clave): su ObjetoLugar ya no existe
+    o su huella actual no es la del "control" exportado, o sea, alguien lo
+    cambió en el intertanto. Las claves que esta importación ya escribió
+    (vistas) no se comparan: la huella de la BD ya es la nueva. Tampoco es
+    conflicto si la fila ya trae lo mismo que la BD (el mismo Excel subido
+    dos veces): queda como sin cambios.
+    """
+    actuales = {}
+    for part in _chunks({f["id"] for f in filas}):
+        qs = ObjetoLugar.objects.filter(pk__in=part).values_list(
+            "id", "lugar_id", "tipo_de_objeto_id", "lugar__piso__ubicacion_id", "cantidad", "estado", "detalle",
+        )
+        for r in qs:
+            actuales[r[0]] = r
+
+    conflictos = []
+    for f in filas:
+        r = actuales.get(f["id"])
+        clave = r and (r[1], r[2])
+        if r is None or (
+            clave not in vistas
+            and huella_objeto_lugar(*r[4:]) not in (f["control"], huella_objeto_lugar(f["cantidad"], f["estado"], f["detalle"]))
+        ):
+            conflictos.append(f)
+            continue
+        f["clave"] = clave
+        f["ubicacion_id"] = r[3]
+    return conflictos
+
+
+def import_from_rows(rows, batch_size=IMPORT_BATCH_SIZE, progress=None,
+                     chunk_size=None, checkpoint=None, estado=None,
+                     numeradas=False, dry_run=False, clasificar=None,
+                     consolidar=None, al_confirmar=None):
     """
     Importa filas del payload y crea/actualiza según TU esquema real:
     Sector -> Ubicacion(FK Sector) -> Piso(FK Ubicacion) -> TipoLugar -> Lugar(FK Piso + FK TipoLugar)
     CategoriaObjeto -> Objeto(FK Categoria) -> TipoObjeto -> ObjetoLugar
-    """
-    import re
-    from django.db import transaction
-
-    def _piso_to_int(piso_raw: str) -> int:
-        s = (piso_raw or "").strip()
-        m = re.search(r"(\d+)", s)
-        return int(m.group(1)) if m else 0
-
-    def _estado_to_code(estado_raw: str) -> str:
-        s = (estado_raw or "").strip().lower()
-        if s in ("b", "bueno"):
-            return "B"
-        if s in ("p", "pendiente"):
-            return "P"
-        if s in ("m", "malo"):
-            return "M"
-        # si viene vacío o raro, por defecto Bueno
-        return "B"
-
-    def key(x):
-        return (x or "").strip().lower()
-
-    created_ol = 0
-    updated_ol = 0
-
-    # caches
-    cache_sector = {}
-    cache_ubic = {}
-    cache_piso = {}
-    cache_tl = {}
-    cache_lugar = {}
-    cache_cat = {}
-    cache_obj = {}
-    cache_tipo = {}
-
-    with transaction.atomic():
-        for r in rows:
-            ubicacion = _clean_text(r.get("ubicacion"))
-            sector = _clean_text(r.get("sector"))
-            piso_raw = _clean_text(r.get("piso"))
-            tipo_de_lugar = _clean_text(r.get("tipo_de_lugar")) or "Sin especificar"
-            lugar = _clean_text(r.get("lugar"))
-
-            categoria = _clean_text(r.get("categoria")) or "Sin categoría"
-            objeto = _clean_text(r.get("objeto"))
-            tipo_objeto_str = _clean_text(r.get("tipo_objeto"))
-            detalle = _clean_text(r.get("detalle"))
-            estado = _estado_to_code(r.get("estado"))
 
+    Trabaja por lotes de `batch_size` filas: cada dimensión se resuelve con unos
+    pocos IN + bulk_create y ObjetoLugar se escribe con bulk_create/bulk_update.
+    Solo se escriben las filas nuevas o que cambian; las iguales a lo que ya
+    hay en ObjetoLugar se cuentan como "unchanged".
+    - progress(procesadas, creados, actualizados, sin_cambios): después de cada lote.
+    - clasificar(numero, cambio): por fila, con "N" / "C" / "I" / "O" (omitida)
+      / "X" (conflicto, ver abajo).
+    - numeradas=True: `rows` trae pares (numero, fila) con la posición original.
+    - dry_run=True: diff sin escribir nada (dimensiones faltantes = nuevas).
+    - Si algo falla se lanza ImportacionError con el número de fila culpable.
+
+    Filas repetidas (misma clave lugar + tipo de objeto, ya resueltos los ids)
+    se consolidan antes de escribir, según `consolidar`
+    (default CARGA_MASIVA_CONSOLIDAR): "ultima" = gana la última,
+    "sumar" = se suman las cantidades (estado y detalle de la última).
+    Todas las filas de un grupo reciben la misma clase; "consolidated" del
+    resultado cuenta las filas que se juntaron con una anterior.
+
+    Filas del Excel editable (traen "id" de ObjetoLugar, ver _claves_por_id):
+    no se resuelven nombres, se actualizan por id. Si el ObjetoLugar ya no
+    existe o cambió después de exportar (la huella "control" no calza) la
+    fila no se aplica: queda como "X" y se cuenta en "conflicts".
+
+    Por tramos (chunk_size=N): confirma cada N filas en su propia transacción,
+    así SQLite suelta el lock de escritura entre tramos y un error solo pierde
+    el tramo en curso. Tras cada commit llama checkpoint(estado), con
+    estado = {"fila", "procesadas", "created", "updated", "unchanged", "caches"}
+    (serializable a JSON; también trae "consolidated" y "conflicts").
+    Para reanudar se pasa ese `estado` y `rows` desde la fila siguiente.
+    al_confirmar(): también tras cada commit, sin armar el estado (para que
+    quien llama escriba lo suyo en una transacción corta, fuera del tramo).
+    Sin chunk_size todo va en una sola transacción.
+    """
+    consolidar = consolidar or getattr(settings, "CARGA_MASIVA_CONSOLIDAR", "ultima")
+    if consolidar not in CONSOLIDAR_POLITICAS:
+        raise ValueError(f"Política de consolidación desconocida: {consolidar!r} (usa {' / '.join(CONSOLIDAR_POLITICAS)}).")
+    sumar = consolidar == "sumar"
+
+    estado = estado or {}
+    created_ol = estado.get("created", 0)
+    updated_ol = estado.get("updated", 0)
+    unchanged_ol = estado.get("unchanged", 0)
+    consolidated = estado.get("consolidated", 0)
+    conflicts = estado.get("conflicts", 0)
+    inicial = _caches_desde_json(estado.get("caches"))
+
+    # caches (clave normalizada -> id), compartidas entre lotes
+    cache_sector = inicial.get("sector", {})
+    cache_ubic = inicial.get("ubicacion", {})
+    cache_piso = inicial.get("piso", {})
+    cache_tl = inicial.get("tipo_lugar", {})
+    cache_lugar = inicial.get("lugar", {})
+    cache_cat = inicial.get("categoria", {})
+    cache_obj = inicial.get("objeto", {})
+    cache_tipo = inicial.get("tipo_objeto", {})
+    # (lugar_id, tipo_id) -> ya escrita; claves vistas en esta importación
+    vistas = inicial.get("consolidacion", {})
+
+    def _importar_lote(lote):
+        filas = []  # por nombres
+        por_id = []  # Excel editable
+        for numero, f in lote:
+            if f is None:
+                if clasificar:
+                    clasificar(numero, "O")
+                continue
+            f["numero"] = numero
+            (por_id if "id" in f else filas).append(f)
+
+        if not filas and not por_id:
+            return 0, 0, 0, 0, 0
+
+        # -------- Excel editable: clave directo por id, sin resolver nombres --------
+        conflictos = _claves_por_id(por_id, vistas) if por_id else []
+        if clasificar:
+            for f in conflictos:
+                clasificar(f["numero"], "X")
+
+        # -------- Sector / TipoLugar / CategoriaObjeto (independientes) --------
+        pend_sector, pend_tl, pend_cat = {}, {}, {}
+        for f in filas:
+            pend_sector.setdefault(_key(f["sector"]), {"sector": f["sector"]})
+            pend_tl.setdefault(_key(f["tipo_de_lugar"]), {"tipo_de_lugar": f["tipo_de_lugar"]})
+            pend_cat.setdefault(_key(f["categoria"]), {"nombre_de_categoria": f["categoria"]})
+        _resolver_dimension(Sector, cache_sector, pend_sector, crear=not dry_run)
+        _resolver_dimension(TipoLugar, cache_tl, pend_tl, crear=not dry_run)
+        _resolver_dimension(CategoriaObjeto, cache_cat, pend_cat, crear=not dry_run)
+
+        # -------- Ubicacion (FK a Sector) / Objeto (por nombre; categoría solo al crear) --------
+        pend_ubic, pend_obj, extra_obj = {}, {}, {}
+        for f in filas:
+            f["sector_id"] = cache_sector[_key(f["sector"])]
+            f["cat_id"] = cache_cat[_key(f["categoria"])]
+            f["ku"] = (_key(f["ubicacion"]), f["sector_id"])
+            f["ko"] = (_key(f["objeto"]), f["cat_id"])
+            pend_ubic.setdefault(f["ku"], {"ubicacion": f["ubicacion"], "sector_id": f["sector_id"]})
+            pend_obj.setdefault(f["ko"], {"nombre_del_objeto": f["objeto"]})
+            extra_obj.setdefault(f["ko"], {"objeto_categoria_id": f["cat_id"]})
+        _resolver_dimension(Ubicacion, cache_ubic, pend_ubic, crear=not dry_run)
+        _resolver_dimension(Objeto, cache_obj, pend_obj, extra_obj, crear=not dry_run)
+
+        # -------- Piso (FK a Ubicacion) / TipoObjeto (FK a Objeto) --------
+        pend_piso, pend_tipo = {}, {}
+        for f in filas:
+            ubi_id = f["ubicacion_id"] = cache_ubic[f["ku"]]
+            obj_id = cache_obj[f["ko"]]
+            f["kp"] = (f["piso"], ubi_id)
+            f["kt"] = (obj_id, _key(f["marca"]), _key(f["material"]))
+            pend_piso.setdefault(f["kp"], {"ubicacion_id": ubi_id, "piso": f["piso"]})
+            pend_tipo.setdefault(f["kt"], {"objeto_id": obj_id, "marca": f["marca"], "material": f["material"]})
+        _resolver_dimension(Piso, cache_piso, pend_piso, crear=not dry_run)
+        _resolver_dimension(TipoObjeto, cache_tipo, pend_tipo, crear=not dry_run)
+
+        # -------- Lugar (FK Piso + TipoLugar) --------
+        pend_lugar = {}
+        for f in filas:
+            piso_id = cache_piso[f["kp"]]
+            tl_id = cache_tl[_key(f["tipo_de_lugar"])]
+            f["kl"] = (_key(f["lugar"]), piso_id, tl_id)
+            pend_lugar.setdefault(f["kl"], {
+                "piso_id": piso_id,
+                "nombre_del_lugar": f["lugar"],
+                "lugar_tipo_lugar_id": tl_id,
+            })
+        _resolver_dimension(Lugar, cache_lugar, pend_lugar, crear=not dry_run)
+        for f in filas:
+            f["clave"] = (cache_lugar[f["kl"]], cache_tipo[f["kt"]])
+
+        # -------- Consolidación: una fila por (lugar, tipo de objeto) --------
+        # (en orden del archivo, juntando las de nombres y las por id)
+        if por_id:
+            filas = sorted(filas + [f for f in por_id if "clave" in f], key=lambda f: f["numero"])
+        grupos = {}  # clave -> [cantidad, estado, detalle, filas]
+        for f in filas:
+            clave = f["clave"]
+            g = grupos.get(clave)
+            if g is None:
+                grupos[clave] = [f["cantidad"], f["estado"], f["detalle"], [f]]
+                continue
+            g[0] = g[0] + f["cantidad"] if sumar else f["cantidad"]
+            g[1], g[2] = f["estado"], f["detalle"]
+            g[3].append(f)
+        repetidas = len(filas) - len(grupos) + sum(1 for k in grupos if k in vistas)
+
+        # -------- ObjetoLugar (bulk insert / bulk update) --------
+        c, u, i, clases = _upsert_objetos_lugar(
+            [(k[0], k[1], g[0], g[1], g[2]) for k, g in grupos.items()],
+            simulacion,
+            vistas,
+            sumar,
+        )
+        if clasificar:
+            for g, cambio in zip(grupos.values(), clases):
+                for f in g[3]:
+                    clasificar(f["numero"], cambio)
+        if not dry_run and (c or u):
+            # bulk_create / bulk_update no disparan señales: versión de las hojas y resumen a mano
+            cambiados = [(k, g) for (k, g), cambio in zip(grupos.items(), clases) if cambio != "I"]
+            cache_exportes.tocar_ubicaciones({g[3][0]["ubicacion_id"] for _, g in cambiados})
+            resumen_estados.recalcular_lugares({k[0] for k, _ in cambiados})
+        return c, u, i, repetidas, len(conflictos)
+
+    caches = (cache_sector, cache_ubic, cache_piso, cache_tl, cache_lugar, cache_cat, cache_obj, cache_tipo, vistas)
+
+    def _descartar_desde(marcas):
+        # saca de las caches los ids creados en un savepoint que se revirtió
+        for vista, n in zip(caches, marcas):
+            for k in list(vista)[n:]:
+                del vista[k]
+
+    def _fila_con_error(lote):
+        # reintenta fila por fila (cada una en su savepoint) para ubicar la culpable
+        for numero, r in lote:
             try:
-                cantidad = int(float(r.get("cantidad") or 0))
+                with transaction.atomic():
+                    _importar_lote([(numero, r)])
             except Exception:
-                cantidad = 0
+                return numero
+        return lote[0][0]
 
-            # mínimos
-            if not (ubicacion and sector and lugar and objeto):
-                continue
+    simulacion = {} if dry_run else None
+    fila = estado.get("fila", 0)
+    procesadas = estado.get("procesadas", fila)
 
-            # -------- Sector --------
-            ks = key(sector)
-            if ks in cache_sector:
-                sec_obj = cache_sector[ks]
-            else:
-                sec_obj, _ = Sector.objects.get_or_create(sector=sector)
-                cache_sector[ks] = sec_obj
+    def _procesar(lote):
+        nonlocal created_ol, updated_ol, unchanged_ol, consolidated, conflicts, procesadas, fila
+        marcas = [len(c) for c in caches]
+        try:
+            with transaction.atomic():
+                c, u, i, r, x = _importar_lote(lote)
+        except Exception as e:
+            _descartar_desde(marcas)
+            raise ImportacionError(str(e), _fila_con_error(lote)) from e
+        created_ol += c
+        updated_ol += u
+        unchanged_ol += i
+        consolidated += r
+        conflicts += x
+        procesadas += len(lote)
+        fila = lote[-1][0]
+        if progress:
+            progress(procesadas, created_ol, updated_ol, unchanged_ol)
+
+    def _importar_tramo(lotes):
+        # el resto del tramo se lee dentro de la transacción (no se junta en
+        # memoria), pero el primer lote antes: en SQLite una transacción que
+        # empieza leyendo puede no lograr pasar a escritura si otro escribe
+        primero = next(lotes, None)
+        if primero is None:
+            return False
+        with transaction.atomic():
+            for lote in chain([primero], lotes):
+                _procesar(lote)
+        if al_confirmar:
+            al_confirmar()
+        if checkpoint:
+            checkpoint({
+                "fila": fila,
+                "procesadas": procesadas,
+                "created": created_ol,
+                "updated": updated_ol,
+                "unchanged": unchanged_ol,
+                "consolidated": consolidated,
+                "conflicts": conflicts,
+                "caches": _caches_a_json({
+                    "sector": cache_sector,
+                    "ubicacion": cache_ubic,
+                    "piso": cache_piso,
+                    "tipo_lugar": cache_tl,
+                    "lugar": cache_lugar,
+                    "categoria": cache_cat,
+                    "objeto": cache_obj,
+                    "tipo_objeto": cache_tipo,
+                    "consolidacion": vistas,
+                }),
+            })
+        return True
 
-            # -------- Ubicacion (FK a Sector) --------
-            कु = (key(ubicacion), sec_obj.id)
-            if कु in cache_ubic:
-                ubi_obj = cache_ubic[कु]
-            else:
-                ubi_obj, _ = Ubicacion.objects.get_or_create(
-                    ubicacion=ubicacion,
-                    sector=sec_obj,
-                )
-                cache_ubic[कु] = ubi_obj
+    if chunk_size:
+        batch_size = min(batch_size, chunk_size)
+    lotes_por_tramo = chunk_size // batch_size if chunk_size else None
+    # pipeline perezoso: parser -> limpieza -> lotes de batch_size -> BD;
+    # en memoria solo queda el lote en curso (más las caches de ids)
+    numeradas = iter(rows) if numeradas else enumerate(rows, start=fila + 1)
+    numeradas = _limpiar(numeradas)
 
-            # -------- Piso (FK a Ubicacion) --------
-            piso_int = _piso_to_int(piso_raw)
-            kp = (piso_int, ubi_obj.id)
-            if kp in cache_piso:
-                piso_obj = cache_piso[kp]
-            else:
-                piso_obj, _ = Piso.objects.get_or_create(
-                    piso=piso_int,
-                    ubicacion=ubi_obj,
-                )
-                cache_piso[kp] = piso_obj
+    lotes = iter(lambda: list(islice(numeradas, batch_size)), [])
 
-            # -------- TipoLugar --------
-            ktl = key(tipo_de_lugar)
-            if ktl in cache_tl:
-                tl_obj = cache_tl[ktl]
-            else:
-                tl_obj, _ = TipoLugar.objects.get_or_create(tipo_de_lugar=tipo_de_lugar)
-                cache_tl[ktl] = tl_obj
+    if lotes_por_tramo is None:
+        with transaction.atomic():
+            for lote in lotes:
+                _procesar(lote)
+    else:
+        while _importar_tramo(islice(lotes, lotes_por_tramo)):
+            pass
+
+    return {
+        "created": created_ol,
+        "updated": updated_ol,
+        "unchanged": unchanged_ol,
+        "consolidated": consolidated,
+        "conflicts": conflicts,
+    }
 
-            # -------- Lugar (FK Piso + TipoLugar) --------
-            kl = (key(lugar), piso_obj.id, tl_obj.id)
-            if kl in cache_lugar:
-                lug_obj = cache_lugar[kl]
-            else:
-                lug_obj, _ = Lugar.objects.get_or_create(
-                    nombre_del_lugar=lugar,
-                    piso=piso_obj,
-                    lugar_tipo_lugar=tl_obj,
-                )
-                cache_lugar[kl] = lug_obj
 
-            # -------- CategoriaObjeto --------
-            kc = key(categoria)
-            if kc in cache_cat:
-                cat_obj = cache_cat[kc]
-            else:
-                cat_obj, _ = CategoriaObjeto.objects.get_or_create(
-                    nombre_de_categoria=categoria
-                )
-                cache_cat[kc] = cat_obj
+# =========================
+# Staging (filas en el servidor)
+# =========================
+CARGA_MASIVA_PAGE_SIZE = 100
+CARGA_MASIVA_TTL = timedelta(days=1) # cargas sin confirmar se borran pasado este tiempo
 
-            # -------- Objeto (FK a Categoria por defecto) --------
-            ko = (key(objeto), cat_obj.id)
-            if ko in cache_obj:
-                obj_obj = cache_obj[ko]
-            else:
-                obj_obj, _ = Objeto.objects.get_or_create(
-                    nombre_del_objeto=objeto,
-                    defaults={"objeto_categoria": cat_obj},
-                )
-                cache_obj[ko] = obj_obj
+# columnas de la previsualización (mismo orden que la tabla)
+PREVIEW_KEYS = (
+    "sector", "ubicacion", "piso", "tipo_de_lugar", "lugar",
+    "categoria", "objeto", "tipo_objeto", "cantidad", "estado", "detalle",
+)
 
-            # -------- TipoObjeto --------
-            marca, material = _split_tipo(tipo_objeto_str)
-            kt = (obj_obj.id, key(marca), key(material))
-            if kt in cache_tipo:
-                tipo_obj = cache_tipo[kt]
-            else:
-                tipo_obj, _ = TipoObjeto.objects.get_or_create(
-                    objeto=obj_obj,
-                    marca=marca,
-                    material=material,
-                )
-                cache_tipo[kt] = tipo_obj
-
-            # -------- ObjetoLugar (update_or_create) --------
-            ol_obj, created = ObjetoLugar.objects.update_or_create(
-                lugar=lug_obj,
-                tipo_de_objeto=tipo_obj,
-                defaults={
-                    "cantidad": cantidad,
-                    "estado": estado,
-                    "detalle": detalle,
-                },
+
+def _fila_preview(r):
+    """Asegura defaults mínimos para que SIEMPRE previsualice e importe."""
+    return {
+        "ubicacion": _clean_text(r.get("ubicacion")),
+        "sector": _clean_text(r.get("sector")),
+        "piso": _clean_text(r.get("piso")),
+        "tipo_de_lugar": _clean_text(r.get("tipo_de_lugar")) or "Sin especificar",
+        "lugar": _clean_text(r.get("lugar")),
+        "categoria": _clean_text(r.get("categoria")) or "Sin categoría",
+        "objeto": _clean_text(r.get("objeto")),
+        "tipo_objeto": _clean_text(r.get("tipo_objeto")),
+        "cantidad": r.get("cantidad") if r.get("cantidad") is not None else 0,
+        "estado": _clean_text(r.get("estado")),
+        "detalle": _clean_text(r.get("detalle")),
+        # Excel editable: id + huella de ObjetoLugar, solo si vienen
+        **{k: r[k] for k in ("id", "control") if r.get(k) not in (None, "")},
+    }
+
+
+def _texto_busqueda(datos):
+    return " ".join(str(datos.get(k, "")) for k in PREVIEW_KEYS).lower()
+
+
+def _stage_rows(rows, formato, nombre_archivo="", user=None):
+    """
+    Guarda las filas parseadas en CargaMasiva/CargaMasivaFila (por lotes).
+    En la misma pasada hace el diff contra ObjetoLugar (import_from_rows en
+    dry_run) y deja cada fila clasificada como nueva / cambia / igual / omitida
+    / en conflicto (Excel editable).
+
+    Nada de una transacción para todo el archivo (en SQLite retendría el lock
+    de escritura mientras se parsea): la carga se crea primero, cada lote de
+    filas se confirma en su propia transacción corta y la carga se marca
+    completa al final. Si algo falla se borra lo que alcanzó a guardarse.
+    """
+    CargaMasiva.objects.filter(creado__lt=timezone.now() - CARGA_MASIVA_TTL).delete()
+
+    carga = CargaMasiva.objects.create(
+        formato=formato,
+        nombre_archivo=(nombre_archivo or "")[:255],
+        creado_por=user if user is not None and user.is_authenticated else None,
+    )
+
+    pendientes = {}  # numero -> CargaMasivaFila aún sin guardar
+    conteo = {"N": 0, "C": 0, "I": 0, "O": 0, "X": 0}
+
+    def _filas():
+        for numero, r in enumerate(rows, start=1):
+            datos = _fila_preview(r)
+            pendientes[numero] = CargaMasivaFila(
+                carga=carga, numero=numero, datos=datos, texto=_texto_busqueda(datos),
             )
+            yield numero, datos
 
-            if created:
-                created_ol += 1
-            else:
-                updated_ol += 1
+    def _clasificar(numero, cambio):
+        pendientes[numero].cambio = cambio
+        conteo[cambio] += 1
+
+    def _guardar():
+        # después del commit de cada tramo del diff (un lote): transacción propia
+        with transaction.atomic():
+            CargaMasivaFila.objects.bulk_create(pendientes.values())
+        pendientes.clear()
+
+    try:
+        result = import_from_rows(
+            _filas(), numeradas=True, dry_run=True, clasificar=_clasificar,
+            chunk_size=IMPORT_BATCH_SIZE, al_confirmar=_guardar,
+        )
+
+        carga.total_filas = sum(conteo.values())
+        carga.nuevos = conteo["N"]
+        carga.cambios = conteo["C"]
+        carga.sin_cambios = conteo["I"]
+        carga.omitidas = conteo["O"]
+        carga.consolidadas = result["consolidated"]
+        carga.conflictos = conteo["X"]
+        carga.completa = True
+        carga.save(update_fields=[
+            "total_filas", "nuevos", "cambios", "sin_cambios", "omitidas", "consolidadas", "conflictos", "completa",
+        ])
+    except BaseException:
+        carga.delete()
+        raise
+
+    return carga
+
+
+def _aplicar_ediciones(carga, ediciones):
+    """ediciones: {"<numero>": {campo: valor}} enviadas por la previsualización."""
+    por_numero = {}
+    for numero, cambios in (ediciones or {}).items():
+        try:
+            numero = int(numero)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(cambios, dict):
+            por_numero[numero] = {k: v for k, v in cambios.items() if k in PREVIEW_KEYS}
 
-    return {"created": created_ol, "updated": updated_ol}
+    filas = []
+    for part in _chunks(por_numero):
+        for fila in carga.filas.filter(numero__in=part):
+            fila.datos = {**fila.datos, **por_numero[fila.numero]}
+            fila.texto = _texto_busqueda(fila.datos)
+            fila.cambio = ""  # el diff del archivo ya no vale para esta fila
+            filas.append(fila)
+
+    if filas:
+        CargaMasivaFila.objects.bulk_update(filas, ["datos", "texto", "cambio"], batch_size=IMPORT_BATCH_SIZE)
+    return [fila.numero for fila in filas]
+
+
+def _filas_staging(carga, desde=0, saltar=("I", "O", "X")):
+    """
+    Pares (numero, datos) de la carga posteriores a `desde`, en orden del archivo
+    y sin materializarlos todos. Salta las filas cuyo `cambio` está en `saltar`
+    (por defecto las que el diff dio como iguales, omitidas o en conflicto; las editadas
+    quedan sin clasificar y sí se importan).
+    Pagina por `numero` en vez de dejar un cursor abierto: en SQLite un SELECT
+    pendiente retiene el lock de lectura y no dejaría escribir a otros entre tramos.
+    """
+    qs = carga.filas.exclude(cambio__in=saltar).order_by("numero")
+    while True:
+        pagina = list(qs.filter(numero__gt=desde).values_list("numero", "datos")[:IMPORT_BATCH_SIZE])
+        if not pagina:
+            return
+        yield from pagina
+        desde = pagina[-1][0]
 
 
 # =========================
 # Vista
 # =========================
-@require_http_methods(["GET", "POST"])
+@csrf_exempt
 def carga_masiva(request):
+    # la subida va SIEMPRE a un archivo temporal (no a RAM, aunque sea chica):
+    # el parser la lee desde disco en streaming. Los upload_handlers se cambian
+    # antes de que el CSRF lea request.POST, por eso el csrf_protect va adentro.
+    request.upload_handlers = [TemporaryFileUploadHandler(request)]
+    return _carga_masiva(request)
+
+
+@csrf_protect
+@require_http_methods(["GET", "POST"])
+def _carga_masiva(request):
     # GET -> pantalla upload
     if request.method == "GET":
         return render(request, "excel/carga_masiva.html", {"step": "upload"})
 
-    # POST (guardar)
-    if request.POST.get("payload_json"):
+    # POST (guardar): token de la carga + solo las filas editadas -> trabajo en segundo plano
+    if request.POST.get("token"):
+        carga = get_object_or_404(CargaMasiva, token=request.POST["token"], completa=True)
         try:
-            raw = json.loads(request.POST["payload_json"])
-            rows = raw.get("objetos_lugar", [])
-            result = import_from_rows(rows)
-            messages.success(
+            ediciones = json.loads(request.POST.get("ediciones_json") or "{}")
+            with transaction.atomic():
+                editadas = _aplicar_ediciones(carga, ediciones)
+                trabajo = encolar_importacion(carga, request.user, min(editadas, default=None))
+            return render(
                 request,
-                f"Importación OK. Creados: {result['created']} | Actualizados: {result['updated']}"
+                "excel/carga_masiva.html",
+                {"step": "importando", "trabajo": trabajo, "carga": carga},
             )
-            return redirect("carga_masiva")
         except Exception as e:
             return render(
                 request,
@@ -3417,8 +4368,9 @@ def carga_masiva(request):
                 {
                     "step": "preview",
                     "error": str(e),
-                    "payload": raw if isinstance(raw, dict) else {"objetos_lugar": []},
-                    "detected": "manual",
+                    "carga": carga,
+                    "detected": carga.formato,
+                    "page_size": CARGA_MASIVA_PAGE_SIZE,
                 },
             )
 
@@ -3428,37 +4380,25 @@ def carga_masiva(request):
         return render(
             request,
             "excel/carga_masiva.html",
-            {"step": "upload", "error": "Selecciona un archivo Excel (.xlsx)."},
+            {"step": "upload", "error": "Selecciona un archivo Excel (.xlsx), CSV/TSV o un .zip."},
         )
 
     try:
-        rows, detected = parse_excel(file_obj)
-
-        # Asegurar defaults mínimos para que SIEMPRE previsualice e importe
-        normalized_rows = []
-        for r in rows:
-            normalized_rows.append(
-                {
-                    "ubicacion": _clean_text(r.get("ubicacion")),
-                    "sector": _clean_text(r.get("sector")),
-                    "piso": _clean_text(r.get("piso")),
-                    "tipo_de_lugar": _clean_text(r.get("tipo_de_lugar")) or "Sin especificar",
-                    "lugar": _clean_text(r.get("lugar")),
-                    "categoria": _clean_text(r.get("categoria")) or "Sin categoría",
-                    "objeto": _clean_text(r.get("objeto")),
-                    "tipo_objeto": _clean_text(r.get("tipo_objeto")),
-                    "cantidad": r.get("cantidad") if r.get("cantidad") is not None else 0,
-                    "estado": _clean_text(r.get("estado")),
-                    "detalle": _clean_text(r.get("detalle")),
-                }
-            )
-
-        payload = {"objetos_lugar": normalized_rows}
+        detected, rows = iter_carga_masiva(file_obj)
+        carga = _stage_rows(rows, detected, file_obj.name, request.user)
+        if not carga.total_filas:
+            carga.delete()
+            raise ValueError(ERROR_FORMATO_EXCEL)
 
         return render(
             request,
             "excel/carga_masiva.html",
-            {"step": "preview", "payload": payload, "detected": detected},
+            {
+                "step": "preview",
+                "carga": carga,
+                "detected": detected,
+                "page_size": CARGA_MASIVA_PAGE_SIZE,
+            },
         )
 
     except Exception as e:
@@ -3469,6 +4409,72 @@ def carga_masiva(request):
         )
 
 
+@require_GET
+def carga_masiva_filas(request, token):
+    """
+    Página de filas de una carga en staging (para la previsualización).
+    GET: ?page=<n>&q=<texto>&cambio=<N|C|I|O>
+    """
+    carga = get_object_or_404(CargaMasiva, token=token, completa=True)
+
+    qs = carga.filas.order_by("numero")
+    total = carga.total_filas
+
+    q = (request.GET.get("q") or "").strip().lower()
+    cambio = request.GET.get("cambio") or ""
+    if cambio not in dict(CargaMasivaFila.CAMBIO):
+        cambio = ""
+    if q:
+        qs = qs.filter(texto__contains=q)
+    if cambio:
+        qs = qs.filter(cambio=cambio)
+    filtradas = qs.count() if (q or cambio) else total
+
+    pages = max(1, -(-filtradas // CARGA_MASIVA_PAGE_SIZE))
+    try:
+        page = min(max(int(request.GET.get("page") or 1), 1), pages)
+    except ValueError:
+        page = 1
+
+    start = (page - 1) * CARGA_MASIVA_PAGE_SIZE
+    filas = [
+        {"numero": numero, "cambio": clase, **datos}
+        for numero, clase, datos in qs.values_list("numero", "cambio", "datos")[start:start + CARGA_MASIVA_PAGE_SIZE]
+    ]
+
+    return JsonResponse({
+        "total": total,
+        "filtradas": filtradas,
+        "page": page,
+        "pages": pages,
+        "filas": filas,
+    })
+
+
+@login_required
+@require_GET
+def carga_masiva_trabajo(request, trabajo_id):
+    """Estado/avance de un TrabajoImportacion (polling desde la carga masiva)."""
+    trabajo = get_object_or_404(TrabajoImportacion, pk=trabajo_id)
+    return JsonResponse(progreso_importacion(trabajo))
+
+
+@require_GET
+def carga_masiva_reanudar(request, token):
+    """Vuelve a la previsualización de una carga cuyo trabajo falló."""
+    carga = get_object_or_404(CargaMasiva, token=token, completa=True)
+    return render(
+        request,
+        "excel/carga_masiva.html",
+        {
+            "step": "preview",
+            "carga": carga,
+            "detected": carga.formato,
+            "page_size": CARGA_MASIVA_PAGE_SIZE,
+        },
+    )
+
+
 @login_required
 
 def descargar_plantilla_carga_masiva(request):
@@ -3596,16 +4602,12 @@ def _geom_within_parent(child_geom, parent_geom):
 def mapa_lugar_editar_geom(request, lugar_id):
     l = get_object_or_404(Lugar.objects.select_related("piso__ubicacion__sector"), pk=lugar_id)
 
-    sectores = Sector.objects.order_by("sector")
-    ubicaciones = Ubicacion.objects.select_related("sector").order_by("sector__sector", "ubicacion")
-
+    # los combos del editor solo se muestran en modo "crear" (ver mapa_editor_crear)
     return render(
         request,
         "mapa/mapa_editor.html",
         {
             "modo": "editar",
-            "sectores": sectores,
-            "ubicaciones": ubicaciones,
             "editar_tipo": "lugar",
             "editar_id": l.id,
             "obj_label": f"Lugar: {l.nombre_del_lugar}",